@@ -1,16 +1,273 @@
 """
 An AI player for Othello.
 """
+import json
 import math
+import os
+import queue
 import random
 import sys
+import threading
 import time
-from heapq import heappush, heappop
 
 # You can use the functions in othello_shared to write your AI
-from othello_shared import find_lines, get_possible_moves, get_score, play_move
+from othello_shared import get_possible_moves, get_score, board_from_string
+from othello_bitboard import (geometry, from_board, get_moves, get_flips,
+                              iter_squares, popcount)
+from othello_tt import EXACT, LOWER, UPPER, TranspositionTable, zobrist
+from othello_endgame import solve_root
+from othello_book import OpeningBook
+from othello_symmetry import symmetries
+from othello_features import mobilities
+import othello_eval
+from othello_patterns import PatternEvaluator
+from othello_probcut import ProbCut
+from othello_stats import SearchStats, summary
 
-caching_states = {}
+# Fraction of the per-move time budget a timed search may use. The rest is
+# left for pipe I/O and the game manager's own timer.
+TIME_SAFETY = 0.8
+
+# Default number of empty squares at which run_ai starts to solve the game
+# exactly, and for win/loss/draw only (see othello_endgame.py)
+ENDGAME_EMPTIES = 10
+WLD_EMPTIES = 12
+
+# Half-widths of the successive aspiration windows of a PVS iterative
+# deepening search, in discs. After the last one the window is unbounded.
+ASPIRATION_WINDOWS = (4, 16)
+
+# With node ordering, nodes with at least this much depth left order their
+# moves by the mobility they leave the opponent. That costs a move
+# generation per child, which only pays off for large subtrees; nodes
+# closer to the leaves use the history and square value ordering.
+MOBILITY_DEPTH = 5
+
+# Transposition table keys of searches with an evaluator are XORed with
+# this, so that they never meet the exact values stored by the endgame
+# solver, which may be on another scale.
+EVALUATOR_KEY = 0x5DEECE66D
+
+# Opening book run_ai uses unless the handshake names another one (see
+# othello_book.py). It is optional.
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "othello_book.bin")
+
+# Pattern weights for eval=patterns unless the handshake names another file
+# (see othello_patterns.py)
+DEFAULT_PATTERNS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "othello_patterns.bin")
+
+# Seconds between the INFO lines of a search with progress reports, when
+# the root search finds nothing new
+PROGRESS_INTERVAL = 0.5
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the deadline of a timed search has passed.
+    """
+    pass
+
+
+class StopFlag(object):
+    """
+    Stops a search running in another thread, the way a shared
+    multiprocessing value does for another process.
+    """
+    value = 0
+
+
+class SearchContext(object):
+    """
+    Search state that is kept for a whole game instead of a single move: the
+    transposition table (which replaces the old unbounded caching_states
+    dict), the killer moves and history scores, and the position the last search expects to see
+    at our next move. Also holds the settings of the search in progress.
+    """
+
+    def __init__(self, table = None, megabytes = 64):
+        if table is None:
+            table = TranspositionTable(megabytes)
+        self.tt = table
+        self.killers = [] # per ply, the last two moves that caused a beta cutoff
+        self.history = [None, [], []] # per player and square, how often the move caused a cutoff
+        self.deadline = None # time.perf_counter() deadline of a timed search
+        self.stop_flag = None # shared flag another process can set to stop the search
+        self.root_discs = 0
+        self.symmetry = None # transforms that map the root onto itself, if there are any
+        self.expected_key = None # hash of the position predicted for our next move
+        self.expected_depth = 0 # depth to which that position was already searched
+        self.expected_move = None # the best square found there by pondering, if any
+        self.expected_position = None # that position as (own, opp), for pondering
+        self.evaluator = None # othello_eval or a PatternEvaluator; None scores positions by disc difference
+        self.track = None # the evaluator, if it follows the moves of the search
+        self.probcut = None # Multi-ProbCut checks for a selective search, or None for full width
+        self.stats = None # SearchStats the search counts its nodes in, or None (see othello_stats.py)
+        self.progress = None # called with (depth, best square, value, completed) when the root search starts, finds a better move or completes an iteration
+
+        # Settings of the search in progress, set by begin()
+        self.geo = None
+        self.caching = 0
+        self.ordering = 0
+        self.pvs = 0
+
+    def begin(self, own, opp, key, geo, caching, ordering, pvs = 0):
+        """
+        Start a search from a new root. Returns the depth to which the root
+        was already searched if the previous search predicted this position
+        (its subtree is still in the transposition table), and 0 otherwise.
+        """
+        self.geo = geo
+        self.caching = caching
+        self.ordering = ordering
+        self.pvs = pvs
+        discs = popcount(own | opp)
+        resumed = 0
+        if key == self.expected_key:
+            resumed = self.expected_depth
+        # Killer moves are kept by ply. Shift them so that they still refer
+        # to the same moment in the game.
+        played = discs - self.root_discs
+        if 0 < played < len(self.killers):
+            self.killers = self.killers[played:]
+        elif played != 0:
+            self.killers = []
+        self.root_discs = discs
+        # History scores fade, so that recent cutoffs count the most
+        for player in (1, 2):
+            if len(self.history[player]) == geo.size:
+                self.history[player] = [h >> 1 for h in self.history[player]]
+            else:
+                self.history[player] = [0] * geo.size
+        self.symmetry = symmetries(geo.dim).invariant(own, opp) or None
+        self.expected_key = None
+        self.expected_depth = 0
+        self.expected_move = None
+        self.expected_position = None
+        # Positions with fewer discs than the root can never occur again, so
+        # their entries are the first to be replaced.
+        self.tt.new_search(discs)
+        return resumed
+
+    def new_game(self, clear_table = True):
+        """
+        Forget the last game: the entries of the transposition table (unless
+        clear_table is false), the killer moves and history scores and the
+        predicted position. The table keeps its size.
+        """
+        if clear_table:
+            self.tt.clear()
+        self.killers = []
+        self.history = [None, [], []]
+        self.root_discs = 0
+        self.symmetry = None
+        self.expected_key = None
+        self.expected_depth = 0
+        self.expected_move = None
+        self.expected_position = None
+
+    def set_evaluator(self, evaluator):
+        """
+        Score positions with evaluator (see othello_eval.py and
+        othello_patterns.py) instead of by disc difference. Evaluators that
+        keep their own state up to date as moves are made and unmade are
+        told about every move of the search.
+        """
+        self.evaluator = evaluator
+        self.track = evaluator if getattr(evaluator, "incremental", False) else None
+
+    def check_deadline(self):
+        """
+        Raise SearchTimeout if the deadline has passed or the stop flag is set.
+        """
+        if time.perf_counter() > self.deadline or (self.stop_flag is not None and self.stop_flag.value):
+            raise SearchTimeout
+
+    def table_key(self, own, opp, player, key):
+        """
+        Return (key, t): the key under which the position is stored in the
+        transposition table, and the transform from the position to the
+        stored one. If the root is symmetric, every position in its tree has
+        mirror images there too, and all of them are stored once, in their
+        canonical form. Otherwise positions are stored as they are.
+        """
+        if self.evaluator is not None:
+            key ^= EVALUATOR_KEY
+        if self.symmetry is None:
+            return key, 0
+        dim = self.geo.dim
+        own, opp, t = symmetries(dim).canonical(own, opp, self.symmetry)
+        if player == 1:
+            key = zobrist(dim).hash(own, opp, 1)
+        else:
+            key = zobrist(dim).hash(opp, own, 2)
+        if self.evaluator is not None:
+            key ^= EVALUATOR_KEY
+        return key, t
+
+    def from_table(self, move, t):
+        """
+        Map a move stored in the transposition table back to the position.
+        """
+        if t == 0 or move is None:
+            return move
+        return symmetries(self.geo.dim).restore(move, t)
+
+    def to_table(self, move, t):
+        if t == 0 or move is None:
+            return move
+        return symmetries(self.geo.dim).square(move, t)
+
+    def distinct(self, order):
+        """
+        Drop the moves that a symmetry of the root maps onto a move earlier
+        in order: they lead to mirror images of the same position.
+        """
+        if self.symmetry is None:
+            return order
+        sym = symmetries(self.geo.dim)
+        seen = set()
+        result = []
+        for sq in order:
+            if sq not in seen:
+                result.append(sq)
+                seen.update(sym.square(sq, t) for t in self.symmetry)
+        return result
+
+    def killers_at(self, ply):
+        killers = self.killers
+        while len(killers) <= ply:
+            killers.append([None, None])
+        return killers[ply]
+
+    def expect(self, own, opp, color, key, best_move, depth):
+        """
+        After a search to depth that chose best_move, remember the position
+        that follows it and the reply the transposition table predicts.
+        """
+        geo = self.geo
+        z = zobrist(geo.dim)
+        flips = get_flips(own, opp, best_move, geo)
+        change = flips | (1 << best_move)
+        own, opp = opp & ~change, own | change
+        key = z.update(key, color, best_move, flips)
+        tt_key, t = self.table_key(own, opp, 3 - color, key)
+        entry = self.tt.probe(tt_key)
+        if entry is None or entry[4] is None:
+            return
+        reply = self.from_table(entry[4], t)
+        if not (get_moves(own, opp, geo) >> reply) & 1:
+            return
+        flips = get_flips(own, opp, reply, geo)
+        change = flips | (1 << reply)
+        self.expected_key = z.update(key, 3 - color, reply, flips)
+        self.expected_depth = max(depth - 2, 0)
+        self.expected_move = None
+        self.expected_position = (opp & ~change, own | change)
+
+
+# Context of the searches started through the functions below when no other
+# context is given, for example by the autograder
+_context = SearchContext()
 
 def eprint(*args, **kwargs): #you can use this for debugging, as it will print to sterr and not stdout
     print(*args, file=sys.stderr, **kwargs)
@@ -56,90 +313,122 @@ def compute_heuristic(board, color): #not implemented, optional
         return diff2
 
 
+############ SEARCH HELPERS ########################
+def _root(board, player):
+    """
+    Convert a board to the (own, opp, key, geometry) tuple the searches work
+    on, seen from the point of view of player.
+    """
+    geo = geometry(len(board))
+    dark, light = from_board(board)
+    key = zobrist(geo.dim).hash(dark, light, player)
+    if player == 1:
+        return dark, light, key, geo
+    return light, dark, key, geo
+
+
+def _depth(limit, own, opp, geo):
+    """
+    Translate the depth limit used by the game manager into a search depth.
+    A negative limit means no limit: every move fills a square, so searching
+    as deep as there are empty squares reaches the end of the game.
+    """
+    if limit < 0:
+        return geo.size - popcount(own | opp)
+    return limit
+
+
+def _move(sq, geo):
+    if sq is None:
+        return None
+    return geo.coords[sq]
+
+
+def _order(own, opp, moves, geo):
+    """
+    Order moves by the disc difference they produce, best first.
+    """
+    scored = []
+    for sq in iter_squares(moves):
+        change = get_flips(own, opp, sq, geo) | (1 << sq)
+        scored.append((popcount(opp & ~change) - popcount(own | change), sq))
+    scored.sort() # stable on the square, so ties keep the usual move order
+    return [sq for _, sq in scored]
+
+
 ############ MINIMAX ###############################
-def minimax_min_node(board, color, limit, caching = 0):
-    if color == 1:
-        min_p = 2
-    else:
-        min_p = 1
+def _minimax(ctx, own, opp, player, key, depth, ply):
+    """
+    Minimax in negamax form: returns (best square, value) for the player to
+    move, whose discs are own.
+    """
+    stats = ctx.stats
+    if stats is not None:
+        stats.node(ply)
+    if ctx.caching and depth > 0:
+        tt_key, t = ctx.table_key(own, opp, player, key)
+        entry = ctx.tt.probe(tt_key)
+        if stats is not None:
+            stats.probes += 1
+            stats.hits += entry is not None
+        if entry is not None and entry[1] >= depth and entry[2] == EXACT:
+            if stats is not None:
+                stats.tt_cutoffs += 1
+            return ctx.from_table(entry[4], t), entry[3]
 
+    if depth == 0:
+        if stats is not None:
+            stats.leaves += 1
+        return None, popcount(own) - popcount(opp)
+    geo = ctx.geo
+    moves = get_moves(own, opp, geo)
+    if not moves:
+        if stats is not None:
+            stats.leaves += 1
+        return None, popcount(own) - popcount(opp)
+
+    z = zobrist(geo.dim)
     best_move = None
-    moves = get_possible_moves(board, min_p)
-    value = math.inf
-
-    if not moves or limit == 0:
-        return best_move, compute_utility(board, color)
-    for m in moves:
-        b = play_move(board, min_p, m[0], m[1])
-        if caching == 1:
-            if b in caching_states:
-                nxt_val = caching_states[b]
-                if value > nxt_val:
-                    best_move, value = m, nxt_val
-            else:
-                if limit > 0:
-                    nxt_move, nxt_val = minimax_max_node(b, color, limit - 1,
-                                                           caching)
-                    if value > nxt_val:
-                        best_move, value = m, nxt_val
-                    caching_states[b] = value
-                else:
-                    nxt_move, nxt_val = minimax_max_node(b, color, limit,
-                                                           caching)
-                    if value > nxt_val:
-                        best_move, value = m, nxt_val
-                    caching_states[b] = value
-                    best_move = m
+    value = -math.inf
+    for sq in iter_squares(moves):
+        flips = get_flips(own, opp, sq, geo)
+        change = flips | (1 << sq)
+        if depth == 1:
+            if stats is not None:
+                stats.node(ply + 1)
+                stats.leaves += 1
+            nxt_val = popcount(opp & ~change) - popcount(own | change)
         else:
-            if limit > 0:
-                nxt_move, nxt_val = minimax_max_node(b, color, limit - 1,
-                                                       caching)
-            else:
-                nxt_move, nxt_val = minimax_max_node(b, color, limit, caching)
-            if value > nxt_val:
-                best_move, value = m, nxt_val
+            nxt_move, nxt_val = _minimax(ctx, opp & ~change, own | change, 3 - player,
+                                         z.update(key, player, sq, flips),
+                                         depth - 1, ply + 1)
+        if value < -nxt_val:
+            best_move, value = sq, -nxt_val
+    if ctx.caching:
+        ctx.tt.store(tt_key, depth, EXACT, value, ctx.to_table(best_move, t), ctx.root_discs + ply)
+        if stats is not None:
+            stats.stores += 1
     return best_move, value
 
 
-def minimax_max_node(board, color, limit, caching = 0): #returns highest possible utility
-    best_move = None
-    moves = get_possible_moves(board, color)
-    value = -math.inf
+def minimax_min_node(board, color, limit, caching = 0):
+    min_p = 3 - color
+    own, opp, key, geo = _root(board, min_p)
+    _context.begin(own, opp, key, geo, caching, 0)
+    sq, value = _minimax(_context, own, opp, min_p, key,
+                         _depth(limit, own, opp, geo), 0)
+    return _move(sq, geo), -value
 
-    if not moves or limit == 0:
-        return best_move, compute_utility(board, color)
-    for m in moves:
-        b = play_move(board, color, m[0], m[1])
-        if caching == 1:
-            if b in caching_states:
-                nxt_val = caching_states[b]
-                if value < nxt_val:
-                    best_move, value = m, nxt_val
-            else:
-                if limit > 0:
-                    nxt_move, nxt_val = minimax_min_node(b, color, limit - 1,
-                                                           caching)
-                    if value < nxt_val:
-                        best_move, value = m, nxt_val
-                    caching_states[b] = value
-                else:
-                    nxt_move, nxt_val = minimax_min_node(b, color, limit,
-                                                           caching)
-                    if value < nxt_val:
-                        best_move, value = m, nxt_val
-                    caching_states[b] = value
-        else:
-            if limit > 0:
-                nxt_move, nxt_val = minimax_min_node(b, color, limit - 1,
-                                                       caching)
-            else:
-                nxt_move, nxt_val = minimax_min_node(b, color, limit, caching)
-            if value < nxt_val:
-                best_move, value = m, nxt_val
-    return best_move, value
+
+def minimax_max_node(board, color, limit, caching = 0): #returns highest possible utility
+    own, opp, key, geo = _root(board, color)
+    _context.begin(own, opp, key, geo, caching, 0)
+    sq, value = _minimax(_context, own, opp, color, key,
+                         _depth(limit, own, opp, geo), 0)
+    return _move(sq, geo), value
 
 
-def select_move_minimax(board, color, limit, caching = 0):
+def select_move_minimax(board, color, limit, caching = 0, context = None):
     """
     Given a board and a player color, decide on a move.
     The return value is a tuple of integers (i,j), where
@@ -151,168 +440,297 @@ def select_move_minimax(board, color, limit, caching = 0):
     value (see compute_utility)
     If caching is ON (i.e. 1), use state caching to reduce the number of state evaluations.
     If caching is OFF (i.e. 0), do NOT use state caching to reduce the number of state evaluations.
+    The search uses the given SearchContext, or a module-wide one.
     """
-    best_move = None
-    moves = get_possible_moves(board, color)
-    value = -math.inf
+    ctx = context or _context
+    own, opp, key, geo = _root(board, color)
+    depth = max(_depth(limit, own, opp, geo), 1)
+    moves = get_moves(own, opp, geo)
 
     if not moves:
-        return best_move
+        return None
 
-    for m in moves:
-        b = play_move(board, color, m[0], m[1])
-        if caching == 1:
-            if b in caching_states:
-                nxt_val = caching_states[b]
-            else:
-                if limit > 0:
-                    nxt_move, nxt_val = minimax_min_node(b, color, limit - 1, caching)
-                    caching_states[b] = nxt_val
-                else:
-                    nxt_move, nxt_val = minimax_min_node(b, color, limit, caching)
-                    caching_states[b] = nxt_val
-        else:
-            if limit > 0:
-                nxt_move, nxt_val = minimax_min_node(b, color, limit - 1, caching)
-            else:
-                nxt_move, nxt_val = minimax_min_node(b, color, limit, caching)
-        if value < nxt_val:
-            best_move, value = m, nxt_val
-    return best_move
+    ctx.begin(own, opp, key, geo, caching, 0)
+    if ctx.stats is not None:
+        ctx.stats.node(0)
+    z = zobrist(geo.dim)
+    best_move = None
+    value = -math.inf
+    for sq in ctx.distinct(list(iter_squares(moves))):
+        flips = get_flips(own, opp, sq, geo)
+        change = flips | (1 << sq)
+        nxt_move, nxt_val = _minimax(ctx, opp & ~change, own | change, 3 - color,
+                                     z.update(key, color, sq, flips),
+                                     depth - 1, 1)
+        if value < -nxt_val:
+            best_move, value = sq, -nxt_val
+    if ctx.stats is not None:
+        ctx.stats.iteration(depth)
+    return _move(best_move, geo)
 
 
 ############ ALPHA-BETA PRUNING #####################
-def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
-    if color == 1:
-        min_p = 2
+def _children(ctx, own, opp, player, moves, hash_move, depth, ply):
+    """
+    Yield (square, flips) for the moves of a node in search order: the
+    hash move, then, if ordering is on, the killer moves and the other
+    moves. Far from the leaves those are ordered by the number of replies
+    they leave the opponent, fewest first; elsewhere by history score and
+    then by square value (see Geometry.square_values). Each stage is only
+    prepared once the stages before it have been searched without a
+    cutoff, and flips are only computed for moves that are searched.
+    """
+    geo = ctx.geo
+    if hash_move is not None and (moves >> hash_move) & 1:
+        yield hash_move, get_flips(own, opp, hash_move, geo)
+        moves &= ~(1 << hash_move)
+    if ctx.ordering != 1:
+        for sq in iter_squares(moves):
+            yield sq, get_flips(own, opp, sq, geo)
+        return
+    # Moves that caused a cutoff elsewhere at this ply
+    for killer in ctx.killers_at(ply):
+        if killer is not None and (moves >> killer) & 1:
+            yield killer, get_flips(own, opp, killer, geo)
+            moves &= ~(1 << killer)
+    values = geo.square_values
+    if depth >= MOBILITY_DEPTH:
+        squares = list(iter_squares(moves))
+        flips = [get_flips(own, opp, sq, geo) for sq in squares]
+        children = [(opp & ~(f | (1 << sq)), own | f | (1 << sq)) for sq, f in zip(squares, flips)]
+        scored = sorted(zip(mobilities(children, geo), [-values[sq] for sq in squares], squares, flips))
+        # the square breaks ties, so they keep the usual move order
+        for _, _, sq, flips in scored:
+            yield sq, flips
+        return
+    history = ctx.history[player]
+    for sq in sorted(iter_squares(moves), key=lambda sq: (-history[sq], -values[sq])):
+        yield sq, get_flips(own, opp, sq, geo)
+
+
+def _cutoff(ctx, player, sq, depth, ply):
+    """
+    Record a move that caused a beta cutoff for the move ordering.
+    """
+    if ctx.ordering == 1:
+        killers = ctx.killers_at(ply)
+        if killers[0] != sq:
+            killers[1] = killers[0]
+            killers[0] = sq
+        ctx.history[player][sq] += depth * depth
+
+
+def _leaf_values(ctx, own, opp, player, moves, children):
+    """
+    Yield (square, value) for the children of a node, which are leaves, as
+    ctx.evaluator scores them for the opponent. A tracking evaluator scores
+    them one at a time from its state. Otherwise the first move is
+    evaluated on its own, since at most nodes where any move causes a
+    cutoff the first one does. If it does not and many moves are left, the
+    node probably has to evaluate them all, and they are evaluated in one
+    batch. Otherwise they are evaluated one at a time, so that a later
+    cutoff still saves work.
+    """
+    stats = ctx.stats
+    if ctx.track is not None:
+        leaf = ctx.track.leaf
+        for sq, flips in children:
+            if stats is not None:
+                stats.leaves += 1
+            yield sq, leaf(sq, flips, player)
+        return
+    geo = ctx.geo
+    evaluator = ctx.evaluator
+    evaluate = evaluator.evaluate
+    sq, flips = next(children)
+    change = flips | (1 << sq)
+    if stats is not None:
+        stats.leaves += 1
+    yield sq, evaluate(opp & ~change, own | change, geo)
+    if popcount(moves) > othello_eval.BATCH_MIN:
+        rest = list(children)
+        values = evaluator.evaluate_batch([opp & ~(flips | (1 << sq)) for sq, flips in rest],
+                                          [own | flips | (1 << sq) for sq, flips in rest], geo)
+        if stats is not None:
+            stats.leaves += len(rest)
+        for (sq, flips), value in zip(rest, values):
+            yield sq, value
     else:
-        min_p = 1
+        for sq, flips in children:
+            if stats is not None:
+                stats.leaves += 1
+            yield sq, evaluate(opp & ~(flips | (1 << sq)), own | flips | (1 << sq), geo)
 
+
+def _frontier(ctx, own, opp, player, moves, hash_move, beta, ply):
+    """
+    The move loop of _alphabeta for a node whose children are leaves, when
+    an evaluator scores them (see _leaf_values).
+    """
+    stats = ctx.stats
     best_move = None
-    moves = get_possible_moves(board, min_p)
-    value = math.inf
-
-    if not moves or limit == 0:
-        return best_move, compute_utility(board, color)
-    states_list = []
-    states = []
-    move = []
-    for m in moves:
-        b = play_move(board, min_p, m[0], m[1])
-        if ordering == 1:
-            utl = compute_utility(b, color)
-            heappush(states_list, (utl, b, m))
-        else:
-            states.append(b)
-            move.append(m)
-    if ordering == 1:
-        while states_list:
-            s = heappop(states_list)
-            states.append(s[1])
-            move.append(s[2])
-    for i in range(len(states)):
-        if caching == 1:
-            if states[i] in caching_states:
-                nxt_val = caching_states[states[i]]
-                if value > nxt_val:
-                    best_move, value = move[i], nxt_val
-            else:
-                if limit > 0:
-                    nxt_move, nxt_val = alphabeta_max_node(states[i], color,
-                                                           alpha, beta,
-                                                           limit - 1,
-                                                           caching)
-                    if value > nxt_val:
-                        best_move, value = move[i], nxt_val
-                    caching_states[states[i]] = value
-                else:
-                    nxt_move, nxt_val = alphabeta_max_node(states[i], color,
-                                                           alpha, beta,
-                                                           limit, caching)
-                    if value > nxt_val:
-                        best_move, value = move[i], nxt_val
-                    caching_states[states[i]] = value
-        else:
-            if limit > 0:
-                nxt_move, nxt_val = alphabeta_max_node(states[i], color,
-                                                       alpha, beta,
-                                                       limit - 1, caching)
-            else:
-                nxt_move, nxt_val = alphabeta_max_node(states[i], color,
-                                                       alpha, beta, limit,
-                                                       caching)
-            if value > nxt_val:
-                best_move, value = move[i], nxt_val
-        if value <= alpha:
-            return best_move, value
-        beta = min(beta, value)
+    value = -math.inf
+    children = _children(ctx, own, opp, player, moves, hash_move, 1, ply)
+    for index, (sq, nxt_val) in enumerate(_leaf_values(ctx, own, opp, player, moves, children)):
+        if stats is not None:
+            stats.node(ply + 1)
+        if value < -nxt_val:
+            best_move, value = sq, -nxt_val
+            if value >= beta:
+                _cutoff(ctx, player, sq, 1, ply)
+                if stats is not None:
+                    stats.cutoff(index)
+                break
     return best_move, value
 
 
-def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
+def _alphabeta(ctx, own, opp, player, key, alpha, beta, depth, ply):
+    """
+    Alpha-beta in negamax form: returns (best square, value) for the player
+    to move, whose discs are own. The value is exact if it lies strictly
+    between alpha and beta, otherwise it is a bound in the direction of the
+    cutoff. If ctx.pvs is set, every move after the first is searched with
+    a null window and only re-searched if it fails high (PVS). If
+    ctx.evaluator is set, it scores the positions at the depth limit (see
+    _frontier).
+    """
+    if depth > 1 and ctx.deadline is not None:
+        ctx.check_deadline()
+    stats = ctx.stats
+    if stats is not None:
+        stats.node(ply)
+
+    hash_move = None
+    if ctx.caching and depth > 0:
+        tt_key, t = ctx.table_key(own, opp, player, key)
+        entry = ctx.tt.probe(tt_key)
+        if stats is not None:
+            stats.probes += 1
+            stats.hits += entry is not None
+        if entry is not None:
+            if entry[1] >= depth:
+                bound, v = entry[2], entry[3]
+                if (bound == EXACT or (bound == LOWER and v >= beta)
+                        or (bound == UPPER and v <= alpha)):
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return ctx.from_table(entry[4], t), v
+            hash_move = ctx.from_table(entry[4], t)
+
+    geo = ctx.geo
+    if depth == 0:
+        if stats is not None:
+            stats.leaves += 1
+        if ctx.track is not None:
+            return None, ctx.track.value(player)
+        if ctx.evaluator is not None:
+            return None, ctx.evaluator.evaluate(own, opp, geo)
+        return None, popcount(own) - popcount(opp)
+    moves = get_moves(own, opp, geo)
+    if not moves:
+        if stats is not None:
+            stats.leaves += 1
+        if ctx.evaluator is not None:
+            return None, ctx.evaluator.final(own, opp)
+        return None, popcount(own) - popcount(opp)
+    if ctx.probcut is not None:
+        cut = _probcut(ctx, own, opp, player, key, alpha, beta, depth, ply)
+        if cut is not None:
+            if stats is not None:
+                stats.probcuts += 1
+            return None, cut
+
+    z = zobrist(geo.dim)
+    alpha_orig = alpha
     best_move = None
-    moves = get_possible_moves(board, color)
     value = -math.inf
-
-    if not moves or limit == 0:
-        return best_move, compute_utility(board, color)
-    states_list = []
-    states = []
-    move = []
-    for m in moves:
-        b = play_move(board, color, m[0], m[1])
-        if ordering == 1:
-            utl = compute_utility(b, color)
-            heappush(states_list, (-utl, b, m))
-        else:
-            states.append(b)
-            move.append(m)
-    if ordering == 1:
-        while states_list:
-            s = heappop(states_list)
-            states.append(s[1])
-            move.append(s[2])
-    for i in range(len(states)):
-        if caching == 1:
-            if states[i] in caching_states:
-                nxt_val = caching_states[states[i]]
-                if value < nxt_val:
-                    best_move, value = move[i], nxt_val
+    if depth == 1 and ctx.evaluator is not None:
+        best_move, value = _frontier(ctx, own, opp, player, moves, hash_move, beta, ply)
+    else:
+        track = ctx.track
+        for index, (sq, flips) in enumerate(_children(ctx, own, opp, player, moves, hash_move, depth, ply)):
+            change = flips | (1 << sq)
+            if depth == 1:
+                # The child is a leaf: evaluate it here rather than in a call
+                if stats is not None:
+                    stats.node(ply + 1)
+                    stats.leaves += 1
+                nxt_val = popcount(opp & ~change) - popcount(own | change)
             else:
-                if limit > 0:
-                    nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                           alpha, beta,
-                                                           limit - 1,
-                                                           caching)
-                    if value < nxt_val:
-                        best_move, value = move[i], nxt_val
-                    caching_states[states[i]] = value
+                if track is not None:
+                    track.make(sq, flips, player)
+                child = (opp & ~change, own | change, 3 - player, z.update(key, player, sq, flips))
+                if ctx.pvs and best_move is not None:
+                    # Null window: only prove that the move is no better than alpha
+                    nxt_move, nxt_val = _alphabeta(ctx, *child, -alpha - 1, -alpha, depth - 1, ply + 1)
+                    if alpha < -nxt_val < beta:
+                        nxt_move, nxt_val = _alphabeta(ctx, *child, -beta, -alpha, depth - 1, ply + 1)
                 else:
-                    nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                           alpha, beta,
-                                                           limit, caching)
-                    if value < nxt_val:
-                        best_move, value = move[i], nxt_val
-                    caching_states[states[i]] = value
-        else:
-            if limit > 0:
-                nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                       alpha, beta,
-                                                       limit - 1, caching)
-            else:
-                nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                       alpha, beta, limit,
-                                                       caching)
+                    nxt_move, nxt_val = _alphabeta(ctx, *child, -beta, -alpha, depth - 1, ply + 1)
+                if track is not None:
+                    track.unmake()
+            if value < -nxt_val:
+                best_move, value = sq, -nxt_val
+            if value >= beta:
+                _cutoff(ctx, player, sq, depth, ply)
+                if stats is not None:
+                    stats.cutoff(index)
+                break
+            alpha = max(alpha, value)
 
-            if value < nxt_val:
-                best_move, value = move[i], nxt_val
-        if value >= beta:
-            return best_move, value
-        alpha = max(alpha, value)
+    if ctx.caching:
+        if value <= alpha_orig:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        ctx.tt.store(tt_key, depth, bound, value, ctx.to_table(best_move, t), ctx.root_discs + ply)
+        if stats is not None:
+            stats.stores += 1
     return best_move, value
 
 
-def select_move_alphabeta(board, color, limit, caching = 0, ordering = 0):
+def _probcut(ctx, own, opp, player, key, alpha, beta, depth, ply):
+    """
+    Multi-ProbCut (see othello_probcut.py): returns beta if shallow searches
+    show that a search to depth would very likely fail high, alpha if it
+    would very likely fail low, and None if it has to be searched.
+    """
+    discs = ctx.root_discs + ply
+    if depth >= ctx.geo.size - discs:
+        return None # the search reaches the end of the game
+    for shallow, a, b, margin in ctx.probcut.checks(depth, discs):
+        if beta < math.inf:
+            bound = math.ceil((beta + margin - b) / a)
+            if _alphabeta(ctx, own, opp, player, key, bound - 1, bound, shallow, ply)[1] >= bound:
+                return beta
+        if alpha > -math.inf:
+            bound = math.floor((alpha - margin - b) / a)
+            if _alphabeta(ctx, own, opp, player, key, bound, bound + 1, shallow, ply)[1] <= bound:
+                return alpha
+    return None
+
+
+def alphabeta_min_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
+    min_p = 3 - color
+    own, opp, key, geo = _root(board, min_p)
+    _context.begin(own, opp, key, geo, caching, ordering)
+    sq, value = _alphabeta(_context, own, opp, min_p, key, -beta, -alpha,
+                           _depth(limit, own, opp, geo), 0)
+    return _move(sq, geo), -value
+
+
+def alphabeta_max_node(board, color, alpha, beta, limit, caching = 0, ordering = 0):
+    own, opp, key, geo = _root(board, color)
+    _context.begin(own, opp, key, geo, caching, ordering)
+    sq, value = _alphabeta(_context, own, opp, color, key, alpha, beta,
+                           _depth(limit, own, opp, geo), 0)
+    return _move(sq, geo), value
+
+
+def select_move_alphabeta(board, color, limit, caching = 0, ordering = 0, context = None,
+                          endgame = 0, wld = 0, pvs = 0):
     """
     Given a board and a player color, decide on a move.
     The return value is a tuple of integers (i,j), where
@@ -326,116 +744,776 @@ def select_move_alphabeta(board, color, limit, caching = 0, ordering = 0):
     If caching is OFF (i.e. 0), do NOT use state caching to reduce the number of state evaluations.
     If ordering is ON (i.e. 1), use node ordering to expedite pruning and reduce the number of state evaluations.
     If ordering is OFF (i.e. 0), do NOT use node ordering to expedite pruning and reduce the number of state evaluations.
+    With at most endgame (or wld) empty squares left, the game is solved
+    to the end regardless of the depth limit (see _solve).
+    If pvs is 1, principal variation search replaces plain alpha-beta; it
+    selects the same moves, with fewer state evaluations.
+    The search uses the given SearchContext, or a module-wide one.
     """
-    value = -math.inf
-    beta = math.inf
-    best_move = None
-    moves = get_possible_moves(board, color)
+    ctx = context or _context
+    own, opp, key, geo = _root(board, color)
+    depth = max(_depth(limit, own, opp, geo), 1)
+    moves = get_moves(own, opp, geo)
 
     if not moves:
+        return None
+
+    ctx.begin(own, opp, key, geo, caching, ordering, pvs)
+    if ordering == 1:
+        order = _order(own, opp, moves, geo)
+    else:
+        order = list(iter_squares(moves))
+    best_move = _solve(ctx, own, opp, color, key, order, endgame, wld)
+    if best_move is not None:
+        depth = geo.size - popcount(own | opp)
+    else:
+        best_move, value = _root_search(ctx, own, opp, color, key, order, depth)
+        if ctx.progress is not None:
+            ctx.progress(depth, best_move, value, True)
+    if ctx.stats is not None:
+        ctx.stats.iteration(depth)
+    if caching == 1:
+        ctx.expect(own, opp, color, key, best_move, depth)
+    return _move(best_move, geo)
+
+
+def _solve(ctx, own, opp, color, key, order, endgame, wld):
+    """
+    Solve the game from the root if at most wld empty squares are left:
+    first for win, loss or draw, then, with at most endgame empty squares,
+    for the exact final score. The win/loss/draw result narrows the window
+    of the exact search. Returns the best square, or None if there are too
+    many empty squares. If the exact search runs out of time the move of
+    the win/loss/draw search is kept.
+    """
+    empties = ctx.geo.size - popcount(own | opp)
+    if empties > max(endgame, wld):
+        return None
+    best_move, value = solve_root(ctx, own, opp, color, key, order, -1, 1)
+    if empties > endgame or value == 0:
         return best_move
-    states_list = []
-    states = []
-    move = []
-    for m in moves:
-        b = play_move(board, color, m[0], m[1])
-        if ordering == 1:
-            utl = compute_utility(b, color)
-            heappush(states_list, (-utl, b, m))
+    order = [best_move] + [sq for sq in order if sq != best_move]
+    if value > 0:
+        alpha, beta = 0, math.inf
+    else:
+        alpha, beta = -math.inf, 0
+    try:
+        best_move, value = solve_root(ctx, own, opp, color, key, order, alpha, beta)
+    except SearchTimeout:
+        pass
+    return best_move
+
+
+def _root_search(ctx, own, opp, color, key, order, depth, alpha = -math.inf, beta = math.inf):
+    """
+    Search the root moves in the given order and return (best square, value).
+    Of several equally good moves the one searched first wins, so moves
+    leading to mirror images of a position searched before are skipped.
+    With a window narrower than (-inf, inf) the value is a bound if it does
+    not lie strictly inside it, and the square is then unreliable.
+    """
+    geo = ctx.geo
+    z = zobrist(geo.dim)
+    value = -math.inf
+    best_move = None
+    track = ctx.track
+    if track is not None:
+        # A search that timed out may have left moves made
+        track.reset(own, opp, color)
+    if ctx.stats is not None:
+        ctx.stats.node(0)
+    if ctx.progress is not None:
+        ctx.progress(depth, None, None, False)
+    for sq in ctx.distinct(order):
+        flips = get_flips(own, opp, sq, geo)
+        change = flips | (1 << sq)
+        child = (opp & ~change, own | change, 3 - color, z.update(key, color, sq, flips))
+        if track is not None:
+            track.make(sq, flips, color)
+        low = max(alpha, value)
+        if ctx.pvs and best_move is not None:
+            # A later move only replaces the best one if it is strictly
+            # better, which a null window around the best value decides
+            nxt_move, nxt_val = _alphabeta(ctx, *child, -low - 1, -low, depth - 1, 1)
+            if low < -nxt_val < beta:
+                nxt_move, nxt_val = _alphabeta(ctx, *child, -beta, -low, depth - 1, 1)
         else:
-            states.append(b)
-            move.append(m)
-    if ordering == 1:
-        while states_list:
-            s = heappop(states_list)
-            states.append(s[1])
-            move.append(s[2])
-    for i in range(len(states)):
-        if caching == 1:
-            if states[i] in caching_states:
-                nxt_val = caching_states[states[i]]
-            else:
-                if limit > 0:
-                    nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                           value, beta,
-                                                           limit - 1,
-                                                           caching)
-                    caching_states[states[i]] = nxt_val
-                else:
-                    nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                           value, beta,
-                                                           limit, caching)
-                    caching_states[states[i]] = nxt_val
+            nxt_move, nxt_val = _alphabeta(ctx, *child, -beta, -low, depth - 1, 1)
+        if track is not None:
+            track.unmake()
+        if value < -nxt_val:
+            best_move, value = sq, -nxt_val
+            if ctx.progress is not None:
+                ctx.progress(depth, best_move, value, False)
+            if value >= beta:
+                break
+    return best_move, value
+
+
+def _aspiration(ctx, own, opp, color, key, order, depth, guess):
+    """
+    Root search with an aspiration window around guess, the value of the
+    previous iteration. A narrow window prunes more; if the value falls
+    outside it, the search is repeated with the next wider window on that
+    side (see ASPIRATION_WINDOWS) until it lies inside.
+    """
+    lower = upper = 0
+    while True:
+        alpha = guess - ASPIRATION_WINDOWS[lower] if lower < len(ASPIRATION_WINDOWS) else -math.inf
+        beta = guess + ASPIRATION_WINDOWS[upper] if upper < len(ASPIRATION_WINDOWS) else math.inf
+        best_move, value = _root_search(ctx, own, opp, color, key, order, depth, alpha, beta)
+        if value <= alpha:
+            lower += 1
+        elif value >= beta:
+            upper += 1
         else:
-            if limit > 0:
-                nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                       value, beta,
-                                                       limit - 1, caching)
-            else:
-                nxt_move, nxt_val = alphabeta_min_node(states[i], color,
-                                                       value, beta, limit,
-                                                       caching)
-        if value < nxt_val:
-            best_move, value = move[i], nxt_val
-    return best_move
+            return best_move, value
+
+
+def _iterate(ctx, own, opp, color, key, order, max_depth, first = 1):
+    """
+    Iterative deepening from depth first up to max_depth. Yields
+    (depth, best square, value) after every completed iteration and moves
+    the best square to the front of order, which it changes in place. With
+    ctx.pvs set, each iteration after the first uses an aspiration window.
+    """
+    value = None
+    for depth in range(first, max_depth + 1):
+        if ctx.pvs and value is not None:
+            best_move, value = _aspiration(ctx, own, opp, color, key, order, depth, value)
+        else:
+            best_move, value = _root_search(ctx, own, opp, color, key, order, depth)
+        order.remove(best_move)
+        order.insert(0, best_move)
+        if ctx.stats is not None:
+            ctx.stats.iteration(depth)
+        if ctx.progress is not None:
+            ctx.progress(depth, best_move, value, True)
+        yield depth, best_move, value
+
+
+def _max_depth(own, opp, geo, limit):
+    """
+    The deepest iteration worth running: the end of the game, or the depth
+    limit if one is set.
+    """
+    max_depth = geo.size - popcount(own | opp)
+    if limit > 0:
+        max_depth = min(max_depth, limit)
+    return max(max_depth, 1)
+
+
+def _root_order(ctx, own, opp, key, moves):
+    """
+    Root move order for an iterative deepening search: by disc difference
+    if ordering is on, with the move the transposition table already holds
+    for the root (for example from the previous search) first.
+    """
+    if ctx.ordering == 1:
+        order = _order(own, opp, moves, ctx.geo)
+    else:
+        order = list(iter_squares(moves))
+    entry = ctx.tt.probe(key ^ EVALUATOR_KEY if ctx.evaluator is not None else key)
+    if entry is not None and entry[4] is not None and entry[4] in order:
+        order.remove(entry[4])
+        order.insert(0, entry[4])
+    return order
+
+
+def select_move_timed(board, color, time_limit, limit = -1, ordering = 0, context = None,
+                      endgame = 0, wld = 0, pvs = 0):
+    """
+    Iterative deepening alpha-beta with a wall-clock budget of time_limit
+    seconds. Searches to depth 1, 2, 3, ... (up to limit, if it is positive)
+    and returns the best move of the last iteration that completed.
+
+    The transposition table is always used: it carries the principal
+    variation of each iteration over to the next, where the hash moves are
+    searched first. At the root the previous best move is searched first.
+    If the previous search of the context predicted this position, the
+    iterations it already covered are quick, as their results are still in
+    the table, and the best move pondering found there is searched first,
+    and played unless the iterations get deeper than pondering did. Near
+    the end of the game the position is solved instead, as in
+    select_move_alphabeta, falling back to the iterative deepening if that
+    takes too long. With pvs set the iterations use principal variation
+    search and aspiration windows.
+    """
+    ctx = context or _context
+    start = time.perf_counter()
+    allowed = time_limit * TIME_SAFETY
+
+    own, opp, key, geo = _root(board, color)
+    moves = get_moves(own, opp, geo)
+
+    if not moves:
+        return None
+
+    pondered = ctx.expected_move if key == ctx.expected_key else None
+    resumed = ctx.begin(own, opp, key, geo, 1, ordering, pvs)
+    max_depth = _max_depth(own, opp, geo, limit)
+    order = _root_order(ctx, own, opp, key, moves)
+    if pondered is not None and pondered in order:
+        order.remove(pondered)
+        order.insert(0, pondered)
+    ctx.deadline = start + allowed
+    try:
+        best_move = _solve(ctx, own, opp, color, key, order, endgame, wld)
+    except SearchTimeout:
+        # Out of time: if no iteration below completes either, the first
+        # move of order is played
+        best_move = None
+    if best_move is not None:
+        ctx.deadline = None
+        if ctx.stats is not None:
+            ctx.stats.iteration(geo.size - popcount(own | opp))
+        ctx.expect(own, opp, color, key, best_move, geo.size - popcount(own | opp))
+        return _move(best_move, geo)
+
+    best_move = order[0]
+    completed = 0
+    try:
+        # Start from depth 1 even if the position was searched before: an
+        # iteration at the depth reached then is not sure to complete again
+        # in time, and the shallower ones cost little with the table warm.
+        for completed, best_move, value in _iterate(ctx, own, opp, color, key, order, max_depth):
+            # The next iteration takes several times as long as this one, so
+            # do not start it unless most of the budget is still left.
+            if time.perf_counter() - start > allowed / 2:
+                break
+    except SearchTimeout:
+        pass
+    finally:
+        ctx.deadline = None
+    if pondered is not None and completed < resumed:
+        # Pondering searched this position deeper than there was time for
+        best_move = pondered
+        completed = resumed
+    if completed:
+        ctx.expect(own, opp, color, key, best_move, completed)
+    return _move(best_move, geo)
 
 ####################################################
-def run_ai():
+class Engine(object):
     """
-    This function establishes communication with the game manager.
-    It first introduces itself and receives its color.
-    Then it repeatedly receives the current score and current board state
-    until the game is over.
+    Move selection for one game, set up from the options the game manager
+    sends in its handshake. run_ai drives an Engine over stdin/stdout, and
+    othello_game.InProcessPlayer calls it directly.
     """
-    print("Terminator") # First line is the name of this AI
-    arguments = input().split(",")
 
-    color = int(arguments[0]) #Player color: 1 for dark (goes first), 2 for light.
-    limit = int(arguments[1]) #Depth limit
-    minimax = int(arguments[2]) #Minimax or alpha beta
-    caching = int(arguments[3]) #Caching
-    ordering = int(arguments[4]) #Node-ordering (for alpha-beta only)
+    name = "Terminator"
+
+    def __init__(self, color, limit = -1, minimax = 0, caching = 0, ordering = 0, options = None):
+        options = options or {}
+        self.settings = (limit, minimax, caching, ordering, dict(options)) #everything but the color, to tell whether a new game can reuse this Engine
+        self.color = color #Player color: 1 for dark (goes first), 2 for light.
+        self.limit = limit #Depth limit
+        self.minimax = minimax #Minimax or alpha beta
+        self.caching = caching #Caching
+        self.ordering = ordering #Node-ordering (for alpha-beta only)
+        self.time_limit = float(options.get("time", 0)) #Seconds per move; 0 means search to the depth limit
+        self.workers = int(options.get("workers", 1)) #Processes for the parallel search
+        self.parallel = options.get("parallel", "root") #Parallel search mode: root splitting or Lazy SMP
+        self.ponder = int(options.get("ponder", 0)) #Search on the opponent's time
+        self.endgame = int(options.get("endgame", ENDGAME_EMPTIES)) #Empty squares left when the game is solved exactly
+        self.wld = int(options.get("wld", max(WLD_EMPTIES, self.endgame))) #Empty squares left when the game is solved for win/loss/draw
+        self.pvs = int(options.get("pvs", 0)) #Principal variation search instead of plain alpha-beta
+        self.evaluation = options.get("eval", "discs") #Evaluation: discs, heuristic (othello_eval) or patterns (othello_patterns)
+        self.patterns = options.get("patterns", DEFAULT_PATTERNS) #Pattern weight file for eval=patterns
+        self.probcut = options.get("probcut", "none") #Multi-ProbCut parameter file (othello_probcut.py); "none" for full-width search
+        self.stats = options.get("stats", "none") #Search statistics per move: "none", "stderr" or a JSONL file to append them to
+        self.progress = int(options.get("progress", 0)) #Report the progress of each search in INFO lines and stop it on STOP (see run_ai)
+
+        self.context = SearchContext() #transposition table and other state kept for the whole game
+        self.evaluator = None
+        if (self.evaluation == "heuristic"):
+            self.evaluator = othello_eval
+        elif (self.evaluation == "patterns" and os.path.exists(self.patterns)):
+            self.evaluator = PatternEvaluator.load(self.patterns)
+        self.probcut_params = None
+        if (self.probcut != "none" and os.path.exists(self.probcut)):
+            self.probcut_params = ProbCut.load(self.probcut)
+        self._set_up_evaluation()
+        self.stats_file = None
+        if (self.stats != "none"):
+            self.context.stats = SearchStats()
+            if (self.stats != "stderr"):
+                self.stats_file = open(self.stats, "a")
+        self.stop_request = StopFlag() #set by run_ai when the game manager asks for the move right away
+        self.output_lock = threading.Lock() #INFO lines come from two threads
+        self.searching = False
+        if (self.progress == 1):
+            if (self.context.stats is None): #the INFO lines count the nodes
+                self.context.stats = SearchStats()
+            self.context.progress = self._progress
+        self.ponder_thread = None
+        self.pondered = None #(key, completed depth, best square) of the last ponder search
+        self.search = None
+        if (minimax == 0 and self.workers > 1): #the worker processes live for the whole game
+            from othello_parallel import ParallelSearch
+            self.search = ParallelSearch(self.workers, self.parallel)
+        self.book = None
+        book = options.get("book", DEFAULT_BOOK) #Opening book file; "none" for no book
+        if (book != "none" and os.path.exists(book)):
+            self.book = OpeningBook(book)
+
+    @staticmethod
+    def parse_handshake(line):
+        """
+        Split the handshake line into color, depth limit, minimax, caching
+        and ordering, and a dict of the optional name=value extras.
+        """
+        arguments = line.strip().split(",")
+        options = dict(arg.split("=", 1) for arg in arguments[5:])
+        return (int(arguments[0]), int(arguments[1]), int(arguments[2]),
+                int(arguments[3]), int(arguments[4]), options)
+
+    @classmethod
+    def from_handshake(cls, line):
+        """
+        Create an Engine from the handshake line (see parse_handshake).
+        """
+        return cls(*cls.parse_handshake(line))
+
+    def describe(self):
+        if (self.minimax == 1): eprint("Running MINIMAX")
+        elif (self.pvs == 1): eprint("Running PVS")
+        else: eprint("Running ALPHA-BETA")
+
+        if (self.caching == 1): eprint("State Caching is ON")
+        else: eprint("State Caching is OFF")
+
+        if (self.ordering == 1): eprint("Node Ordering is ON")
+        else: eprint("Node Ordering is OFF")
+
+        if (self.limit == -1): eprint("Depth Limit is OFF")
+        else: eprint("Depth Limit is ", self.limit)
+
+        if (self.time_limit > 0): eprint("Time Limit is ", self.time_limit, "seconds per move")
+
+        if (self.workers > 1): eprint("Parallel Search is ON:", self.workers, "workers,", self.parallel, "mode")
+
+        if (self.ponder == 1): eprint("Pondering is ON")
+
+        if (self.evaluation == "heuristic"):
+            if (othello_eval.numpy is None): eprint("Heuristic Evaluation is ON (NumPy not found: positions are evaluated one at a time)")
+            else: eprint("Heuristic Evaluation is ON")
+        elif (self.evaluation == "patterns"):
+            if (self.context.evaluator is None): eprint("Pattern weights not found:", self.patterns, "- evaluating by disc difference")
+            else: eprint("Pattern Evaluation is ON:", self.patterns)
+
+        if (self.probcut != "none"):
+            if (self.probcut_params is None): eprint("ProbCut parameters not found:", self.probcut, "- searching full width")
+            elif (self.context.probcut is None): eprint("The ProbCut parameters are for", self.probcut_params.evaluation, "evaluation - searching full width")
+            else: eprint("Multi-ProbCut is ON:", self.probcut)
+
+        if (self.book is not None): eprint("Opening Book is ON:", len(self.book), "positions")
+
+        if (self.stats != "none"): eprint("Search Statistics are ON:", self.stats)
+
+        if (self.minimax == 0 and self.wld > 0): eprint("Endgame Solver is ON: exact with", self.endgame, "empty squares left, win/loss/draw with", self.wld)
+
+        if (self.minimax == 1 and self.ordering == 1): eprint("Node Ordering should have no impact on Minimax")
+        if (self.minimax == 1 and self.time_limit > 0): eprint("The Time Limit only applies to Alpha-beta")
+        if (self.minimax == 1 and self.workers > 1): eprint("Parallel Search only applies to Alpha-beta")
+        if (self.pvs == 1 and self.search is not None): eprint("PVS does not apply to Parallel Search")
+        if (self.evaluation != "discs" and (self.minimax == 1 or self.search is not None)): eprint("Heuristic and Pattern Evaluation only apply to sequential Alpha-beta")
+        if (self.ponder == 1 and (self.minimax == 1 or self.search is not None)): eprint("Pondering only applies to sequential Alpha-beta")
+        if (self.context.probcut is not None and (self.minimax == 1 or self.search is not None)): eprint("Multi-ProbCut only applies to sequential Alpha-beta")
+        if (self.ponder == 1 and self.caching == 0 and self.time_limit <= 0): eprint("Pondering needs caching or a time limit")
+        if (self.stats != "none" and self.search is not None): eprint("Search Statistics do not count the nodes of Parallel Search workers")
+        if (self.progress == 1 and (self.minimax == 1 or self.search is not None)): eprint("Progress reports and STOP only apply to sequential Alpha-beta")
+
+    def select_move(self, board):
+        self._stop_pondering()
+        self._check_evaluator(board)
+        pondered = None # the statistics of the ponder search, in case its move is played
+        if self.context.stats is not None:
+            if self.pondered is not None:
+                pondered = self.context.stats.record()
+            self.context.stats.reset()
+        move = self._book_move(board)
+        searched = move is None
+        if move is None:
+            move = self._pondered_move(board)
+            if move is None:
+                pondered = None
+        if move is None:
+            if (self.progress == 1):
+                move = self._select_move_reporting(board)
+            else:
+                move = self._select_move(board)
+        if (searched and self.stats != "none"):
+            self._report_stats(board, move, pondered)
+        self._start_pondering()
+        return move
+
+    def end_game(self):
+        """
+        Called when the game is over. The Engine may play another game
+        after new_game, so everything it loaded stays open until close().
+        """
+        self._stop_pondering()
+        self.pondered = None
+
+    def new_game(self, color):
+        """
+        Get ready for a new game as color, with the same settings. Whatever
+        the last game left behind (transposition table entries, killer
+        moves and history scores, the pondering prediction, a STOP) is
+        forgotten, so the game is played as by a new Engine. The evaluator,
+        the opening book, the ProbCut parameters, the parallel search
+        workers and the memory of the transposition table are kept.
+        """
+        self.end_game()
+        self.color = color
+        self.context.new_game()
+        self._set_up_evaluation()
+        if self.search is not None:
+            self.search.new_game()
+        self.stop_request.value = 0
+
+    def _set_up_evaluation(self):
+        # _check_evaluator turns them off on boards they were not fitted
+        # for; the next game may be played on another board
+        self.context.set_evaluator(self.evaluator)
+        self.context.probcut = None
+        if (self.probcut_params is not None and self.probcut_params.evaluation == self._evaluation()):
+            self.context.probcut = self.probcut_params
+
+    def stop(self):
+        """
+        Stop the search in progress and play the best move found so far
+        (only with progress=1). Safe to call from another thread.
+        """
+        self.stop_request.value = 1
 
-    if (minimax == 1): eprint("Running MINIMAX")
-    else: eprint("Running ALPHA-BETA")
+    def _select_move_reporting(self, board):
+        """
+        _select_move, with INFO lines on stdout about the search as it goes
+        (see _info) and stop() ending it early. A search to a fixed depth
+        that is stopped plays the best move the root search had found, or
+        the first legal move if it had not finished a single one.
+        """
+        ctx = self.context
+        ctx.stop_flag = self.stop_request
+        ctx.deadline = math.inf # only the stop flag ends the search, unless it has a time limit
+        self.best_so_far = None
+        self.progress_state = (0, None, None, False)
+        self.progress_start = time.perf_counter()
+        done = threading.Event()
+        reporter = threading.Thread(target=self._report_progress, args=(done,))
+        reporter.daemon = True
+        self.searching = True
+        self._info()
+        reporter.start()
+        try:
+            move = self._select_move(board)
+        except SearchTimeout:
+            move = self.best_so_far or get_possible_moves(board, self.color)[0]
+        finally:
+            self.searching = False
+            done.set()
+            reporter.join()
+            ctx.stop_flag = None
+            ctx.deadline = None
+        return move
 
-    if (caching == 1): eprint("State Caching is ON")
-    else: eprint("State Caching is OFF")
+    def _progress(self, depth, sq, value, completed):
+        """
+        Called by the root search of our own move (not while pondering).
+        """
+        if not self.searching:
+            return
+        if sq is None: # a new root search: the best move so far stays
+            self.progress_state = (depth,) + self.progress_state[1:3] + (False,)
+            return
+        self.best_so_far = _move(sq, self.context.geo)
+        self.progress_state = (depth, self.best_so_far, value, completed)
+        self._info()
 
-    if (ordering == 1): eprint("Node Ordering is ON")
-    else: eprint("Node Ordering is OFF")
+    def _report_progress(self, done):
+        while not done.wait(PROGRESS_INTERVAL):
+            self._info()
 
-    if (limit == -1): eprint("Depth Limit is OFF")
-    else: eprint("Depth Limit is ", limit)
+    def _info(self):
+        """
+        Write the progress of the search as one line on stdout:
+        INFO depth=<d> completed=<0|1> nodes=<n> time=<s> move=<i>,<j> value=<v>
+        where depth is the depth being searched (or completed), and move and
+        value are those of the best move found so far, from our point of
+        view. move and value are left out until there is a best move.
+        """
+        depth, move, value, completed = self.progress_state
+        line = "INFO depth={} completed={} nodes={} time={:.2f}".format(
+            depth, int(completed), self.context.stats.total(), time.perf_counter() - self.progress_start)
+        if move is not None:
+            line += " move={},{} value={}".format(move[0], move[1], value)
+        with self.output_lock:
+            if self.searching:
+                print(line, flush=True)
 
-    if (minimax == 1 and ordering == 1): eprint("Node Ordering should have no impact on Minimax")
+    def _report_stats(self, board, move, pondered = None):
+        """
+        Write the statistics of the search for move to stderr or the file.
+        If the move is that of the ponder search, pondered is the record of
+        its statistics, and the move's own search counted nothing.
+        """
+        record = pondered or self.context.stats.record()
+        record["color"] = self.color
+        record["empties"] = sum(row.count(0) for row in board)
+        record["move"] = move
+        record["ponder_hit"] = pondered is not None
+        if (self.stats_file is None):
+            eprint("Search statistics for", move, "with", record["empties"], "empty squares"
+                   + (" (found while pondering):" if pondered is not None else ":"))
+            for line in summary(record):
+                eprint(line)
+        else:
+            self.stats_file.write(json.dumps(record) + "\n")
+            self.stats_file.flush()
+
+    def _check_evaluator(self, board):
+        """
+        Pattern weights and ProbCut parameters are fitted for one board
+        dimension. On other boards positions are evaluated by disc
+        difference, and searched full width.
+        """
+        evaluator = self.context.evaluator
+        if (isinstance(evaluator, PatternEvaluator) and evaluator.geo.dim != len(board)):
+            eprint("The pattern weights are for", evaluator.geo.dim, "x", evaluator.geo.dim,
+                   "boards - evaluating by disc difference")
+            self.context.set_evaluator(None)
+        probcut = self.context.probcut
+        if (probcut is not None and (probcut.dim != len(board) or probcut.evaluation != self._evaluation())):
+            eprint("The ProbCut parameters are for", probcut.dim, "x", probcut.dim, probcut.evaluation,
+                   "searches - searching full width")
+            self.context.probcut = None
+
+    def _evaluation(self):
+        """
+        The name of the evaluation in use, as othello_probcut.py records it.
+        """
+        evaluator = self.context.evaluator
+        if (evaluator is None): return "discs"
+        if (isinstance(evaluator, PatternEvaluator)): return "patterns"
+        return "heuristic"
+
+    def _book_move(self, board):
+        if self.book is None:
+            return None
+        move = self.book.lookup(board, self.color)
+        if move is not None:
+            # Nothing was searched, so there is no prediction to ponder on
+            self.context.expected_position = None
+            self.pondered = None
+        return move
+
+    def _select_move(self, board):
+        if (self.minimax == 1): #run this if the minimax flag is given
+            return select_move_minimax(board, self.color, self.limit, self.caching, self.context)
+        elif (self.search is not None and not self._solvable(board)): #parallel alphabeta
+            return self.search.select_move(board, self.color, self.limit, self.time_limit,
+                                           self.caching, self.ordering)
+        elif (self.time_limit > 0): #iterative deepening alphabeta within the time limit
+            return select_move_timed(board, self.color, self.time_limit, self.limit, self.ordering,
+                                     self.context, self.endgame, self.wld, self.pvs)
+        else: #else run alphabeta
+            return select_move_alphabeta(board, self.color, self.limit, self.caching, self.ordering,
+                                         self.context, self.endgame, self.wld, self.pvs)
+
+    def _solvable(self, board):
+        """
+        Whether the endgame solver takes over (it always runs in this process).
+        """
+        empties = sum(row.count(0) for row in board)
+        return empties <= max(self.endgame, self.wld)
+
+    def _start_pondering(self):
+        """
+        Search the position the last search predicts for our next move in a
+        background thread, while the opponent is thinking.
+        """
+        ctx = self.context
+        if (self.ponder == 0 or self.minimax == 1 or self.search is not None
+                or ctx.expected_position is None):
+            return
+        own, opp = ctx.expected_position
+        key = ctx.expected_key
+        ctx.stop_flag = StopFlag()
+        self.pondered = (key, 0, None)
+        if ctx.stats is not None: # count the ponder search on its own
+            ctx.stats.reset()
+        self.ponder_thread = threading.Thread(target=self._ponder, args=(own, opp, key))
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def _ponder(self, own, opp, key):
+        ctx = self.context
+        geo = ctx.geo
+        ctx.begin(own, opp, key, geo, 1, self.ordering, self.pvs)
+        max_depth = _max_depth(own, opp, geo, self.limit)
+        order = _root_order(ctx, own, opp, key, get_moves(own, opp, geo))
+        if not order:
+            return
+        ctx.deadline = math.inf # only the stop flag ends the search
+        try:
+            # From depth 1, as in select_move_timed: the table is warm
+            for depth, best_move, value in _iterate(ctx, own, opp, self.color, key, order, max_depth):
+                self.pondered = (key, depth, best_move)
+        except SearchTimeout:
+            pass
+        finally:
+            ctx.deadline = None
+        # If the opponent plays the predicted move, the next search carries
+        # on from the iterations completed here, with their best move.
+        ctx.expected_key = key
+        ctx.expected_depth = self.pondered[1]
+        ctx.expected_move = self.pondered[2]
+
+    def _stop_pondering(self):
+        if self.ponder_thread is not None:
+            self.context.stop_flag.value = 1
+            self.ponder_thread.join()
+            self.ponder_thread = None
+            self.context.stop_flag = None
+
+    def _pondered_move(self, board):
+        """
+        If the opponent played the move pondering predicted and the ponder
+        search already went as deep as this move needs, return its best
+        move. Otherwise the normal search runs, with the table the ponder
+        search filled; a timed search starts with its best move.
+        """
+        if self.pondered is None:
+            return None
+        key, depth, best_move = self.pondered
+        self.pondered = None
+        own, opp, root_key, geo = _root(board, self.color)
+        if root_key != key or depth == 0:
+            return None
+        if self.time_limit > 0:
+            needed = _max_depth(own, opp, geo, self.limit)
+        else:
+            needed = max(_depth(self.limit, own, opp, geo), 1)
+        if depth < needed:
+            return None
+        return _move(best_move, geo)
+
+    def close(self):
+        """
+        Called when the Engine will not play again.
+        """
+        self._stop_pondering()
+        if self.search is not None:
+            self.search.close()
+            self.search = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.stats_file is not None:
+            self.stats_file.close()
+            self.stats_file = None
+
+
+def _read_commands(current):
+    """
+    Read the lines of the game manager on a thread of their own, so that a
+    STOP line reaches the engine while it searches. current() is the
+    engine of the game in play. Returns a function that returns the other
+    lines one at a time, like input().
+    """
+    lines = queue.Queue()
+
+    def read():
+        for line in sys.stdin:
+            if line.strip() == "STOP":
+                current().stop()
+                continue
+            if line.startswith("SCORE"):
+                # A STOP that came too late for the previous move must not
+                # stop this one
+                current().stop_request.value = 0
+            lines.put(line.rstrip("\n"))
+        lines.put(None)
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+
+    def next_line():
+        line = lines.get()
+        if line is None:
+            raise EOFError
+        return line
+    return next_line
+
+
+def run_ai():
+    """
+    This function establishes communication with the game manager.
+    It first introduces itself and receives its color.
+    Then it repeatedly receives the current score and current board state
+    until the game is over.
+    With progress=1 in the handshake, the AI writes INFO lines about its
+    search (see Engine._info) before each move, and a STOP line from the
+    game manager while it searches makes it play the best move found so far.
+    After FINAL, a game manager that keeps its AIs warm between games (see
+    AiProcessPool in othello_game.py) sends NEWGAME: the AI introduces
+    itself again and reads the handshake of the next game. With the same
+    settings it keeps its Engine (see Engine.new_game), with others it
+    starts a new one. The AI exits when the game manager closes its stdin.
+    """
+    print(Engine.name, flush=True) # First line is the name of this AI
+    engine = Engine.from_handshake(input())
+    engine.describe()
+    read = input
+    if (engine.progress == 1):
+        read = _read_commands(lambda: engine)
 
     while True: # This is the main loop
         # Read in the current game status, for example:
         # "SCORE 2 2" or "FINAL 33 31" if the game is over.
         # The first number is the score for player 1 (dark), the second for player 2 (light)
-        next_input = input()
+        # or "NEWGAME" once it is over, to play another one.
+        try:
+            next_input = read()
+            if next_input.strip() == "NEWGAME":
+                print(Engine.name, flush=True)
+                line = read()
+        except EOFError: # the game manager is done with this AI
+            engine.close()
+            return
+        if next_input.strip() == "NEWGAME":
+            color, limit, minimax, caching, ordering, options = Engine.parse_handshake(line)
+            if ((limit, minimax, caching, ordering, options) == engine.settings):
+                engine.new_game(color)
+            else:
+                engine.close()
+                engine = Engine.from_handshake(line)
+            engine.describe()
+            if (engine.progress == 1 and read is input):
+                read = _read_commands(lambda: engine)
+            continue
         status, dark_score_s, light_score_s = next_input.strip().split()
         dark_score = int(dark_score_s)
         light_score = int(light_score_s)
 
         if status == "FINAL": # Game is over.
-            print("FINAL {} {}".format(dark_score, light_score))
+            engine.end_game()
+            print("FINAL {} {}".format(dark_score, light_score), flush=True)
         else:
-            board = eval(input()) # Read in the input and turn it into a Python
-                                  # object. The format is a list of rows. The
-                                  # squares in each row are represented by
+            board = board_from_string(read()) # The board is a list of rows, sent
+                                  # either as str(board) or in the compact
+                                  # format of othello_shared.board_to_string.
+                                  # The squares in each row are represented by
                                   # 0 : empty square
                                   # 1 : dark disk (player 1)
                                   # 2 : light disk (player 2)
 
             # Select the move and send it to the manager
-            if (minimax == 1): #run this if the minimax flag is given
-                movei, movej = select_move_minimax(board, color, limit, caching)
-            else: #else run alphabeta
-                movei, movej = select_move_alphabeta(board, color, limit, caching, ordering)
-
-            print("{} {}".format(movei, movej))
+            movei, movej = engine.select_move(board)
+            print("{} {}".format(movei, movej), flush=True)
 
 if __name__ == "__main__":
     run_ai()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Game manager on asyncio, for playing many AI-vs-AI games at once from a
+single process.
+
+AsyncAiPlayer speaks the same protocol as AiPlayerInterface, through
+asyncio.create_subprocess_exec pipes, and enforces the timeout of a move
+with asyncio.wait_for instead of a timer thread. A game waiting for a move
+costs nothing but its two AI processes, so one manager can drive hundreds
+of games; play_games bounds how many run at the same time and yields their
+result records (see othello_tournament.game_result) as they finish. With an
+AsyncAiPool, the AI processes are kept running from one game to the next.
+
+othello_tournament.py uses this with --async, where -j is the number of
+games played at the same time:
+  $python3 othello_tournament.py -d 8 -a agent.py -b randy_ai.py -n 400 -j 64 -l 3 -c -o --async -r results.jsonl
+"""
+import asyncio
+import subprocess
+import time
+
+from othello_game import OthelloGameManager, AiPlayerInterface, AiProcessPool, AiTimeoutError, handshake
+from othello_shared import get_score, board_to_string
+from othello_tournament import game_result, parse_moves, player_arguments, print_result
+
+
+class AsyncAiPlayer(object):
+    """
+    An AI subprocess driven with asyncio. Use AsyncAiPlayer.start to create
+    one.
+    """
+
+    TIMEOUT = AiPlayerInterface.TIMEOUT
+
+    def __init__(self, process, name, color, compact, filename = None, settings = None, pool = None):
+        self.process = process
+        self.name = name
+        self.color = color
+        self.compact = compact # send boards with board_to_string instead of str()
+        self.timed_out = False
+        self.filename = filename
+        self.settings = settings # the handshake without the color
+        self.pool = pool # the AsyncAiPool the process is leased from and goes back to, if any
+
+    @classmethod
+    async def start(cls, filename, color, limit, minimax = False, caching = False, ordering = False,
+                    time_limit = None, compact = False, stderr = None, pool = None, **options):
+        """
+        Start the AI in filename, or lease one from pool, and send it the
+        handshake. stderr is where its debugging output goes, as for
+        subprocess (None inherits ours).
+        """
+        line = handshake(color, limit, minimax, caching, ordering, time_limit, options, cls.TIMEOUT)
+        settings = line.split(",", 1)[1]
+        leased = None
+        if pool is not None:
+            leased = pool.lease(filename, settings)
+        if leased is None:
+            process = await asyncio.create_subprocess_exec("python3", filename, stdin=subprocess.PIPE,
+                                                           stdout=subprocess.PIPE, stderr=stderr)
+            name = (await process.stdout.readline()).decode("ASCII").strip()
+        else:
+            process, name = leased
+        process.stdin.write((line + "\n").encode("ASCII"))
+        await process.stdin.drain()
+        return cls(process, name, color, compact, filename, settings, pool)
+
+    async def get_move(self, board):
+        """
+        Send the position to the AI and wait for its move. If it takes
+        longer than TIMEOUT, the AI is killed and AiTimeoutError raised.
+        """
+        dark_score, light_score = get_score(board)
+        self.process.stdin.write("SCORE {} {}\n".format(dark_score, light_score).encode("ASCII"))
+        if self.compact:
+            self.process.stdin.write("{}\n".format(board_to_string(board)).encode("ASCII"))
+        else:
+            self.process.stdin.write("{}\n".format(str(board)).encode("ASCII"))
+        await self.process.stdin.drain()
+        try:
+            return await asyncio.wait_for(self._read_move(), self.TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            self.process.kill()
+            raise AiTimeoutError
+
+    async def _read_move(self):
+        line = await self.process.stdout.readline()
+        while line.startswith(b"INFO"): # progress reports (see run_ai in agent.py)
+            line = await self.process.stdout.readline()
+        i_s, j_s = line.decode("ASCII").strip().split()
+        return int(i_s), int(j_s)
+
+    async def kill(self, board):
+        dark_score, light_score = get_score(board)
+        final = "FINAL {} {}\n".format(dark_score, light_score).encode("ASCII")
+        if self.pool is not None and not self.timed_out:
+            await self.pool.release(self.filename, self.settings, self.process, final)
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.write(final)
+                await self.process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError): # the AI has already exited
+                pass
+            self.process.kill()
+        await self.process.wait()
+
+
+class AsyncAiPool(AiProcessPool):
+    """
+    AiProcessPool for AsyncAiPlayers: AI processes kept running between
+    games, and leased to the next game that plays the same AI.
+    """
+
+    async def release(self, filename, settings, process, final):
+        idle = self.idle.setdefault((filename, settings), [])
+        if filename in self.cold or process.returncode is not None or len(idle) >= self.size:
+            await self._retire(process)
+            return
+
+        async def reply():
+            line = await process.stdout.readline()
+            if line.startswith(b"FINAL"): # agent.py echoes the result
+                line = await process.stdout.readline()
+            return line
+
+        try:
+            process.stdin.write(final + b"NEWGAME\n")
+            await process.stdin.drain()
+            line = await asyncio.wait_for(reply(), AsyncAiPlayer.TIMEOUT)
+        except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError):
+            line = b""
+        name = line.decode("ASCII", "replace").strip()
+        if not name:
+            self.cold.add(filename)
+            await self._retire(process)
+            return
+        idle.append((process, name))
+
+    async def _retire(self, process):
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+    async def close(self):
+        """
+        Let the idle processes exit: they do when their stdin is closed.
+        """
+        for idle in self.idle.values():
+            for process, name in idle:
+                process.stdin.close()
+                try:
+                    await asyncio.wait_for(process.wait(), AsyncAiPlayer.TIMEOUT)
+                except asyncio.TimeoutError:
+                    await self._retire(process)
+        self.idle = {}
+
+
+async def play_game(game, player1, player2, record):
+    """
+    play_game of othello_game.py for AsyncAiPlayers: play until the player
+    to move has no moves or an AI times out, appending each move to record
+    as (color, i, j, seconds). Both AIs are killed at the end.
+    """
+    players = [None, player1, player2]
+    try:
+        while game.get_possible_moves():
+            player = players[game.current_player]
+            start = time.perf_counter()
+            try:
+                i, j = await player.get_move(game.board)
+            except AiTimeoutError:
+                break
+            record.append((game.current_player, i, j, time.perf_counter() - start))
+            game.play(i, j)
+    finally:
+        await asyncio.gather(player1.kill(game.board), player2.kill(game.board))
+
+
+async def play_one(task, verbose = False, pool = None):
+    """
+    Play the game of a task made by othello_tournament.make_tasks and
+    return its result record. The AIs' stderr is discarded unless verbose.
+    With an AsyncAiPool, the AIs are leased from it and go back to it.
+    """
+    (number, dimension, opening, a_is_dark, agent_a, options_a, agent_b, options_b,
+     in_process, compact) = task
+    game = OthelloGameManager(dimension)
+    for i, j in parse_moves(opening):
+        game.play(i, j)
+    if a_is_dark:
+        dark, light = (agent_a, options_a), (agent_b, options_b)
+    else:
+        dark, light = (agent_b, options_b), (agent_a, options_a)
+
+    stderr = None if verbose else subprocess.DEVNULL
+    record = []
+    start = time.time()
+    players = []
+    try:
+        for color, (filename, options) in ((1, dark), (2, light)):
+            arguments, options = player_arguments(options)
+            players.append(await AsyncAiPlayer.start(filename, color, *arguments, compact,
+                                                     stderr, pool, **options))
+    except BaseException:
+        for player in players:
+            await player.kill(game.board)
+        raise
+    p1, p2 = players
+    await play_game(game, p1, p2, record)
+    timeout = 1 if p1.timed_out else 2 if p2.timed_out else None
+    return game_result(number, opening, a_is_dark, dark[0], light[0], game.board, record, timeout,
+                       time.time() - start)
+
+
+async def play_games(tasks, concurrency, verbose = False, pool = None):
+    """
+    Play the games of tasks, at most concurrency at a time. Yields their
+    result records in the order they finish.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(task):
+        async with semaphore:
+            return await play_one(task, verbose, pool)
+
+    pending = [asyncio.ensure_future(bounded(task)) for task in tasks]
+    try:
+        for finished in asyncio.as_completed(pending):
+            yield await finished
+    finally:
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def run_tournament(tasks, concurrency, writer = None, verbose = False, reuse = False):
+    """
+    othello_tournament.run_tournament on asyncio: play the games, at most
+    concurrency at a time, and return their result records in the order
+    they finished. Each record is written as soon as its game ends. With
+    reuse, the AI processes are kept running from one game to the next.
+    """
+    async def run():
+        # Every game in flight may need two processes of the same AI
+        pool = AsyncAiPool(2 * concurrency) if reuse else None
+        results = []
+        try:
+            async for result in play_games(tasks, concurrency, verbose, pool):
+                results.append(result)
+                if writer is not None:
+                    writer.write(result)
+                if verbose:
+                    print_result(result)
+        finally:
+            if pool is not None:
+                await pool.close()
+        return results
+    return asyncio.run(run())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for move generation, search and move-generator correctness.
+
+- micro: find_lines, get_possible_moves, play_move and get_score of
+  othello_shared on the positions of SUITE, in nanoseconds per call
+- search: fixed-depth alpha-beta searches (select_move_alphabeta with
+  caching, node ordering and PVS, on a fresh SearchContext) of the
+  positions of SUITE for 4x4, 6x6 and 8x8 boards, with the nodes they
+  visit (see othello_stats.py) and nodes per second. The endgame solver is
+  off, so the nodes only change when the search itself does.
+- perft: the number of leaves of the game tree from the start position,
+  cut at a fixed depth, compared with the known counts (see
+  othello_perft.py)
+
+The results are written as one JSON document. Given the results of an
+earlier run as a baseline (-b), every benchmark is compared with it and
+regressions are flagged: calls that got slower or searches with a lower
+nodes per second, and searches that need more nodes to reach the same
+depth. Timings are the median of the repeats, and a change in time only
+counts as a regression if it exceeds both the tolerance and the spread of
+the repeats (their range relative to the median) in either run, so that
+noise on a busy machine is not taken for a slowdown. The exit status is 1 if there is a
+regression or a perft count is wrong.
+
+Example: save a baseline, change the code, then compare
+  $python3 othello_bench.py -o baseline.json
+  $python3 othello_bench.py -b baseline.json -o new.json
+"""
+import gc
+import getopt
+import json
+import platform
+import sys
+import time
+
+from othello_bitboard import geometry, from_board
+from othello_game import OthelloGameManager
+from othello_perft import PERFT, perft_bitboard
+from othello_shared import find_lines, get_possible_moves, play_move, get_score
+from othello_tournament import parse_moves
+
+# Positions for the benchmarks: moves from the start position, taken from
+# random games at several stages
+SUITE = {
+    4: ["", "b1c1d4", "c4d4a2c1d2"],
+    6: ["", "e4e5c2d2f6d5", "d5e5b3b4f5c2b2e6d1a2a5e3",
+        "e4c5b3e2c6d5e5b5b4f5e6b2f4d6c2d1a4a3"],
+    8: ["d3c3e6f6", "e6f6g6f4c3d6g4e3d7g5f3c5",
+        "d3c5e6f7b6e3f4f3f2e2f5g5d7g3f1d1g4g1e1b5",
+        "d3c3c4e3e2c5b5a5c6c2e6f3c1d6g3f5g5d2e7b2a6d7b1b6c8f8a7f2",
+        "c4c5c6b5d6c7f6d3b7d7a5f5f3f7d2g2g7h7b8a6c3a4g6b2c2b1e7b3c1e2f4b4a3a2d1g4"],
+}
+
+# Depth of the search benchmarks; on 4x4 boards that is the end of the game
+SEARCH_DEPTHS = {4: 12, 6: 7, 8: 6}
+
+PERFT_DEPTHS = {4: 12, 6: 7, 8: 8}
+
+# Each timing runs for at least this many seconds
+MIN_TIME = 0.2
+REPEATS = 5
+TOLERANCE = 0.15
+
+USAGE = ("othello_bench.py [-d <dimension> ... -k <micro,search,perft> -r <repeats> "
+         "-e <evaluation> -b <baseline.json> -t <tolerance> -o <results.json>]")
+
+
+def suite_boards(dim):
+    """
+    The positions of SUITE for dim as (board, player to move) pairs.
+    """
+    positions = []
+    for moves in SUITE[dim]:
+        game = OthelloGameManager(dim)
+        for i, j in parse_moves(moves):
+            game.play(i, j)
+        positions.append((tuple(tuple(row) for row in game.board), game.current_player))
+    return positions
+
+
+def _time(function, repeats):
+    """
+    Time repeats runs of function, each repeated often enough to take
+    MIN_TIME. Returns (runs, median seconds per run, spread), where the
+    spread is the range of the repeats relative to their median. As in
+    timeit, the garbage collector is off while the function runs.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            seconds = time.perf_counter() - start
+            if seconds >= MIN_TIME:
+                break
+            number *= 2 if seconds <= 0 else max(2, min(10, int(MIN_TIME / seconds) + 1))
+        samples = [seconds]
+        for _ in range(repeats - 1):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            samples.append(time.perf_counter() - start)
+    finally:
+        if enabled:
+            gc.enable()
+    samples.sort()
+    median = samples[len(samples) // 2]
+    if len(samples) % 2 == 0:
+        median = (median + samples[len(samples) // 2 - 1]) / 2
+    return number, median / number, (samples[-1] - samples[0]) / median
+
+
+############ MICROBENCHMARKS #######################
+def micro_benchmarks(dim, repeats):
+    positions = suite_boards(dim)
+    n = range(dim)
+    # Every empty square for both players, every legal move
+    lines = [(board, i, j, player) for board, _ in positions for i in n for j in n
+             if board[j][i] == 0 for player in (1, 2)]
+    moves = [(board, player, i, j) for board, player in positions
+             for i, j in get_possible_moves(board, player)]
+
+    def run_find_lines():
+        for args in lines:
+            find_lines(*args)
+
+    def run_get_possible_moves():
+        for board, player in positions:
+            get_possible_moves(board, player)
+
+    def run_play_move():
+        for args in moves:
+            play_move(*args)
+
+    def run_get_score():
+        for board, _ in positions:
+            get_score(board)
+
+    results = []
+    for name, function, calls in [("find_lines", run_find_lines, len(lines)),
+                                  ("get_possible_moves", run_get_possible_moves, len(positions)),
+                                  ("play_move", run_play_move, len(moves)),
+                                  ("get_score", run_get_score, len(positions))]:
+        runs, seconds, spread = _time(function, repeats)
+        results.append({"name": "micro/{}/{}".format(name, dim), "kind": "micro",
+                        "calls": calls * runs, "ns_per_call": round(seconds / calls * 1e9, 1),
+                        "spread": round(spread, 3)})
+    return results
+
+
+############ SEARCH ################################
+def search_benchmarks(dim, repeats, evaluation):
+    import agent
+    import othello_eval
+    results = []
+    depth = SEARCH_DEPTHS[dim]
+
+    def search(board, player, stats = None):
+        ctx = agent.SearchContext()
+        if evaluation == "heuristic":
+            ctx.set_evaluator(othello_eval)
+        ctx.stats = stats
+        return agent.select_move_alphabeta(board, player, depth, 1, 1, ctx, 0, 0, 1)
+
+    for n, (board, player) in enumerate(suite_boards(dim)):
+        # One search counts the nodes; the timed ones count nothing
+        stats = agent.SearchStats()
+        move = search(board, player, stats)
+        nodes = stats.total()
+        runs, seconds, spread = _time(lambda: search(board, player), repeats)
+        results.append({"name": "search/{}/{}".format(dim, n), "kind": "search",
+                        "evaluation": evaluation, "depth": depth, "move": list(move),
+                        "nodes": nodes, "seconds": round(seconds, 4), "nps": int(nodes / seconds),
+                        "spread": round(spread, 3)})
+    return results
+
+
+############ PERFT #################################
+def perft_benchmarks(dim, repeats):
+    geo = geometry(dim)
+    own, opp = from_board(OthelloGameManager(dim).board)
+    depth = PERFT_DEPTHS[dim]
+    nodes = perft_bitboard(own, opp, depth, geo)
+    runs, seconds, spread = _time(lambda: perft_bitboard(own, opp, depth, geo), repeats)
+    expected = PERFT[dim][depth - 1]
+    return [{"name": "perft/{}/{}".format(dim, depth), "kind": "perft", "depth": depth,
+             "nodes": nodes, "expected": expected, "ok": nodes == expected,
+             "seconds": round(seconds, 4), "nps": int(nodes / seconds), "spread": round(spread, 3)}]
+
+
+############ COMPARISON ############################
+def compare(results, baseline, tolerance):
+    """
+    Compare results with those of a baseline run. Returns a list of
+    (name, message, regression) tuples, one for every benchmark in both.
+    """
+    base = dict((r["name"], r) for r in baseline["results"])
+    report = []
+    for r in results:
+        b = base.get(r["name"])
+        if b is None:
+            continue
+        # Changes within the noise of either run do not count
+        threshold = max(tolerance, r.get("spread", 0), b.get("spread", 0))
+        if r["kind"] == "micro":
+            change = r["ns_per_call"] / b["ns_per_call"] - 1
+            report.append((r["name"], "{:+.1%} time per call".format(change), change > threshold))
+            continue
+        change = r["nps"] / b["nps"] - 1
+        messages = ["{:+.1%} nodes/s".format(change)]
+        regression = change < -threshold
+        if r["kind"] == "search":
+            if r["depth"] != b["depth"] or r["evaluation"] != b["evaluation"]:
+                report.append((r["name"], "not comparable: another depth or evaluation", False))
+                continue
+            if r["nodes"] != b["nodes"]:
+                messages.append("{:+.1%} nodes".format(r["nodes"] / b["nodes"] - 1))
+                regression = regression or r["nodes"] > b["nodes"]
+            if r["move"] != b["move"]:
+                messages.append("move {} instead of {}".format(tuple(r["move"]), tuple(b["move"])))
+        report.append((r["name"], ", ".join(messages), regression))
+    return report
+
+
+def main(argv):
+
+    dims = []
+    kinds = ["micro", "search", "perft"]
+    repeats = REPEATS
+    evaluation = "discs"
+    baseline_file = None
+    tolerance = TOLERANCE
+    output = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hd:k:r:e:b:t:o:",
+                                   ["dimension=", "kinds=", "repeats=", "eval=", "baseline=",
+                                    "tolerance=", "output="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            dims.append(int(arg))
+        elif opt in ("-k", "--kinds"):
+            kinds = arg.split(",")
+        elif opt in ("-r", "--repeats"):
+            repeats = int(arg)
+        elif opt in ("-e", "--eval"):
+            evaluation = arg
+        elif opt in ("-b", "--baseline"):
+            baseline_file = arg
+        elif opt in ("-t", "--tolerance"):
+            tolerance = float(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    dims = dims or sorted(SUITE)
+    # The spread needs a few repeats to mean anything
+    if (any(dim not in SUITE for dim in dims) or repeats < 3
+            or any(kind not in ("micro", "search", "perft") for kind in kinds)
+            or evaluation not in ("discs", "heuristic")):
+        print(USAGE)
+        sys.exit(2)
+
+    results = []
+    for dim in dims:
+        for kind in kinds:
+            if kind == "micro":
+                found = micro_benchmarks(dim, repeats)
+            elif kind == "search":
+                found = search_benchmarks(dim, repeats, evaluation)
+            else:
+                found = perft_benchmarks(dim, repeats)
+            for r in found:
+                if r["kind"] == "micro":
+                    print("{:28} {:10.1f} ns/call".format(r["name"], r["ns_per_call"]), file=sys.stderr)
+                else:
+                    print("{:28} {:10} nodes {:8.3f}s {:9} nodes/s{}".format(
+                        r["name"], r["nodes"], r["seconds"], r["nps"],
+                        "" if r.get("ok", True) else " WRONG: expected {}".format(r["expected"])),
+                        file=sys.stderr)
+            results.extend(found)
+
+    document = {"python": platform.python_version(), "implementation": platform.python_implementation(),
+                "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results}
+    failed = not all(r.get("ok", True) for r in results)
+    if baseline_file is not None:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        report = compare(results, baseline, tolerance)
+        print("Compared with {} (tolerance {:.0%}):".format(baseline_file, tolerance), file=sys.stderr)
+        for name, message, regression in report:
+            print("{:28} {}{}".format(name, message, " REGRESSION" if regression else ""), file=sys.stderr)
+        document["regressions"] = [name for name, _, regression in report if regression]
+        failed = failed or bool(document["regressions"])
+
+    if output is None:
+        print(json.dumps(document, indent=1))
+    else:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,361 @@
+"""
+Bitboard representation of an Othello board.
+
+A position is stored as two integer masks, one for the dark discs (player 1)
+and one for the light discs (player 2), plus the player to move. Square
+(i, j) -- column i, row j, as used everywhere else -- is bit i * dim + j.
+This column-major layout means that walking the set bits from low to high
+visits the squares in the same order as othello_shared.get_possible_moves.
+
+Move generation and flip computation work with shifts and masks, so they
+handle any board dimension.
+"""
+
+try:
+    popcount = int.bit_count
+except AttributeError: # Python < 3.10
+    def popcount(x):
+        return bin(x).count("1")
+
+
+class Geometry(object):
+    """
+    Precomputed masks and shift tables for one board dimension.
+    Use geometry(dim) to get the shared instance.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.size = dim * dim
+        self.full = (1 << self.size) - 1
+
+        # Squares in the first and last row of every column (j == 0 and
+        # j == dim - 1). Shifting along j must never wrap into these.
+        first_row = 0
+        for i in range(dim):
+            first_row |= 1 << (i * dim)
+        last_row = first_row << (dim - 1)
+        self.first_row = first_row
+
+        # (shift, mask) pairs for the eight directions. A positive shift is
+        # a left shift. The mask is applied after shifting and removes
+        # squares that were reached by wrapping around a column.
+        self.left = []
+        self.right = []
+        for di, dj in [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1),
+                       (-1, 0), (-1, 1)]:
+            mask = self.full
+            if dj == 1:
+                mask &= ~first_row
+            elif dj == -1:
+                mask &= ~last_row
+            shift = di * dim + dj
+            if shift > 0:
+                self.left.append((shift, mask))
+            else:
+                self.right.append((-shift, mask))
+
+        # For every square, the rays leading away from it in the directions
+        # of increasing and of decreasing bit index, as (ray mask, mask of
+        # the ray's first square) pairs. Rays shorter than two squares can
+        # never capture and are left out.
+        self.rays_up = []
+        self.rays_down = []
+        for sq in range(self.size):
+            up = []
+            down = []
+            for di, dj in [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1),
+                           (-1, 0), (-1, 1)]:
+                ray = 0
+                i, j = sq // dim + di, sq % dim + dj
+                while 0 <= i < dim and 0 <= j < dim:
+                    ray |= 1 << (i * dim + j)
+                    i, j = i + di, j + dj
+                if ray & (ray - 1) == 0:
+                    continue
+                if di * dim + dj > 0:
+                    up.append((ray, ray & -ray))
+                else:
+                    down.append((ray, 1 << (ray.bit_length() - 1)))
+            self.rays_up.append(tuple(up))
+            self.rays_down.append(tuple(down))
+
+        self.coords = [(sq // dim, sq % dim) for sq in range(self.size)]
+        self.corners = ((1 << 0) | (1 << (dim - 1)) | (1 << (self.size - dim))
+                        | (1 << (self.size - 1)))
+
+        # A rough static value of playing on each square: corners can never
+        # be flipped, while the squares next to an empty corner (X-squares
+        # diagonally, C-squares along the edge) tend to give it away.
+        n = dim - 1
+        self.square_values = []
+        for i, j in self.coords:
+            edge_i, edge_j = i in (0, n), j in (0, n)
+            near_i, near_j = i in (1, n - 1), j in (1, n - 1)
+            if edge_i and edge_j:
+                value = 20
+            elif near_i and near_j:
+                value = -10
+            elif (edge_i and near_j) or (near_i and edge_j):
+                value = -5
+            elif edge_i or edge_j:
+                value = 3
+            else:
+                value = 0
+            self.square_values.append(value)
+
+        # Lookup tables used to convert single rows to and from bits.
+        self._row_to_bits = {}
+        self._bits_to_row = {}
+
+    def square(self, i, j):
+        return i * self.dim + j
+
+
+_geometries = {}
+
+def geometry(dim):
+    geo = _geometries.get(dim)
+    if geo is None:
+        geo = _geometries[dim] = Geometry(dim)
+    return geo
+
+
+def get_moves(own, opp, geo):
+    """
+    Return a mask of every square where the player owning `own` can play.
+    """
+    empty = ~(own | opp) & geo.full
+    steps = range(geo.dim - 3)
+    moves = 0
+    for s, mask in geo.left:
+        om = opp & mask
+        x = (own << s) & om
+        for _ in steps:
+            x |= (x << s) & om
+        moves |= (x << s) & empty & mask
+    for s, mask in geo.right:
+        om = opp & mask
+        x = (own >> s) & om
+        for _ in steps:
+            x |= (x >> s) & om
+        moves |= (x >> s) & empty & mask
+    return moves
+
+
+def get_flips(own, opp, sq, geo):
+    """
+    Return a mask of the opponent discs captured if the player owning `own`
+    plays on square sq. The result is 0 if the move captures nothing.
+    """
+    # Along each ray the nearest own disc closes the line. The squares
+    # before it are captured if they are all opponent discs.
+    flips = 0
+    for ray, first in geo.rays_up[sq]:
+        if opp & first:
+            x = own & ray
+            if x:
+                line = ray & ((x & -x) - 1)
+                if not line & ~opp:
+                    flips |= line
+    for ray, first in geo.rays_down[sq]:
+        if opp & first:
+            x = own & ray
+            if x:
+                line = ray & ~((1 << x.bit_length()) - 1)
+                if not line & ~opp:
+                    flips |= line
+    return flips
+
+
+def iter_squares(mask):
+    """
+    Yield the indices of the set bits of mask, lowest first.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def from_board(board):
+    """
+    Convert a board in the tuple-of-rows format to (dark, light) masks.
+    """
+    geo = geometry(len(board))
+    cache = geo._row_to_bits
+    dark = 0
+    light = 0
+    for j, row in enumerate(board):
+        bits = cache.get(row) if type(row) is tuple else None
+        if bits is None:
+            row = tuple(row)
+            d = 0
+            l = 0
+            for i, v in enumerate(row):
+                if v == 1:
+                    d |= 1 << (i * geo.dim)
+                elif v == 2:
+                    l |= 1 << (i * geo.dim)
+            bits = cache[row] = (d, l)
+        dark |= bits[0] << j
+        light |= bits[1] << j
+    return dark, light
+
+
+def to_board(dark, light, dim):
+    """
+    Convert (dark, light) masks back to the tuple-of-rows format.
+    """
+    geo = geometry(dim)
+    cache = geo._bits_to_row
+    first_row = geo.first_row
+    rows = []
+    for j in range(dim):
+        key = ((dark >> j) & first_row, (light >> j) & first_row)
+        row = cache.get(key)
+        if row is None:
+            row = []
+            for i in range(dim):
+                bit = 1 << (i * dim)
+                if key[0] & bit:
+                    row.append(1)
+                elif key[1] & bit:
+                    row.append(2)
+                else:
+                    row.append(0)
+            row = cache[key] = tuple(row)
+        rows.append(row)
+    return tuple(rows)
+
+
+class BitBoard(object):
+    """
+    An immutable Othello position: dark and light masks and the player to
+    move (1 for dark, 2 for light).
+    """
+    __slots__ = ("dim", "dark", "light", "player")
+
+    def __init__(self, dim, dark, light, player = 1):
+        self.dim = dim
+        self.dark = dark
+        self.light = light
+        self.player = player
+
+    @classmethod
+    def from_board(cls, board, player = 1):
+        dark, light = from_board(board)
+        return cls(len(board), dark, light, player)
+
+    def to_board(self):
+        return to_board(self.dark, self.light, self.dim)
+
+    def own_opp(self):
+        if self.player == 1:
+            return self.dark, self.light
+        return self.light, self.dark
+
+    def get_possible_moves(self):
+        """
+        Return the legal (column, row) moves for the player to move.
+        """
+        geo = geometry(self.dim)
+        own, opp = self.own_opp()
+        coords = geo.coords
+        return [coords[sq] for sq in iter_squares(get_moves(own, opp, geo))]
+
+    def play(self, i, j):
+        """
+        Return the position after the player to move plays (i, j).
+        """
+        geo = geometry(self.dim)
+        own, opp = self.own_opp()
+        sq = geo.square(i, j)
+        change = get_flips(own, opp, sq, geo) | (1 << sq)
+        own |= change
+        opp &= ~change
+        if self.player == 1:
+            return BitBoard(self.dim, own, opp, 2)
+        return BitBoard(self.dim, opp, own, 1)
+
+    def get_score(self):
+        return popcount(self.dark), popcount(self.light)
+
+    def __eq__(self, other):
+        return (isinstance(other, BitBoard) and self.dim == other.dim
+                and self.dark == other.dark and self.light == other.light
+                and self.player == other.player)
+
+    def __hash__(self):
+        return hash((self.dim, self.dark, self.light, self.player))
+
+    def __repr__(self):
+        return "BitBoard({}, {:#x}, {:#x}, {})".format(self.dim, self.dark,
+                                                       self.light, self.player)
+
+
+class SearchBoard(object):
+    """
+    A mutable position for walking a game tree move by move. make_move
+    plays a move in place and returns a small undo record, and unmake_move
+    takes the move back. The disc counts and the Zobrist hash are updated
+    with every move instead of being recomputed.
+    """
+    __slots__ = ("geo", "own", "opp", "player", "own_count", "opp_count", "key", "zobrist")
+
+    def __init__(self, dim, dark, light, player = 1):
+        from othello_tt import zobrist # othello_tt depends on this module
+        self.geo = geometry(dim)
+        self.zobrist = zobrist(dim)
+        self.player = player
+        self.own, self.opp = (dark, light) if player == 1 else (light, dark)
+        self.own_count = popcount(self.own)
+        self.opp_count = popcount(self.opp)
+        self.key = self.zobrist.hash(dark, light, player)
+
+    @classmethod
+    def from_board(cls, board, player = 1):
+        dark, light = from_board(board)
+        return cls(len(board), dark, light, player)
+
+    def to_board(self):
+        if self.player == 1:
+            return to_board(self.own, self.opp, self.geo.dim)
+        return to_board(self.opp, self.own, self.geo.dim)
+
+    def moves(self):
+        """
+        Yield the legal moves of the player to move, one square at a time.
+        """
+        return iter_squares(get_moves(self.own, self.opp, self.geo))
+
+    def score(self):
+        """
+        Disc difference from the point of view of the player to move.
+        """
+        return self.own_count - self.opp_count
+
+    def make_move(self, sq):
+        """
+        Play on square sq and return the undo record (square, flips, key).
+        """
+        own = self.own
+        opp = self.opp
+        flips = get_flips(own, opp, sq, self.geo)
+        undo = (sq, flips, self.key)
+        change = flips | (1 << sq)
+        n = popcount(flips)
+        self.own, self.opp = opp & ~change, own | change
+        self.own_count, self.opp_count = self.opp_count - n, self.own_count + n + 1
+        self.key = self.zobrist.update(self.key, self.player, sq, flips)
+        self.player = 3 - self.player
+        return undo
+
+    def unmake_move(self, undo):
+        sq, flips, key = undo
+        change = flips | (1 << sq)
+        n = popcount(flips)
+        self.own, self.opp = self.opp ^ change, self.own | flips
+        self.own_count, self.opp_count = self.opp_count - n - 1, self.own_count + n
+        self.key = key
+        self.player = 3 - self.player
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opening book: a file of searched positions from the first plies of the
+game, built offline by self-play and read by agent.py.
+
+Positions are stored in their symmetry-canonical form (see
+othello_symmetry.py) under their Zobrist hash, so mirror images of an
+opening share one entry. The file is a header followed by fixed-size
+records sorted by key:
+
+  header  magic "OTHBOOK1", dimension (1 byte), record count (4 bytes)
+  record  key (8 bytes), move square (1 byte), search depth (1 byte),
+          value (2 bytes, signed)
+
+all little-endian. OpeningBook memory-maps the file and binary-searches
+it, so opening a book takes the same time whatever its size, and nothing
+is read until a position is looked up.
+
+The builder expands the positions reachable from the initial board level
+by level, searching each one with the alpha-beta search of agent.py on a
+pool of worker processes. Every legal move is followed for the first
+plies (-w), after that only the book move.
+
+Example:
+  $python3 othello_book.py -d 8 -p 12 -w 6 -l 8 -j 8 -o othello_book.bin
+"""
+import getopt
+import mmap
+import multiprocessing
+import struct
+import sys
+import time
+
+from othello_bitboard import geometry, from_board, to_board, get_moves, get_flips, iter_squares
+from othello_symmetry import symmetries
+from othello_tt import zobrist
+
+MAGIC = b"OTHBOOK1"
+HEADER = struct.Struct("<8sBI")
+RECORD = struct.Struct("<QBBh")
+
+USAGE = ("othello_book.py -d <dimension> -o <book file> [-p <plies> -w <wide plies> "
+         "-l <depth-limit> -j <jobs>]")
+
+
+def canonical_key(dark, light, player, dim):
+    """
+    Return (key, dark, light, t): the hash of the canonical form of the
+    position, the canonical form and the transform that produces it.
+    """
+    dark, light, t = symmetries(dim).canonical(dark, light)
+    return zobrist(dim).hash(dark, light, player), dark, light, t
+
+
+class OpeningBook(object):
+    """
+    Read-only access to a book file. Call close() when done.
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.dim, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError("Not an opening book: {}".format(filename))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+
+    def probe(self, key):
+        """
+        Return (square, depth, value) stored for key, or None.
+        """
+        data = self.data
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            record = RECORD.unpack_from(data, HEADER.size + mid * RECORD.size)
+            if record[0] < key:
+                low = mid + 1
+            elif record[0] > key:
+                high = mid
+            else:
+                return record[1:]
+        return None
+
+    def lookup(self, board, color):
+        """
+        Return the book move (column, row) for color on board, or None if
+        the position is not in the book.
+        """
+        dim = len(board)
+        if dim != self.dim:
+            return None
+        dark, light = from_board(board)
+        key, _, _, t = canonical_key(dark, light, color, dim)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        geo = geometry(dim)
+        sq = symmetries(dim).restore(entry[0], t)
+        own, opp = (dark, light) if color == 1 else (light, dark)
+        if not (get_moves(own, opp, geo) >> sq) & 1: # a hash collision
+            return None
+        return geo.coords[sq]
+
+
+def write_book(filename, dim, entries):
+    """
+    Write a book file. entries maps keys to (square, depth, value).
+    """
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, dim, len(entries)))
+        for key in sorted(entries):
+            sq, depth, value = entries[key]
+            f.write(RECORD.pack(key, sq, depth, max(-32768, min(32767, int(value)))))
+
+
+############ BUILDER ###############################
+# The builder runs the search of agent.py, which reads books itself. It is
+# imported only here so that reading a book does not load it twice.
+_context = None
+
+def _init_worker():
+    global _context
+    import agent
+    _context = agent.SearchContext()
+
+
+def _search_position(task):
+    """
+    Search a canonical position. Returns (best square, value, depth), or
+    None if the player to move has no move.
+    """
+    import agent
+    dark, light, player, dim, limit = task
+    board = to_board(dark, light, dim)
+    own, opp, key, geo = agent._root(board, player)
+    moves = get_moves(own, opp, geo)
+    if not moves:
+        return None
+    _context.begin(own, opp, key, geo, 1, 1)
+    order = agent._order(own, opp, moves, geo)
+    depth = max(agent._depth(limit, own, opp, geo), 1)
+    best, value = agent._root_search(_context, own, opp, player, key, order, depth)
+    return best, value, depth
+
+
+def build_book(dim, plies, wide, depth, jobs = None, verbose = True):
+    """
+    Search every position of the first plies and return the book entries.
+    All moves are followed for the first wide plies, after that only the
+    book move.
+    """
+    from othello_game import OthelloGameManager
+    dark, light = from_board(OthelloGameManager(dim).board)
+    key, dark, light, t = canonical_key(dark, light, 1, dim)
+    level = {key: (dark, light, 1)}
+    entries = {}
+    geo = geometry(dim)
+    with multiprocessing.Pool(jobs, _init_worker) as pool:
+        for ply in range(plies):
+            start = time.time()
+            tasks = [position + (dim, depth) for position in level.values()]
+            results = pool.imap(_search_position, tasks, chunksize=4)
+            following = {}
+            for (key, (dark, light, player)), result in zip(level.items(), results):
+                if result is None:
+                    continue
+                best, value, searched = result
+                entries[key] = (best, searched, value)
+                own, opp = (dark, light) if player == 1 else (light, dark)
+                moves = [best] if ply >= wide else iter_squares(get_moves(own, opp, geo))
+                for sq in moves:
+                    change = get_flips(own, opp, sq, geo) | (1 << sq)
+                    o, p = opp & ~change, own | change
+                    child = (o, p) if player == 2 else (p, o)
+                    child_key, d, l, _ = canonical_key(child[0], child[1], 3 - player, dim)
+                    if child_key not in entries:
+                        following[child_key] = (d, l, 3 - player)
+            if verbose:
+                print("Ply {}: {} positions in {:.1f}s".format(ply, len(level), time.time() - start),
+                      file=sys.stderr)
+            level = following
+    return entries
+
+
+def main(argv):
+
+    size = 0
+    plies = 10
+    wide = 6
+    depth = 6
+    jobs = None
+    output = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hd:p:w:l:j:o:",
+                                   ["dimension=", "plies=", "wide=", "limit=", "jobs=", "output="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-p", "--plies"):
+            plies = int(arg)
+        elif opt in ("-w", "--wide"):
+            wide = int(arg)
+        elif opt in ("-l", "--limit"):
+            depth = int(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    if size <= 0 or output is None:
+        print(USAGE)
+        sys.exit(2)
+
+    entries = build_book(size, plies, wide, depth, jobs)
+    write_book(output, size, entries)
+    print("Wrote {} positions to {}".format(len(entries), output))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,259 @@
+"""
+Exact endgame solver for the search in agent.py.
+
+Once few squares are empty the game can be searched to the end, and the
+value of a position is the final disc difference instead of an estimate.
+The solver is an alpha-beta search specialised for that case:
+
+- Every node after the first move is searched with a null window and only
+  re-searched when it fails high (principal variation search). The root
+  can be searched with the window (-1, 1), which only decides win, loss or
+  draw, or with a full window for the exact score.
+- With many empties, moves that leave the opponent the fewest replies are
+  searched first (fastest-first); they lead to small subtrees and usually
+  to good positions.
+- With few empties, moves in quadrants with an odd number of empty squares
+  go first (region parity): getting the last move of a region is an
+  advantage.
+- The last three empty squares are handled by dedicated functions that do
+  no move generation at all.
+- Discs of the opponent that can never be flipped cap the final score.
+  When that cap is no better than alpha the node fails low at once
+  (stability cutoff).
+
+As everywhere else in agent.py a player without a legal move ends the game.
+Values are from the point of view of the player to move, whose discs are
+own.
+"""
+import math
+
+from othello_bitboard import popcount, get_moves, get_flips, iter_squares
+from othello_features import mobilities, stable
+from othello_tt import EXACT, LOWER, UPPER, zobrist
+
+# Nodes with at least this many empty squares use the transposition table
+TT_EMPTIES = 6
+# Nodes with at least this many empty squares order their moves by
+# opponent mobility, the others by region parity
+FASTEST_FIRST_EMPTIES = 7
+# Nodes with at least this many empty squares check the deadline
+DEADLINE_EMPTIES = 6
+# Nodes with at least this many empty squares try the stability cutoff
+STABILITY_EMPTIES = 4
+
+
+_quadrants = {}
+
+def quadrants(geo):
+    """
+    The masks of the four quadrants of the board. With an odd dimension
+    the middle column and row belong to the lower quadrants.
+    """
+    masks = _quadrants.get(geo.dim)
+    if masks is None:
+        half = (geo.dim + 1) // 2
+        masks = [0, 0, 0, 0]
+        for sq, (i, j) in enumerate(geo.coords):
+            masks[(i >= half) * 2 + (j >= half)] |= 1 << sq
+        masks = _quadrants[geo.dim] = tuple(masks)
+    return masks
+
+
+def parity(empty, geo):
+    """
+    Return the empty squares that lie in quadrants with an odd number of
+    empty squares.
+    """
+    odd = 0
+    for mask in quadrants(geo):
+        if popcount(empty & mask) & 1:
+            odd |= empty & mask
+    return odd
+
+
+def _last1(own, opp, sq, geo):
+    flips = get_flips(own, opp, sq, geo)
+    if flips:
+        return popcount(own) - popcount(opp) + 2 * popcount(flips) + 1
+    return popcount(own) - popcount(opp)
+
+
+def _last2(own, opp, sq1, sq2, beta, geo):
+    value = -math.inf
+    flips = get_flips(own, opp, sq1, geo)
+    if flips:
+        change = flips | (1 << sq1)
+        value = -_last1(opp & ~change, own | change, sq2, geo)
+        if value >= beta:
+            return value
+    flips = get_flips(own, opp, sq2, geo)
+    if flips:
+        change = flips | (1 << sq2)
+        value = max(value, -_last1(opp & ~change, own | change, sq1, geo))
+    if value == -math.inf:
+        return popcount(own) - popcount(opp)
+    return value
+
+
+def _last3(own, opp, sq1, sq2, sq3, alpha, beta, geo):
+    value = -math.inf
+    for sq, a, b in ((sq1, sq2, sq3), (sq2, sq1, sq3), (sq3, sq1, sq2)):
+        flips = get_flips(own, opp, sq, geo)
+        if flips:
+            change = flips | (1 << sq)
+            v = -_last2(opp & ~change, own | change, a, b, -max(alpha, value), geo)
+            if v > value:
+                value = v
+                if value >= beta:
+                    return value
+    if value == -math.inf:
+        return popcount(own) - popcount(opp)
+    return value
+
+
+def _last(own, opp, empty, alpha, beta, geo):
+    """
+    Solve a position with at most three empty squares.
+    """
+    squares = list(iter_squares(empty))
+    if len(squares) == 3:
+        # A square alone in its quadrant is played first
+        odd = parity(empty, geo)
+        squares.sort(key=lambda sq: not (odd >> sq) & 1)
+        return _last3(own, opp, squares[0], squares[1], squares[2], alpha, beta, geo)
+    if len(squares) == 2:
+        return _last2(own, opp, squares[0], squares[1], beta, geo)
+    if len(squares) == 1:
+        return _last1(own, opp, squares[0], geo)
+    return popcount(own) - popcount(opp)
+
+
+def order_moves(own, opp, moves, empties, geo):
+    """
+    Order moves for the solver: fastest-first with many empty squares,
+    region parity with few. Ties keep the usual move order.
+    """
+    odd = parity(~(own | opp) & geo.full, geo)
+    if empties < FASTEST_FIRST_EMPTIES:
+        return ([sq for sq in iter_squares(moves & odd)]
+                + [sq for sq in iter_squares(moves & ~odd)])
+    squares = list(iter_squares(moves))
+    children = []
+    for sq in squares:
+        change = get_flips(own, opp, sq, geo) | (1 << sq)
+        children.append((opp & ~change, own | change))
+    scored = []
+    for sq, mobility in zip(squares, mobilities(children, geo)):
+        # Corners are stable, and parity breaks ties
+        scored.append((mobility - 2 * ((geo.corners >> sq) & 1), not (odd >> sq) & 1, sq))
+    scored.sort()
+    return [sq for _, _, sq in scored]
+
+
+def solve(ctx, own, opp, player, key, alpha, beta, empties, ply):
+    """
+    Return the exact final disc difference of the position if it lies
+    strictly between alpha and beta, otherwise a bound in the direction of
+    the cutoff. key is only needed when empties >= TT_EMPTIES.
+    """
+    geo = ctx.geo
+    if ctx.stats is not None:
+        ctx.stats.solver_nodes += 1
+    if empties <= 3:
+        return _last(own, opp, ~(own | opp) & geo.full, alpha, beta, geo)
+    if empties >= DEADLINE_EMPTIES and ctx.deadline is not None:
+        ctx.check_deadline()
+
+    hash_move = None
+    if empties >= TT_EMPTIES:
+        entry = ctx.tt.probe(key)
+        if entry is not None:
+            if entry[1] >= empties:
+                bound, v = entry[2], entry[3]
+                if (bound == EXACT or (bound == LOWER and v >= beta)
+                        or (bound == UPPER and v <= alpha)):
+                    return v
+            hash_move = entry[4]
+
+    # The opponent keeps at least its stable discs, so the score is at most
+    # size - 2 * stable. Stable discs are costly to find and rarely make
+    # up more than two thirds of the opponent's discs, or any without a
+    # corner, so only look for them when that would be enough.
+    if (empties >= STABILITY_EMPTIES and opp & geo.corners
+            and alpha >= geo.size - 4 * popcount(opp) // 3):
+        best = geo.size - 2 * popcount(stable(opp, own, geo))
+        if best <= alpha:
+            return best
+
+    moves = get_moves(own, opp, geo)
+    if not moves:
+        return popcount(own) - popcount(opp)
+
+    order = order_moves(own, opp, moves, empties, geo)
+    if hash_move is not None and hash_move != order[0] and (moves >> hash_move) & 1:
+        order.remove(hash_move)
+        order.insert(0, hash_move)
+
+    z = zobrist(geo.dim)
+    hashed = empties - 1 >= TT_EMPTIES
+    alpha_orig = alpha
+    best_move = None
+    value = -math.inf
+    for sq in order:
+        flips = get_flips(own, opp, sq, geo)
+        change = flips | (1 << sq)
+        nxt_own, nxt_opp = opp & ~change, own | change
+        nxt_key = z.update(key, player, sq, flips) if hashed else 0
+        if best_move is None:
+            v = -solve(ctx, nxt_own, nxt_opp, 3 - player, nxt_key, -beta, -alpha, empties - 1, ply + 1)
+        else:
+            # Null window: only prove that the move is no better than alpha
+            v = -solve(ctx, nxt_own, nxt_opp, 3 - player, nxt_key, -alpha - 1, -alpha, empties - 1, ply + 1)
+            if alpha < v < beta:
+                v = -solve(ctx, nxt_own, nxt_opp, 3 - player, nxt_key, -beta, -v, empties - 1, ply + 1)
+        if v > value:
+            best_move, value = sq, v
+            if value >= beta:
+                break
+            alpha = max(alpha, value)
+
+    if empties >= TT_EMPTIES:
+        if value <= alpha_orig:
+            bound = UPPER
+        elif value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        ctx.tt.store(key, empties, bound, value, best_move, ctx.root_discs + ply)
+    return value
+
+
+def solve_root(ctx, own, opp, color, key, order, alpha = -math.inf, beta = math.inf):
+    """
+    Solve the root position, searching its moves in the given order.
+    Returns (best square, value) as solve does for the position; with the
+    window (-1, 1) the sign of the value tells win, draw or loss.
+    Of several equally good moves the one searched first wins.
+    """
+    geo = ctx.geo
+    z = zobrist(geo.dim)
+    empties = geo.size - popcount(own | opp) - 1
+    best_move = None
+    value = -math.inf
+    for sq in order:
+        flips = get_flips(own, opp, sq, geo)
+        change = flips | (1 << sq)
+        nxt_own, nxt_opp = opp & ~change, own | change
+        nxt_key = z.update(key, color, sq, flips)
+        if best_move is None:
+            v = -solve(ctx, nxt_own, nxt_opp, 3 - color, nxt_key, -beta, -alpha, empties, 1)
+        else:
+            v = -solve(ctx, nxt_own, nxt_opp, 3 - color, nxt_key, -alpha - 1, -alpha, empties, 1)
+            if alpha < v < beta:
+                v = -solve(ctx, nxt_own, nxt_opp, 3 - color, nxt_key, -beta, -v, empties, 1)
+        if v > value:
+            best_move, value = sq, v
+            if value >= beta:
+                break
+            alpha = max(alpha, value)
+    return best_move, value
@@ -0,0 +1,193 @@
+"""
+Heuristic evaluation of positions for the search in agent.py, one position
+at a time or many at once.
+
+The value of a position is a weighted sum of features, each counted for
+the player to move (whose discs are own) minus the opponent:
+
+- discs
+- corners, which can never be flipped
+- mobility, the number of legal moves
+- frontier discs, next to an empty square and so likely to be flipped
+  (a penalty)
+- stable discs, which can never be flipped
+- the static square values of Geometry.square_values
+
+The mobility, frontier and stability counts come from othello_features.
+
+evaluate_batch scores many positions in one vectorized NumPy call; the
+search uses it for all the leaf children of a node at once. NumPy is
+optional: without it, on boards larger than 8x8 whose masks do not fit in
+64-bit integers, or for fewer than BATCH_MIN positions, it evaluates the
+positions one at a time.
+"""
+from othello_bitboard import geometry, popcount
+from othello_features import counts, stability
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DISC_WEIGHT = 1
+CORNER_WEIGHT = 25
+MOBILITY_WEIGHT = 5
+FRONTIER_WEIGHT = 2
+STABILITY_WEIGHT = 20
+SQUARE_WEIGHT = 1
+# Finished games are scored by disc difference times this, so that any win
+# is worth more than any estimate
+FINAL_WEIGHT = 1000
+
+# Smaller batches are evaluated one position at a time: a NumPy call costs
+# about as much as evaluating a few positions in Python.
+BATCH_MIN = 8
+
+
+_square_classes = {}
+
+def square_classes(geo):
+    """
+    The squares grouped by static value, as (value, mask) pairs.
+    """
+    classes = _square_classes.get(geo.dim)
+    if classes is None:
+        masks = {}
+        for sq, value in enumerate(geo.square_values):
+            if value:
+                masks[value] = masks.get(value, 0) | (1 << sq)
+        classes = _square_classes[geo.dim] = sorted(masks.items())
+    return classes
+
+
+def final(own, opp):
+    """
+    Value of a finished game.
+    """
+    return FINAL_WEIGHT * (popcount(own) - popcount(opp))
+
+
+def evaluate(own, opp, geo):
+    """
+    Heuristic value of a single position.
+    """
+    own_moves, opp_moves, own_frontier, opp_frontier = counts(own, opp, geo)
+    value = DISC_WEIGHT * (popcount(own) - popcount(opp))
+    value += CORNER_WEIGHT * (popcount(own & geo.corners) - popcount(opp & geo.corners))
+    value += MOBILITY_WEIGHT * (own_moves - opp_moves)
+    value -= FRONTIER_WEIGHT * (own_frontier - opp_frontier)
+    for weight, mask in square_classes(geo):
+        value += SQUARE_WEIGHT * weight * (popcount(own & mask) - popcount(opp & mask))
+    if STABILITY_WEIGHT:
+        own_stable, opp_stable = stability(own, opp, geo)
+        value += STABILITY_WEIGHT * (own_stable - opp_stable)
+    return value
+
+
+############ VECTORIZED ############################
+# The same features for arrays of masks, with NumPy uint64 arrays standing
+# in for Python ints. Both sides of all positions are stacked into one
+# array, so that each operation covers all of them: NumPy's cost per call
+# far exceeds its cost per element at these sizes.
+def _popcount(x):
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(x).astype(numpy.int64)
+    return _BYTE_COUNTS[x.view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+
+if numpy is not None:
+    _BYTE_COUNTS = numpy.array([bin(b).count("1") for b in range(256)], dtype=numpy.int64)
+
+
+_constants = {}
+
+def _geometry_constants(geo):
+    """
+    The masks and shifts of a geometry as NumPy scalars.
+    """
+    c = _constants.get(geo.dim)
+    if c is None:
+        u = numpy.uint64
+        shifts = ([(u(s), u(m), True) for s, m in geo.left]
+                  + [(u(s), u(m), False) for s, m in geo.right])
+        classes = [(SQUARE_WEIGHT * weight, u(mask)) for weight, mask in square_classes(geo)]
+        c = _constants[geo.dim] = (shifts, u(geo.full), u(geo.corners), classes)
+    return c
+
+
+def _side_values(own, opp, geo):
+    """
+    The features of the player whose discs are own, summed with their
+    weights.
+    """
+    shifts, full, corners, classes = _geometry_constants(geo)
+    steps = range(geo.dim - 3)
+    empty = ~(own | opp) & full
+    around = numpy.zeros_like(own)
+    moves = numpy.zeros_like(own)
+    for s, mask, left in shifts:
+        om = opp & mask
+        if left:
+            around |= (empty << s) & mask
+            x = (own << s) & om
+            for _ in steps:
+                x |= (x << s) & om
+            moves |= (x << s) & empty & mask
+        else:
+            around |= (empty >> s) & mask
+            x = (own >> s) & om
+            for _ in steps:
+                x |= (x >> s) & om
+            moves |= (x >> s) & empty & mask
+    value = DISC_WEIGHT * _popcount(own)
+    value += CORNER_WEIGHT * _popcount(own & corners)
+    value += MOBILITY_WEIGHT * _popcount(moves)
+    value -= FRONTIER_WEIGHT * _popcount(own & around)
+    for weight, mask in classes:
+        value += weight * _popcount(own & mask)
+    return value
+
+
+def evaluate_batch(own, opp, geo):
+    """
+    Heuristic values of many positions, given as two sequences of masks
+    (Python ints, or NumPy uint64 arrays). Returns a list of ints.
+    """
+    n = len(own)
+    if numpy is None or geo.size > 64 or n < BATCH_MIN:
+        return [evaluate(o, p, geo) for o, p in zip(own, opp)]
+    both = numpy.empty(2 * n, dtype=numpy.uint64)
+    both[:n] = own
+    both[n:] = opp
+    values = _side_values(both, numpy.concatenate((both[n:], both[:n])), geo)
+    values = (values[:n] - values[n:]).tolist()
+    if STABILITY_WEIGHT:
+        # The stable discs grow from the corners a square at a time, too
+        # few positions at once for NumPy to pay off
+        for k, (o, p) in enumerate(zip(own, opp)):
+            own_stable, opp_stable = stability(int(o), int(p), geo)
+            values[k] += STABILITY_WEIGHT * (own_stable - opp_stable)
+    return values
+
+
+def evaluate_boards(boards, color):
+    """
+    Heuristic values for color of an (N, dim, dim) array of boards in the
+    usual format, board[row][column] with 0, 1 or 2 for empty, dark and
+    light. Needs NumPy.
+    """
+    boards = numpy.asarray(boards)
+    n, dim = boards.shape[0], boards.shape[1]
+    geo = geometry(dim)
+    # Square (i, j) is bit i * dim + j, with i the column
+    squares = boards.transpose(0, 2, 1).reshape(n, dim * dim)
+    bits = [1 << sq for sq in range(dim * dim)]
+    if geo.size > 64:
+        dark = [sum(b for b, v in zip(bits, row) if v == 1) for row in squares.tolist()]
+        light = [sum(b for b, v in zip(bits, row) if v == 2) for row in squares.tolist()]
+    else:
+        bits = numpy.array(bits, dtype=numpy.uint64)
+        dark = numpy.bitwise_or.reduce(numpy.where(squares == 1, bits, numpy.uint64(0)), axis=1)
+        light = numpy.bitwise_or.reduce(numpy.where(squares == 2, bits, numpy.uint64(0)), axis=1)
+    if color == 1:
+        return evaluate_batch(dark, light, geo)
+    return evaluate_batch(light, dark, geo)
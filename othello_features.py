@@ -0,0 +1,217 @@
+"""
+Counts of positional features for evaluation and move ordering, computed
+on bitboards without ever building a list of moves.
+
+- mobility: the number of legal moves of a side
+- frontier discs: discs next to at least one empty square
+
+counts gets both features for both sides in a single pass over the eight
+directions, with the masks of the two sides packed into one int, for
+about two thirds of the cost of generating the moves of each side
+separately. mobilities does the same for the positions after each move
+of a node, for move ordering. For boards in the tuple-of-rows format use
+board_counts and board_mobility; they convert the board once through the
+row tables of othello_bitboard instead of calling find_lines for every
+empty square.
+
+- stable discs: discs that can never be flipped, whatever is played
+
+stable and stability find a lower bound on them: a disc is stable if,
+along each of the four lines through it (the column, the row and the two
+diagonals), the line is full, or the disc is on the edge of the board, or
+it lies next to a stable disc of its own colour. Only whole lines are
+checked for being full, so some stable discs are missed, but no disc that
+could still be flipped is counted.
+"""
+from othello_bitboard import geometry, popcount, from_board, get_moves
+
+
+def mobility(own, opp, geo):
+    """
+    Number of legal moves of the player owning own.
+    """
+    return popcount(get_moves(own, opp, geo))
+
+
+_packed = {}
+
+def _packed_masks(geo, n):
+    """
+    (gap, full mask, directions) for n masks packed into one int, each
+    gap bits above the previous one. The masks cover all n of them.
+    """
+    c = _packed.get((geo.dim, n))
+    if c is None:
+        # The gap leaves room for the longest shift, so that nothing
+        # shifted out of one mask lands in the next
+        gap = geo.size + geo.dim + 1
+        copies = 0
+        for k in range(n):
+            copies |= 1 << (k * gap)
+        directions = ([(s, m * copies, True) for s, m in geo.left]
+                      + [(s, m * copies, False) for s, m in geo.right])
+        c = _packed[(geo.dim, n)] = (gap, geo.full * copies, directions)
+    return c
+
+
+def _packed_moves(player, other, empty, directions, geo):
+    """
+    get_moves for packed masks.
+    """
+    steps = range(geo.dim - 3)
+    moves = 0
+    for s, mask, left in directions:
+        om = other & mask
+        if left:
+            x = (player << s) & om
+            for _ in steps:
+                x |= (x << s) & om
+            moves |= (x << s) & mask
+        else:
+            x = (player >> s) & om
+            for _ in steps:
+                x |= (x >> s) & om
+            moves |= (x >> s) & mask
+    return moves & empty
+
+
+def counts(own, opp, geo):
+    """
+    Return (own mobility, opp mobility, own frontier, opp frontier).
+    """
+    # Both sides are flooded at once: own with opp above it for own's
+    # moves, and opp with own above it for opp's. Python ints have no
+    # fixed width, so the wider ints cost little more than the narrow ones.
+    gap, full, directions = _packed_masks(geo, 2)
+    empty = ~(own | opp) & geo.full
+    empty |= empty << gap
+    player = own | (opp << gap)
+    moves = _packed_moves(player, opp | (own << gap), empty, directions, geo)
+    around = 0
+    for s, mask, left in directions:
+        if left:
+            around |= (empty << s) & mask
+        else:
+            around |= (empty >> s) & mask
+    frontier = player & around
+    low = geo.full
+    return (popcount(moves & low), popcount(moves >> gap),
+            popcount(frontier & low), popcount(frontier >> gap))
+
+
+def mobilities(positions, geo):
+    """
+    Mobility of own in each of a list of (own, opp) positions, all counted
+    at once. For ordering moves by the replies they leave the opponent.
+    """
+    gap, full, directions = _packed_masks(geo, len(positions))
+    player = other = 0
+    shift = 0
+    for own, opp in positions:
+        player |= own << shift
+        other |= opp << shift
+        shift += gap
+    moves = _packed_moves(player, other, ~(player | other) & full, directions, geo)
+    low = geo.full
+    result = []
+    for _ in positions:
+        result.append(popcount(moves & low))
+        moves >>= gap
+    return result
+
+
+_stability = {}
+
+def _stability_masks(geo):
+    """
+    For each of the four axes: the masks of its lines, and the shift, the
+    two direction masks and the squares on the edge along the axis packed
+    as for _packed_masks(geo, 2).
+    """
+    c = _stability.get(geo.dim)
+    if c is None:
+        gap, full, directions = _packed_masks(geo, 2)
+        dim = geo.dim
+        c = []
+        # geo.left and geo.right list opposite directions in the same order
+        for (di, dj), up, down in zip([(0, 1), (1, 1), (1, 0), (1, -1)], directions[:4],
+                                      directions[4:]):
+            lines = []
+            for sq, (i, j) in enumerate(geo.coords):
+                if 0 <= i - di < dim and 0 <= j - dj < dim:
+                    continue # not the first square of a line
+                line = 0
+                while 0 <= i < dim and 0 <= j < dim:
+                    line |= 1 << (i * dim + j)
+                    i, j = i + di, j + dj
+                lines.append(line)
+            s, up_mask, _ = up
+            down_mask = down[1]
+            # Squares with both neighbours on the board along the axis
+            inside = (full << s) & up_mask & (full >> s) & down_mask
+            c.append((tuple(lines), s, up_mask, down_mask, full & ~inside))
+        c = _stability[geo.dim] = (gap, c)
+    return c
+
+
+def _stable_packed(own, opp, geo):
+    """
+    Stable discs of own and, gap bits above them, of opp.
+    """
+    gap, axes = _stability_masks(geo)
+    occupied = own | opp
+    player = own | (opp << gap)
+    anchored = []
+    for lines, s, up_mask, down_mask, edge in axes:
+        filled = 0
+        for line in lines:
+            if occupied & line == line:
+                filled |= line
+        anchored.append((s, up_mask, down_mask, edge | filled | (filled << gap)))
+    # Grow the stable discs from the corners until nothing changes
+    stable = 0
+    while True:
+        x = player
+        for s, up_mask, down_mask, anchor in anchored:
+            x &= anchor | ((stable << s) & up_mask) | ((stable >> s) & down_mask)
+        if x == stable:
+            return stable, gap
+        stable = x
+
+
+def stable(own, opp, geo):
+    """
+    Mask of discs of own that can never be flipped (a lower bound).
+    """
+    return _stable_packed(own, opp, geo)[0] & geo.full
+
+
+def stability(own, opp, geo):
+    """
+    Return (own stable discs, opp stable discs), counted.
+    """
+    both, gap = _stable_packed(own, opp, geo)
+    return popcount(both & geo.full), popcount(both >> gap)
+
+
+def board_counts(board, player):
+    """
+    counts for player (1 for dark, 2 for light) on a tuple-of-rows board.
+    """
+    geo = geometry(len(board))
+    dark, light = from_board(board)
+    if player == 1:
+        return counts(dark, light, geo)
+    return counts(light, dark, geo)
+
+
+def board_mobility(board, player):
+    """
+    Number of legal moves of player on a tuple-of-rows board; the same as
+    len(get_possible_moves(board, player)).
+    """
+    geo = geometry(len(board))
+    dark, light = from_board(board)
+    if player == 1:
+        return mobility(dark, light, geo)
+    return mobility(light, dark, geo)
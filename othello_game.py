@@ -7,9 +7,12 @@ players.
 Thanks to original author Daniel Bauer, Columbia University
 """
 import sys
+import os
+import time
+import importlib.util
 import subprocess
-from threading import Timer
-from othello_shared import find_lines, get_possible_moves, play_move, get_score
+from threading import Lock, Timer
+from othello_shared import find_lines, get_possible_moves, play_move, get_score, board_to_string
 
 class InvalidMoveError(RuntimeError):
     pass
@@ -27,26 +30,67 @@ class Player(object):
     def get_move(self, manager):
         pass  
 
+def parse_info(line):
+    """
+    Parse an INFO line of an AI that reports its progress, such as
+    "INFO depth=7 completed=0 nodes=1234 time=0.52 move=2,3 value=4", into
+    a dict of strings.
+    """
+    return dict(item.split("=", 1) for item in line.split()[1:] if "=" in item)
+
+
+def handshake(color, limit, minimax, caching, ordering, time_limit, options, timeout):
+    """
+    The handshake line that tells an AI its color and settings.
+    """
+    #convert params to numbers 
+    m = 0 
+    if minimax == True: m = 1
+    c = 0 
+    if caching == True: c = 1
+    o = 0 
+    if ordering == True: o = 1
+
+    line = str(color) + "," + str(limit) + "," + str(m) + "," + str(c) + "," + str(o)
+    # Optional extra fields are sent as name=value. The time the AI may
+    # spend per move can never be more than the timeout after which the
+    # AI is killed.
+    options = dict(options)
+    if time_limit: 
+        options["time"] = min(time_limit, timeout)
+    for name, value in sorted(options.items()): 
+        if value is not None: 
+            line += ",{}={}".format(name, value)
+    return line
+
+
 class AiPlayerInterface(Player):
 
     TIMEOUT = 10 
 
-    def __init__(self, filename, color, limit, minimax = False, caching = False, ordering = False):
-        
-        #convert params to numbers 
-        m = 0 
-        if minimax == True: m = 1
-        c = 0 
-        if caching == True: c = 1
-        o = 0 
-        if ordering == True: o = 1
+    def __init__(self, filename, color, limit, minimax = False, caching = False, ordering = False, time_limit = None, compact = False, pool = None, **options):
 
         self.color = color
-        self.process = subprocess.Popen(['python3',filename], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-        name = self.process.stdout.readline().decode("ASCII").strip()
+        self.compact = compact # send boards with board_to_string instead of str()
+        self.lock = Lock() # stop() writes to the AI from another thread
+        self.thinking = False
+        self.reports = False # whether the AI sends INFO lines, and so understands STOP
+        self.timed_out = False
+        self.filename = filename
+        self.pool = pool # the AiProcessPool the process is leased from and goes back to, if any
+        line = handshake(color, limit, minimax, caching, ordering, time_limit, options, AiPlayerInterface.TIMEOUT)
+        self.settings = line.split(",", 1)[1] # the handshake without the color
+        leased = None
+        if pool is not None: 
+            leased = pool.lease(filename, self.settings)
+        if leased is None: 
+            self.process = subprocess.Popen(['python3',filename], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            name = self.process.stdout.readline().decode("ASCII").strip()
+        else: 
+            self.process, name = leased
         print("AI introduced itself as: {}".format(name))
         self.name = name
-        self.process.stdin.write((str(color) + "," + str(limit) + "," + str(m) + "," + str(c) + "," + str(o) + "\n").encode("ASCII"))
+        self.process.stdin.write((line + "\n").encode("ASCII"))
         self.process.stdin.flush()
 
     def timeout(self): 
@@ -54,13 +98,23 @@ class AiPlayerInterface(Player):
         self.process.kill() 
         self.timed_out = True
 
-    def get_move(self, manager):
+    def get_move(self, manager, progress = None):
+        """
+        Send the position to the AI and wait for its move. An AI started
+        with progress=1 writes INFO lines while it searches; each of them is
+        passed to progress, parsed by parse_info, if it is given.
+        """
         white_score, dark_score = get_score(manager.board)
         print((white_score, dark_score))
-        self.process.stdin.write("SCORE {} {}\n".format(white_score, dark_score).encode("ASCII"))
-        self.process.stdin.flush()
-        self.process.stdin.write("{}\n".format(str(manager.board)).encode("ASCII"))
-        self.process.stdin.flush()
+        with self.lock:
+            self.process.stdin.write("SCORE {} {}\n".format(white_score, dark_score).encode("ASCII"))
+            self.process.stdin.flush()
+            if self.compact: 
+                self.process.stdin.write("{}\n".format(board_to_string(manager.board)).encode("ASCII"))
+            else: 
+                self.process.stdin.write("{}\n".format(str(manager.board)).encode("ASCII"))
+            self.process.stdin.flush()
+            self.thinking = True
 
         timer = Timer(AiPlayerInterface.TIMEOUT, lambda: self.timeout())
         self.timed_out = False
@@ -68,6 +122,13 @@ class AiPlayerInterface(Player):
 
         # Wait for the AI call
         move_s = self.process.stdout.readline().decode("ASCII")
+        while move_s.startswith("INFO"):
+            self.reports = True
+            if progress is not None:
+                progress(parse_info(move_s))
+            move_s = self.process.stdout.readline().decode("ASCII")
+        with self.lock:
+            self.thinking = False
         if self.timed_out:  
             raise AiTimeoutError
         timer.cancel()
@@ -76,12 +137,177 @@ class AiPlayerInterface(Player):
         j = int(j_s)
         return i,j 
     
+    def stop(self):
+        """
+        Ask the AI to play the best move it has found so far, from another
+        thread while get_move waits. Only AIs that send INFO lines
+        understand this; for others it does nothing.
+        """
+        with self.lock:
+            if self.thinking and self.reports:
+                try:
+                    self.process.stdin.write(b"STOP\n")
+                    self.process.stdin.flush()
+                except OSError: # the AI has just been killed
+                    pass
+
     def kill(self,manager):
         white_score, dark_score = get_score(manager.board)
-        self.process.stdin.write("FINAL {} {}\n".format(white_score, dark_score).encode("ASCII"))
+        final = "FINAL {} {}\n".format(white_score, dark_score).encode("ASCII")
+        if self.pool is not None and not self.timed_out: 
+            self.pool.release(self.filename, self.settings, self.process, final)
+            return
+        self.process.stdin.write(final)
         self.process.kill() 
 
 
+class AiProcessPool(object):
+    """
+    Keeps AI processes running between games, so that a tournament starts
+    the interpreter, imports the modules and loads books and weights once
+    per process instead of once per game. AiPlayerInterface leases a
+    process from the pool when it is given one, and kill returns it.
+
+    After FINAL the pool sends NEWGAME. An AI that understands it (see
+    run_ai in agent.py) introduces itself again and is kept for the next
+    game, which starts with the handshake as usual. Processes are leased to
+    the same AI file with the same settings first, so that the AI can keep
+    its search tables as well. AIs that do not answer NEWGAME are started
+    anew for every game.
+    """
+
+    def __init__(self, size = 2):
+        self.size = size # idle processes kept per AI file and settings
+        self.idle = {} # (filename, settings) -> [(process, name)]
+        self.cold = set() # AI files that did not answer NEWGAME
+
+    def lease(self, filename, settings):
+        """
+        Return (process, name) of an idle process of the AI in filename,
+        ready for its handshake, or None if there is none.
+        """
+        idle = self.idle.get((filename, settings))
+        if not idle: 
+            # The AI starts over with the new settings, but it still saves
+            # starting the interpreter
+            idle = next((v for (f, _), v in self.idle.items() if f == filename and v), None)
+        if not idle: 
+            return None
+        return idle.pop()
+
+    def release(self, filename, settings, process, final):
+        """
+        Take back a process after its game, given the FINAL line to send
+        it, and keep it for the next game if it answers NEWGAME.
+        """
+        idle = self.idle.setdefault((filename, settings), [])
+        if filename in self.cold or process.poll() is not None or len(idle) >= self.size: 
+            self._retire(process)
+            return
+        timer = Timer(AiPlayerInterface.TIMEOUT, process.kill)
+        timer.start()
+        try: 
+            process.stdin.write(final + b"NEWGAME\n")
+            process.stdin.flush()
+            reply = process.stdout.readline()
+            if reply.startswith(b"FINAL"): # agent.py echoes the result
+                reply = process.stdout.readline()
+        except OSError: # the AI has exited
+            reply = b""
+        finally: 
+            timer.cancel()
+        name = reply.decode("ASCII", "replace").strip()
+        if not name: 
+            self.cold.add(filename)
+            self._retire(process)
+            return
+        idle.append((process, name))
+
+    def _retire(self, process):
+        process.kill()
+        process.wait()
+
+    def close(self):
+        """
+        Let the idle processes exit: they do when their stdin is closed.
+        """
+        for idle in self.idle.values(): 
+            for process, name in idle: 
+                try: 
+                    process.stdin.close()
+                except OSError: 
+                    pass
+                try: 
+                    process.wait(AiPlayerInterface.TIMEOUT)
+                except subprocess.TimeoutExpired: 
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+        self.idle = {}
+
+
+def load_agent(filename):
+    """
+    Import an AI file such as agent.py as a module, for use in-process.
+    """
+    path = os.path.abspath(filename)
+    name = os.path.splitext(os.path.basename(path))[0]
+    module = sys.modules.get(name)
+    if module is not None and os.path.abspath(getattr(module, "__file__", "")) == path:
+        return module
+    directory = os.path.dirname(path)
+    if directory not in sys.path: 
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class InProcessPlayer(Player):
+    """
+    Runs an AI inside the manager's process, without a subprocess or a pipe.
+    It takes the same arguments as AiPlayerInterface. If the AI module has
+    an Engine class (as agent.py does), one Engine is created per game with
+    the options of the handshake; otherwise the module's
+    select_move(board, color) is called. The timeout cannot interrupt an
+    in-process AI, so a move that took too long is reported afterwards.
+    Pondering is turned off: its thread would take the CPU (and the GIL)
+    from the opponent in the same process during the opponent's turn.
+    """
+
+    def __init__(self, filename, color, limit, minimax = False, caching = False, ordering = False, time_limit = None, compact = False, **options):
+        module = load_agent(filename)
+        self.color = color
+        if hasattr(module, "Engine"): 
+            if time_limit: 
+                options["time"] = min(time_limit, AiPlayerInterface.TIMEOUT)
+            options = dict((name, str(value)) for name, value in options.items() if value is not None)
+            if options.get("ponder", "0") != "0": 
+                sys.stderr.write("Pondering is off for in-process AIs.\n")
+            options["ponder"] = "0"
+            self.engine = module.Engine(color, limit, int(minimax), int(caching), int(ordering), options)
+            self.name = self.engine.name
+            self.select_move = self.engine.select_move
+        else: 
+            self.engine = None
+            self.name = os.path.splitext(os.path.basename(filename))[0]
+            self.select_move = lambda board: module.select_move(board, color)
+
+    def get_move(self, manager):
+        start = time.time()
+        i, j = self.select_move(manager.board)
+        if time.time() - start > AiPlayerInterface.TIMEOUT: 
+            sys.stderr.write("{} timed out.".format(self.name))
+            raise AiTimeoutError
+        return i, j
+
+    def kill(self, manager):
+        if self.engine is not None: 
+            self.engine.close()
+
+
 class OthelloGameManager(object):
 
     def __init__(self, dimension = 6):
@@ -146,8 +372,9 @@ def play_game(game, player1, player2):
                 print("{} ({}) plays {},{}".format(player_obj.name, color, i,j))
                 game.play(i,j)
             except AiTimeoutError:
+                p1score, p2score = get_score(game.board)
                 print("{} ({}) timed out!".format(player_obj.name, color))
-                print("FINAL: {} (dark) {}:{} {} (light)".format(player_obj.name, p1score, p2score, player2.name))
+                print("FINAL: {} (dark) {}:{} {} (light)".format(player1.name, p1score, p2score, player2.name))
                 player1.kill(game)
                 player2.kill(game)
                 break
@@ -3,9 +3,18 @@
 """
 This module contains a simple graphical user interface for Othello. 
 
+AI moves are computed on a worker thread, which hands the move back through
+a queue that the Tk event loop polls, so the window stays responsive while
+an AI thinks. AIs are started with progress=1, and those that report their
+search (see run_ai in agent.py) show it live below the board. "Move now"
+makes such an AI play the best move it has found so far; "Pause" stops the
+search and discards its move until "Resume" asks for it again.
+
 Thanks to original author Daniel Bauer, Columbia University
 """
 import sys, getopt
+import queue
+import threading
 
 from tkinter import *
 from tkinter import scrolledtext
@@ -13,6 +22,9 @@ from tkinter import scrolledtext
 from othello_game import OthelloGameManager, AiPlayerInterface, Player, InvalidMoveError, AiTimeoutError
 from othello_shared import get_possible_moves, get_score
 
+# Milliseconds between two looks at the queue of the AI worker thread
+POLL_INTERVAL = 50
+
 class OthelloGui(object):
 
     def __init__(self, game_manager, player1, player2):
@@ -33,13 +45,27 @@ class OthelloGui(object):
         self.canvas = Canvas(root,height = self.cell_size * self.height + self.offset,width = self.cell_size * self.width + self.offset)
         self.move_label = Label(root)
         self.score_label = Label(root)
+        self.progress_label = Label(root)
+        buttons = Frame(root)
+        self.move_now_button = Button(buttons, text="Move now", state=DISABLED, command=lambda: self.move_now())
+        self.pause_button = Button(buttons, text="Pause", command=lambda: self.pause())
         self.text = scrolledtext.ScrolledText(root, width=70, height=10)
         self.move_label.pack(side="top")
         self.score_label.pack(side="top")
         self.canvas.pack()
+        self.progress_label.pack()
+        self.move_now_button.pack(side="left")
+        self.pause_button.pack(side="left")
+        buttons.pack()
         self.text.pack()
         self.draw_board()
 
+        self.results = queue.Queue() # what the AI worker thread hands back to the event loop
+        self.thinking = None # the AI player whose move is being computed
+        self.paused = False
+        self.cancelled = False # discard the move of the AI that is thinking
+        self.over = False
+
     def get_position(self,x,y):
         i = (x -self.offset) // self.cell_size
         j = (y -self.offset) // self.cell_size
@@ -62,30 +88,128 @@ class OthelloGui(object):
             self.log("Invalid move. {},{}".format(i,j))
 
     def shutdown(self, text):
+        self.over = True
         self.move_label["text"] = text 
         self.root.unbind("<Button-1>")
+        self.move_now_button["state"] = DISABLED
+        self.pause_button["state"] = DISABLED
         if isinstance(self.players[1], AiPlayerInterface): 
             self.players[1].kill(self.game)
         if isinstance(self.players[2], AiPlayerInterface): 
             self.players[2].kill(self.game)
  
     def ai_move(self):
+        """
+        Start computing the move of the AI to play on a worker thread.
+        """
+        if self.paused or self.over or self.thinking is not None:
+            return
         player_obj = self.players[self.game.current_player]
+        self.thinking = player_obj
+        self.cancelled = False
+        self.progress_label["text"] = "{} is thinking".format(player_obj.name)
+        self.move_now_button["state"] = NORMAL
+        worker = threading.Thread(target=self.think, args=(player_obj,))
+        worker.daemon = True
+        worker.start()
+        self.root.after(POLL_INTERVAL, lambda: self.poll())
+
+    def think(self, player_obj):
+        """
+        Runs on the worker thread: nothing here may touch Tk.
+        """
         try:
-            i,j = player_obj.get_move(self.game)
-            player = "Dark" if self.game.current_player == 1 else "Light"
-            player = "{} {}".format(player_obj.name, player)
-            self.log("{}: {},{}".format(player, i,j))
-            self.game.play(i,j)
-            self.draw_board()
-            if not get_possible_moves(self.game.board, self.game.current_player):
-                self.shutdown("Game Over")
-            elif isinstance(self.players[self.game.current_player], AiPlayerInterface):
-                self.root.after(1, lambda: self.ai_move())
-            else: 
-                self.root.bind("<Button-1>",lambda e: self.mouse_pressed(e))        
+            move = player_obj.get_move(self.game, progress=lambda info: self.results.put(("progress", info)))
+            self.results.put(("move", move))
         except AiTimeoutError:
+            self.results.put(("timeout", None))
+        except Exception as e: # the AI died or sent something that is not a move
+            self.results.put(("error", e))
+
+    def poll(self):
+        """
+        Handle what the worker thread has sent so far, and look again later
+        while the AI is still thinking.
+        """
+        while self.thinking is not None:
+            try:
+                kind, value = self.results.get_nowait()
+            except queue.Empty:
+                self.root.after(POLL_INTERVAL, lambda: self.poll())
+                return
+            if kind == "progress":
+                self.show_progress(value)
+            else:
+                player_obj = self.thinking
+                self.thinking = None
+                self.move_now_button["state"] = DISABLED
+                self.ai_moved(player_obj, kind, value)
+
+    def show_progress(self, info):
+        text = "{}: depth {}{}, {} nodes in {}s".format(
+            self.thinking.name, info.get("depth"), "" if info.get("completed") == "1" else " (searching)",
+            info.get("nodes"), info.get("time"))
+        if "move" in info:
+            text += ", best {} (value {})".format(info["move"], info["value"])
+        self.progress_label["text"] = text
+
+    def ai_moved(self, player_obj, kind, value):
+        if self.over:
+            return
+        if kind == "timeout":
             self.shutdown("Game Over, {} lost (timeout)".format(player_obj.name))
+            return
+        if kind == "error":
+            self.shutdown("Game Over, {} failed ({})".format(player_obj.name, value))
+            return
+        if self.cancelled:
+            self.cancelled = False
+            self.log("{}: move {},{} discarded".format(player_obj.name, *value))
+            if self.paused:
+                self.progress_label["text"] = "Paused"
+            else: # resumed before the move came back: ask again
+                self.root.after(1, lambda: self.ai_move())
+            return
+        i,j = value
+        player = "Dark" if self.game.current_player == 1 else "Light"
+        player = "{} {}".format(player_obj.name, player)
+        self.log("{}: {},{}".format(player, i,j))
+        try:
+            self.game.play(i,j)
+        except InvalidMoveError:
+            self.shutdown("Game Over, {} lost (invalid move {},{})".format(player_obj.name, i, j))
+            return
+        self.draw_board()
+        if not get_possible_moves(self.game.board, self.game.current_player):
+            self.shutdown("Game Over")
+        elif isinstance(self.players[self.game.current_player], AiPlayerInterface):
+            self.root.after(1, lambda: self.ai_move())
+        else: 
+            self.root.bind("<Button-1>",lambda e: self.mouse_pressed(e))        
+
+    def move_now(self):
+        if self.thinking is not None:
+            self.thinking.stop()
+
+    def pause(self):
+        """
+        Pause: stop the AI that is thinking and discard its move, and do
+        not start the next AI move. Resume: ask the AI to move again.
+        """
+        if not self.paused:
+            self.paused = True
+            self.pause_button["text"] = "Resume"
+            if self.thinking is not None:
+                self.cancelled = True
+                self.thinking.stop()
+            else:
+                self.progress_label["text"] = "Paused"
+        else:
+            self.paused = False
+            self.pause_button["text"] = "Pause"
+            self.progress_label["text"] = ""
+            if self.thinking is None and isinstance(self.players[self.game.current_player], AiPlayerInterface):
+                self.ai_move()
 
     def run(self):
         if isinstance(self.players[1], AiPlayerInterface):
@@ -132,17 +256,29 @@ def main(argv):
     ordering = False
     caching = False
     minimax = False        
+    time_limit = None
+    workers = None
+    parallel = None
+    compact = False
+    ponder = None
+    pvs = None
+    evaluation = None
+    patterns = None
+    probcut = None
+    stats = None
+    endgame = None
+    wld = None
     agent1 = None
     agent2 = None
 
     try:
-        opts, args = getopt.getopt(argv,"hcmol:d:a:b:",["limit=","dimension=","agent1=","agent2="])
+        opts, args = getopt.getopt(argv,"hcmol:d:a:b:t:w:",["limit=","dimension=","agent1=","agent2=","time=","workers=","parallel=","compact","ponder","pvs","heuristic","patterns=","probcut=","stats=","endgame=","wld="])
     except getopt.GetoptError:
-        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -c -o -m]')
+        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -t <seconds> -w <workers> -c -o -m --ponder --pvs --heuristic --patterns=<file> --probcut=<file> --stats=<dest> --endgame=<empties> --wld=<empties>]')
         sys.exit(2)
     for opt, arg in opts:
         if opt == '-h':
-            print('othello_gui.py -d <dimension> -a <agentA> [-b <agentB> -l <depth-limit> -c -o]')
+            print('othello_gui.py -d <dimension> -a <agentA> [-b <agentB> -l <depth-limit> -t <seconds> -w <workers> -c -o --ponder --pvs --heuristic --patterns=<file> --probcut=<file> --stats=<dest> --endgame=<empties> --wld=<empties>]')
             sys.exit()
         elif opt in ("-d", "--dimension"):
             size = int(arg)
@@ -158,18 +294,43 @@ def main(argv):
             ordering = True   
         elif opt in ("-l", "--limit"):
             limit = int(arg)  
+        elif opt in ("-t", "--time"):
+            time_limit = float(arg)
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+        elif opt == "--parallel":
+            parallel = arg
+        elif opt == "--compact":
+            compact = True
+        elif opt == "--ponder":
+            ponder = 1
+        elif opt == "--pvs":
+            pvs = 1
+        elif opt == "--heuristic":
+            evaluation = "heuristic"
+        elif opt == "--patterns":
+            evaluation = "patterns"
+            patterns = arg
+        elif opt == "--probcut":
+            probcut = arg
+        elif opt == "--stats":
+            stats = arg
+        elif opt == "--endgame":
+            endgame = int(arg)
+        elif opt == "--wld":
+            wld = int(arg)
 
     if size <= 0: #if no dimension provided
         print('Please provide a board size.')
-        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -c -o]')
+        print('othello_gui.py -d <dimension> [-a <agentA> -b <agentB> -l <depth-limit> -t <seconds> -w <workers> -c -o --ponder --pvs --heuristic --patterns=<file> --probcut=<file> --stats=<dest> --endgame=<empties> --wld=<empties>]')
         sys.exit(2)  
 
     if agent1 != None and agent2 != None and size > 0:
-        p1 = AiPlayerInterface(agent1,1,limit,minimax,caching,ordering)
-        p2 = AiPlayerInterface(agent2,2,limit,minimax,caching,ordering)        
+        p1 = AiPlayerInterface(agent1,1,limit,minimax,caching,ordering,time_limit,compact,workers=workers,parallel=parallel,ponder=ponder,pvs=pvs,eval=evaluation,patterns=patterns,probcut=probcut,stats=stats,endgame=endgame,wld=wld,progress=1)
+        p2 = AiPlayerInterface(agent2,2,limit,minimax,caching,ordering,time_limit,compact,workers=workers,parallel=parallel,ponder=ponder,pvs=pvs,eval=evaluation,patterns=patterns,probcut=probcut,stats=stats,endgame=endgame,wld=wld,progress=1)        
     elif agent1 != None and size > 0:
         p1 = Player(1)
-        p2 = AiPlayerInterface(agent1,2,limit,minimax,caching,ordering)
+        p2 = AiPlayerInterface(agent1,2,limit,minimax,caching,ordering,time_limit,compact,workers=workers,parallel=parallel,ponder=ponder,pvs=pvs,eval=evaluation,patterns=patterns,probcut=probcut,stats=stats,endgame=endgame,wld=wld,progress=1)
     else: 
         p1 = Player(1)
         p2 = Player(2)
@@ -0,0 +1,249 @@
+"""
+Parallel alpha-beta search for the agent in agent.py.
+
+The search runs on a pool of worker processes that is started once per game
+and supports two modes:
+
+root   Root splitting. The root moves are handed out to the workers one at a
+       time. Workers share the best value found so far and use it as alpha
+       for every move they start searching.
+smp    Lazy SMP. Every worker runs its own iterative deepening search of the
+       whole position. The workers share one transposition table in shared
+       memory, so each of them profits from what the others have searched.
+"""
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+import agent
+from othello_bitboard import geometry, get_moves, get_flips, iter_squares
+from othello_tt import SharedTranspositionTable, zobrist
+
+MODES = ("root", "smp")
+
+# State of a worker process, set up by _init_worker. The search context
+# lives as long as the worker, that is for the whole game, or for several
+# games if the agent plays on after NEWGAME (see ParallelSearch.new_game).
+_alpha = None
+_context = None
+_game = None # the number of the game, as shared with the agent
+_played = 0 # the number of the game the context was last used in
+_shared = False
+_root = None # the key of the root the context was last set up for
+
+
+def _watch_parent(parent):
+    # The game manager kills the agent without warning when the game is
+    # over. Make sure its workers do not outlive it.
+    while True:
+        time.sleep(1)
+        if os.getppid() != parent:
+            os._exit(0)
+
+
+def _init_worker(alpha, stop, game, table, megabytes):
+    global _alpha, _context, _game, _shared
+    _alpha = alpha
+    _game = game
+    _shared = table is not None
+    if table is not None:
+        _context = agent.SearchContext(SharedTranspositionTable(table))
+    else:
+        _context = agent.SearchContext(megabytes = megabytes)
+    _context.stop_flag = stop
+    thread = threading.Thread(target=_watch_parent, args=(os.getppid(),))
+    thread.daemon = True
+    thread.start()
+
+
+def _start(position, caching, ordering, deadline):
+    """
+    Set up the worker's search context for the root position. A worker
+    takes many root moves of the same search; the context is only set up
+    once for them, so that history scores fade once per search.
+    """
+    global _played, _root
+    own, opp, color, key, dim = position
+    if _played != _game.value:
+        # The agent clears a shared table itself, while no worker searches
+        _context.new_game(not _shared)
+        _played = _game.value
+        _root = None
+    if key != _root:
+        _context.begin(own, opp, key, geometry(dim), caching, ordering)
+        _root = key
+    else:
+        _context.caching = caching
+        _context.ordering = ordering
+    # Deadlines are passed between processes as time.time() values. Without
+    # one the search still has to watch the stop flag, so use an endless one.
+    if deadline is None:
+        _context.deadline = math.inf
+    else:
+        _context.deadline = time.perf_counter() + (deadline - time.time())
+
+
+def _search_root_move(task):
+    """
+    Search a single root move. Returns (square, value, alpha used), with
+    value None if the deadline passed first.
+    """
+    own, opp, color, key, dim, sq, depth, caching, ordering, deadline = task
+    geo = geometry(dim)
+    _start(task[:5], caching, ordering, deadline)
+    alpha = _alpha.value
+    flips = get_flips(own, opp, sq, geo)
+    change = flips | (1 << sq)
+    try:
+        nxt_move, nxt_val = agent._alphabeta(_context, opp & ~change, own | change,
+                                             3 - color,
+                                             zobrist(dim).update(key, color, sq, flips),
+                                             -math.inf, -alpha, depth - 1, 1)
+    except agent.SearchTimeout:
+        return sq, None, alpha
+    finally:
+        _context.deadline = None
+    value = -nxt_val
+    if value > alpha:
+        with _alpha.get_lock():
+            if value > _alpha.value:
+                _alpha.value = value
+    return sq, value, alpha
+
+
+def _search_lazy_smp(task):
+    """
+    Iterative deepening over the whole position. Returns (depth, worker,
+    best square) for the deepest iteration that completed.
+    """
+    own, opp, color, key, dim, order, max_depth, ordering, deadline, worker = task
+    _start(task[:5], 1, ordering, deadline)
+    # Helpers start every other one a ply deeper and with the root moves
+    # rotated, so that they do not all search the same tree in lockstep.
+    shift = worker % len(order)
+    order = order[shift:] + order[:shift]
+    result = (0, worker, order[0])
+    try:
+        for depth, best_move, value in agent._iterate(_context, own, opp, color, key,
+                                                      order, max_depth,
+                                                      min(1 + worker % 2, max_depth)):
+            result = (depth, worker, best_move)
+    except agent.SearchTimeout:
+        pass
+    finally:
+        _context.deadline = None
+    return result
+
+
+class ParallelSearch(object):
+    """
+    A pool of search processes for one game, or for several with new_game
+    in between. Call close() when they are no longer needed.
+    """
+
+    def __init__(self, workers, mode = "root", megabytes = 64):
+        if mode not in MODES:
+            raise ValueError("Unknown parallel search mode: {}".format(mode))
+        self.workers = workers
+        self.mode = mode
+        self.alpha = multiprocessing.Value("d", -math.inf)
+        self.stop = multiprocessing.RawValue("b", 0)
+        self.game = multiprocessing.RawValue("i", 0)
+        self.table = None
+        if mode == "smp":
+            self.table = SharedTranspositionTable(SharedTranspositionTable.allocate(megabytes))
+        self.pool = multiprocessing.Pool(workers, _init_worker,
+                                         (self.alpha, self.stop, self.game,
+                                          None if self.table is None else self.table.array,
+                                          max(megabytes // workers, 1)))
+
+    def new_game(self):
+        """
+        Make the workers forget the last game before they search the next.
+        """
+        self.game.value += 1
+        if self.table is not None:
+            self.table.clear()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def select_move(self, board, color, limit = -1, time_limit = 0, caching = 0, ordering = 0):
+        """
+        The parallel counterpart of agent.select_move_alphabeta (or of
+        agent.select_move_timed if time_limit is positive).
+        """
+        start = time.time()
+        own, opp, key, geo = agent._root(board, color)
+        moves = get_moves(own, opp, geo)
+
+        if not moves:
+            return None
+
+        deadline = None
+        if time_limit > 0:
+            deadline = start + time_limit * agent.TIME_SAFETY
+        if ordering == 1:
+            order = agent._order(own, opp, moves, geo)
+        else:
+            order = list(iter_squares(moves))
+        position = (own, opp, color, key, geo.dim)
+
+        if self.mode == "smp":
+            best_move = self._lazy_smp(position, order,
+                                       agent._max_depth(own, opp, geo, limit),
+                                       ordering, deadline)
+        elif deadline is None:
+            depth = max(agent._depth(limit, own, opp, geo), 1)
+            best_move = self._root_split(position, order, depth, caching,
+                                         ordering, None)
+        else:
+            # Iterative deepening, each iteration split over the workers
+            best_move = order[0]
+            for depth in range(1, agent._max_depth(own, opp, geo, limit) + 1):
+                iter_best = self._root_split(position, order, depth, 1,
+                                             ordering, deadline)
+                if iter_best is None:
+                    break
+                best_move = iter_best
+                order.remove(best_move)
+                order.insert(0, best_move)
+                if time.time() - start > time_limit * agent.TIME_SAFETY / 2:
+                    break
+        return geo.coords[best_move]
+
+    def _root_split(self, position, order, depth, caching, ordering, deadline):
+        """
+        Search the root moves in parallel. Returns the best square, or None
+        if the deadline passed before all moves were searched.
+        """
+        self.alpha.value = -math.inf
+        tasks = [position + (sq, depth, caching, ordering, deadline)
+                 for sq in order]
+        best_move = None
+        value = -math.inf
+        for sq, nxt_val, alpha in self.pool.imap(_search_root_move, tasks):
+            if nxt_val is None:
+                return None
+            # A move that did not beat the alpha it was searched with only
+            # returned an upper bound, so it cannot be the best move.
+            if nxt_val > alpha and nxt_val > value:
+                best_move, value = sq, nxt_val
+        return best_move
+
+    def _lazy_smp(self, position, order, max_depth, ordering, deadline):
+        self.stop.value = 0
+        tasks = [position + (order, max_depth, ordering, deadline, worker)
+                 for worker in range(self.workers)]
+        results = []
+        for result in self.pool.imap_unordered(_search_lazy_smp, tasks):
+            if result[0] == max_depth:
+                # One worker is done, the others can stop
+                self.stop.value = 1
+            results.append(result)
+        self.stop.value = 0
+        depth, worker, best_move = max(results, key=lambda r: (r[0], -r[1]))
+        return best_move
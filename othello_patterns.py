@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pattern-based evaluation: the value of a position is a sum of weights
+looked up in tables, one per pattern of squares, as in Logistello.
+
+A pattern is a fixed set of squares, such as an edge or the 3x3 block at
+a corner. Each of its squares is empty (0), owned by dark (1) or by light
+(2), so a pattern on k squares is in one of 3^k configurations, and its
+base-3 code indexes a table of weights. All the images of a pattern under
+the symmetries of the board are instances of one pattern class and share
+its table. Tables are kept separately for each game phase, by the number
+of discs on the board.
+
+The patterns on a board of dimension dim (those that fit):
+
+  edge         a row or column along the edge
+  corner       the 3x3 block at a corner
+  line2-line4  the second to fourth row or column from the edge
+  diag4-diag   the diagonals of 4 squares up to the main diagonal
+
+The weights are fitted offline to predict the final disc difference of
+self-play games, by stochastic gradient descent, and kept in a binary
+file:
+
+  header   magic "OTHPAT01", dimension (1 byte), phases (1 byte), weight
+           count (4 bytes)
+  weights  int16 in units of 1/UNIT disc, phase by phase, then by pattern
+           class in the order above, then by code
+
+all little-endian. PatternEvaluator evaluates positions from scratch, or,
+for the search, keeps the codes of all pattern instances up to date as
+moves are made and unmade, so that evaluating costs one lookup per
+instance.
+
+Example: play 2000 self-play games and fit weights to them (games can
+also come from othello_tournament.py result files)
+  $python3 othello_patterns.py -d 8 -g 2000 -l 2 -j 8 -r games.jsonl -o othello_patterns.bin
+"""
+import array
+import getopt
+import json
+import multiprocessing
+import random
+import struct
+import sys
+import time
+
+from othello_bitboard import geometry, from_board, popcount, iter_squares
+from othello_symmetry import symmetries
+
+MAGIC = b"OTHPAT01"
+HEADER = struct.Struct("<8sBBI")
+# Weights are stored in 1/UNIT of a disc
+UNIT = 32
+PHASES = 4
+
+USAGE = ("othello_patterns.py -d <dimension> [-g <games> -l <depth-limit> -p <random plies> "
+         "-j <jobs> -w <weights for self-play> -r <games.jsonl>] [-i <games.jsonl> ... "
+         "-e <epochs> -o <weights file>]")
+
+
+class Patterns(object):
+    """
+    The pattern classes and their instances for one board dimension. Use
+    patterns(dim) to get the shared instance.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        geo = geometry(dim)
+        sym = symmetries(dim)
+        shapes = [("edge", [(i, 0) for i in range(dim)])]
+        if dim >= 6:
+            shapes.append(("corner", [(0, 0), (1, 0), (0, 1), (1, 1), (2, 0), (0, 2),
+                                      (2, 1), (1, 2), (2, 2)]))
+        for k in range(1, min(4, dim // 2)):
+            shapes.append(("line{}".format(k + 1), [(i, k) for i in range(dim)]))
+        for length in range(4, dim + 1):
+            shapes.append(("diag{}".format(length),
+                           [(i, i + dim - length) for i in range(length)]))
+
+        self.names = []
+        self.lengths = []
+        self.instances = [] # the squares of every instance, in code order
+        self.classes = [] # the class of every instance
+        for c, (name, shape) in enumerate(shapes):
+            base = [geo.square(i, j) for i, j in shape]
+            seen = set()
+            for t in range(8):
+                squares = [sym.square(sq, t) for sq in base]
+                if frozenset(squares) not in seen:
+                    seen.add(frozenset(squares))
+                    self.instances.append(squares)
+                    self.classes.append(c)
+            self.names.append(name)
+            self.lengths.append(len(shape))
+        # offsets[c]: where the table of class c starts within a phase
+        self.offsets = []
+        self.phase_size = 0
+        for length in self.lengths:
+            self.offsets.append(self.phase_size)
+            self.phase_size += 3 ** length
+        # For every square, the (instance, power of 3) pairs it contributes to
+        self.contributions = [[] for _ in range(geo.size)]
+        for n, squares in enumerate(self.instances):
+            for k, sq in enumerate(squares):
+                self.contributions[sq].append((n, 3 ** (len(squares) - 1 - k)))
+
+    def codes(self, own, opp):
+        """
+        Return the code of every instance, with own discs as 1 and opp
+        discs as 2.
+        """
+        codes = [0] * len(self.instances)
+        contributions = self.contributions
+        for sq in iter_squares(own):
+            for n, power in contributions[sq]:
+                codes[n] += power
+        for sq in iter_squares(opp):
+            for n, power in contributions[sq]:
+                codes[n] += 2 * power
+        return codes
+
+    def features(self, own, opp, phase):
+        """
+        Return the positions in the weight array of the weights that make
+        up the value of a position.
+        """
+        base = phase * self.phase_size
+        offsets = self.offsets
+        classes = self.classes
+        return [base + offsets[classes[n]] + code
+                for n, code in enumerate(self.codes(own, opp))]
+
+
+_patterns = {}
+
+def patterns(dim):
+    p = _patterns.get(dim)
+    if p is None:
+        p = _patterns[dim] = Patterns(dim)
+    return p
+
+
+def phase_of(discs, size, phases):
+    """
+    The game phase of a position with the given number of discs.
+    """
+    return min(phases - 1, max(discs - 4, 0) * phases // (size - 3))
+
+
+def _swap_colors(code, length):
+    # The code of the same configuration with dark and light exchanged
+    swapped = 0
+    power = 1
+    for _ in range(length):
+        digit = code % 3
+        code //= 3
+        swapped += (0, 2, 1)[digit] * power
+        power *= 3
+    return swapped
+
+
+############ WEIGHT FILES ##########################
+def read_weights(filename):
+    """
+    Read a weight file. Returns (dim, phases, weights), with the weights in
+    units of 1/UNIT disc.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    magic, dim, phases, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a pattern weight file: {}".format(filename))
+    if count != phases * patterns(dim).phase_size:
+        raise ValueError("Pattern weight file does not match the patterns: {}".format(filename))
+    weights = array.array("h")
+    weights.frombytes(data[HEADER.size:HEADER.size + 2 * count])
+    if sys.byteorder != "little":
+        weights.byteswap()
+    return dim, phases, weights.tolist()
+
+
+def write_weights(filename, dim, phases, weights):
+    """
+    Write a weight file. weights are in discs and may be floats.
+    """
+    out = array.array("h", (max(-32768, min(32767, int(round(w * UNIT)))) for w in weights))
+    if sys.byteorder != "little":
+        out.byteswap()
+    with open(filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, dim, phases, len(out)))
+        f.write(out.tobytes())
+
+
+############ EVALUATION ############################
+class PatternEvaluator(object):
+    """
+    Evaluates positions of one board dimension with a set of weights. It
+    serves as the evaluator of agent.py's search, with the same interface
+    as othello_eval, and also tracks the moves of the search itself: after
+    reset() at the root, make() and unmake() keep the codes of all the
+    pattern instances up to date, and value() and leaf() use them.
+    """
+
+    incremental = True
+
+    def __init__(self, dim, phases, weights):
+        self.patterns = p = patterns(dim)
+        self.geo = geometry(dim)
+        self.phases = phases
+        self.phase = [phase_of(discs, self.geo.size, phases) for discs in range(self.geo.size + 1)]
+        # tables[player][phase][n]: the weights of instance n with player to
+        # move. The codes the search tracks have dark as 1 and light as 2,
+        # so light's tables are indexed by the code with the colors swapped.
+        swapped = [[_swap_colors(code, length) for code in range(3 ** length)]
+                   for length in p.lengths]
+        self.tables = [None, [], []]
+        for phase in range(phases):
+            dark = []
+            light = []
+            for c in range(len(p.lengths)):
+                start = phase * p.phase_size + p.offsets[c]
+                table = weights[start:start + 3 ** p.lengths[c]]
+                dark.append(table)
+                light.append([table[code] for code in swapped[c]])
+            self.tables[1].append([dark[c] for c in p.classes])
+            self.tables[2].append([light[c] for c in p.classes])
+        self.codes = None
+        self.discs = 0
+        self.stack = []
+
+    @classmethod
+    def load(cls, filename):
+        dim, phases, weights = read_weights(filename)
+        return cls(dim, phases, weights)
+
+    @staticmethod
+    def _round(total):
+        return (total + UNIT // 2) // UNIT
+
+    def evaluate(self, own, opp, geo):
+        """
+        Value of a single position, in discs, for the player whose discs
+        are own. Computed from scratch.
+        """
+        tables = self.tables[1][self.phase[popcount(own | opp)]]
+        return self._round(sum(t[code] for t, code in zip(tables, self.patterns.codes(own, opp))))
+
+    def evaluate_batch(self, own, opp, geo):
+        return [self.evaluate(o, p, geo) for o, p in zip(own, opp)]
+
+    @staticmethod
+    def final(own, opp):
+        """
+        Value of a finished game.
+        """
+        return popcount(own) - popcount(opp)
+
+    # Incremental evaluation along the moves of the search
+    def reset(self, own, opp, player):
+        """
+        Start tracking from the root position of a search.
+        """
+        dark, light = (own, opp) if player == 1 else (opp, own)
+        self.codes = self.patterns.codes(dark, light)
+        self.discs = popcount(own | opp)
+        self.stack = []
+
+    def make(self, sq, flips, player):
+        """
+        Player plays on sq, flipping the discs in flips.
+        """
+        self.stack.append(self.codes)
+        codes = self.codes[:]
+        contributions = self.patterns.contributions
+        for n, power in contributions[sq]:
+            codes[n] += player * power
+        change = 2 * player - 3 # a flipped disc goes from 3 - player to player
+        for f in iter_squares(flips):
+            for n, power in contributions[f]:
+                codes[n] += change * power
+        self.codes = codes
+        self.discs += 1
+
+    def unmake(self):
+        self.codes = self.stack.pop()
+        self.discs -= 1
+
+    def value(self, player):
+        """
+        Value of the tracked position for player, who is to move.
+        """
+        tables = self.tables[player][self.phase[self.discs]]
+        return self._round(sum(t[code] for t, code in zip(tables, self.codes)))
+
+    def leaf(self, sq, flips, player):
+        """
+        Value of the position after player plays on sq, for the opponent.
+        """
+        self.make(sq, flips, player)
+        value = self.value(3 - player)
+        self.unmake()
+        return value
+
+
+############ SELF-PLAY #############################
+def _play_game(task):
+    """
+    Play one self-play game. The first plies are random, the rest are
+    searched to the depth limit with the heuristic evaluation, or with
+    pattern weights if a weight file is given. Returns a game record as
+    othello_tournament.py writes them.
+    """
+    import agent
+    import othello_eval
+    from othello_game import OthelloGameManager
+    from othello_shared import get_possible_moves, get_score
+    from othello_tournament import move_to_str
+    number, dim, depth, random_plies, weights = task
+    rng = random.Random(number)
+    game = OthelloGameManager(dim)
+    ctx = agent.SearchContext()
+    ctx.set_evaluator(PatternEvaluator.load(weights) if weights else othello_eval)
+    moves = []
+    while True:
+        legal = get_possible_moves(game.board, game.current_player)
+        if not legal:
+            break
+        if len(moves) < random_plies:
+            move = rng.choice(legal)
+        else:
+            move = agent.select_move_alphabeta(game.board, game.current_player, depth, 1, 1, ctx)
+        game.play(*move)
+        moves.append(move_to_str(*move))
+    dark_score, light_score = get_score(game.board)
+    return {"game": number, "opening": "", "moves": moves,
+            "dark_score": dark_score, "light_score": light_score}
+
+
+def play_games(dim, games, depth, random_plies, jobs = None, weights = None):
+    """
+    Play self-play games on a pool of worker processes. Yields the game
+    records as they finish.
+    """
+    tasks = [(number, dim, depth, random_plies, weights) for number in range(games)]
+    with multiprocessing.Pool(jobs) as pool:
+        for record in pool.imap_unordered(_play_game, tasks):
+            yield record
+
+
+############ TRAINING ##############################
+def read_samples(filenames, dim, phases):
+    """
+    Read game records (JSONL, as written by the self-play above or by
+    othello_tournament.py) and return the training samples: for every
+    position of every game, (features, final disc difference for the
+    player to move).
+    """
+    from othello_game import OthelloGameManager
+    from othello_tournament import parse_moves
+    p = patterns(dim)
+    size = dim * dim
+    samples = []
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("timeout"):
+                    continue
+                game = OthelloGameManager(dim)
+                positions = []
+                for i, j in parse_moves(record["opening"]) + parse_moves(" ".join(record["moves"])):
+                    positions.append((from_board(game.board), game.current_player))
+                    game.play(i, j)
+                result = record["dark_score"] - record["light_score"]
+                for (dark, light), player in positions:
+                    own, opp = (dark, light) if player == 1 else (light, dark)
+                    phase = phase_of(popcount(dark | light), size, phases)
+                    samples.append((p.features(own, opp, phase),
+                                    result if player == 1 else -result))
+    return samples
+
+
+def train(samples, dim, phases = PHASES, epochs = 20, rate = 0.005, verbose = True):
+    """
+    Fit the weights to the samples by stochastic gradient descent on the
+    squared error. Returns the weights, in discs.
+    """
+    weights = [0.0] * (phases * patterns(dim).phase_size)
+    rng = random.Random(0)
+    order = list(range(len(samples)))
+    for epoch in range(epochs):
+        start = time.time()
+        rng.shuffle(order)
+        error = 0.0
+        for s in order:
+            features, target = samples[s]
+            e = target - sum(weights[k] for k in features)
+            error += e * e
+            step = rate * e
+            for k in features:
+                weights[k] += step
+        if verbose:
+            print("Epoch {}: RMS error {:.2f} discs in {:.1f}s".format(
+                epoch, (error / max(len(samples), 1)) ** 0.5, time.time() - start), file=sys.stderr)
+    return weights
+
+
+def main(argv):
+
+    size = 0
+    games = 0
+    depth = 2
+    random_plies = 10
+    jobs = None
+    selfplay_weights = None
+    record_file = None
+    inputs = []
+    epochs = 20
+    output = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hd:g:l:p:j:w:r:i:e:o:",
+                                   ["dimension=", "games=", "limit=", "plies=", "jobs=", "weights=",
+                                    "record=", "input=", "epochs=", "output="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-g", "--games"):
+            games = int(arg)
+        elif opt in ("-l", "--limit"):
+            depth = int(arg)
+        elif opt in ("-p", "--plies"):
+            random_plies = int(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-w", "--weights"):
+            selfplay_weights = arg
+        elif opt in ("-r", "--record"):
+            record_file = arg
+        elif opt in ("-i", "--input"):
+            inputs.append(arg)
+        elif opt in ("-e", "--epochs"):
+            epochs = int(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    if size <= 0 or (games > 0 and record_file is None) or (games == 0 and output is None):
+        print(USAGE)
+        sys.exit(2)
+
+    if games > 0:
+        start = time.time()
+        with open(record_file, "w") as f:
+            for n, record in enumerate(play_games(size, games, depth, random_plies, jobs,
+                                                  selfplay_weights)):
+                f.write(json.dumps(record) + "\n")
+                if (n + 1) % 100 == 0:
+                    print("{} games in {:.1f}s".format(n + 1, time.time() - start), file=sys.stderr)
+        inputs.append(record_file)
+
+    if output is not None:
+        samples = read_samples(inputs, size, PHASES)
+        print("{} positions".format(len(samples)), file=sys.stderr)
+        weights = train(samples, size, PHASES, epochs)
+        write_weights(output, size, PHASES, weights)
+        print("Wrote {} weights to {}".format(len(weights), output))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Correctness checks for move generators: perft and differential testing.
+
+A move generator ("engine") is a pair of functions on boards in the
+tuple-of-rows format, with the signatures of othello_shared:
+get_possible_moves(board, player) and play_move(board, player, i, j). The
+built-in ones are
+
+- shared: othello_shared, the reference
+- lines: moves and flips found square by square with find_lines, without
+  bitboards
+- bitboard: othello_bitboard.BitBoard
+- search: othello_bitboard.SearchBoard, with make_move and unmake_move
+
+and any other module given by its file name (for example my_engine.py)
+that defines both functions.
+
+perft counts the leaves of the game tree from a position, cut at a depth.
+A game that ends before the depth is reached counts as one leaf. There are
+no passes: a side without moves ends the game, as in othello_game.py. From
+the start position the counts must equal PERFT. Divide lists the count
+below each move of the position, to find the move where two engines part.
+
+The differential tester plays random games through a reference and an
+alternative engine on a pool of worker processes. At every position it
+compares the moves of both players, so that the end of the game is
+detected the same way, and after every move the resulting boards. Each
+difference is reported with the moves that lead to it.
+
+Examples:
+  $python3 othello_perft.py -d 8 -n 8 --divide
+  $python3 othello_perft.py -d 8 -n 5 -m f5d6c3 -e lines
+  $python3 othello_perft.py -d 4 -d 6 -d 8 -g 100000 -a my_engine.py -j 8
+"""
+import getopt
+import multiprocessing
+import random
+import sys
+import time
+
+from othello_bitboard import (geometry, from_board, get_moves, get_flips, iter_squares, popcount,
+                              BitBoard, SearchBoard)
+from othello_game import OthelloGameManager
+import othello_shared
+from othello_shared import find_lines, board_from_string
+from othello_tournament import move_to_str, parse_moves
+
+# Leaves of the game tree from the start position, by depth
+PERFT = {
+    4: [4, 12, 44, 128, 424, 1244, 3572, 8900, 19176, 33928, 44064, 44064],
+    6: [4, 12, 56, 244, 1364, 7604, 47740],
+    8: [4, 12, 56, 244, 1396, 8200, 55092, 390216],
+}
+
+# Games per task of the differential tester
+CHUNK = 100
+
+USAGE = ("othello_perft.py -d <dimension> ... [-n <depth> -m <moves> | -s <board> -p <player>] "
+         "[-e <engine> --divide] [-g <games> -r <reference> -a <alternative> -j <jobs> "
+         "--seed <seed> --max-failures <n>]")
+
+
+############ ENGINES ###############################
+def lines_moves(board, player):
+    n = len(board)
+    return [(i, j) for i in range(n) for j in range(n)
+            if board[j][i] == 0 and find_lines(board, i, j, player)]
+
+
+def lines_play(board, player, i, j):
+    rows = [list(row) for row in board]
+    rows[j][i] = player
+    for line in find_lines(board, i, j, player):
+        for u, v in line:
+            rows[v][u] = player
+    return tuple(tuple(row) for row in rows)
+
+
+def bitboard_moves(board, player):
+    return BitBoard.from_board(board, player).get_possible_moves()
+
+
+def bitboard_play(board, player, i, j):
+    return BitBoard.from_board(board, player).play(i, j).to_board()
+
+
+def search_moves(board, player):
+    position = SearchBoard.from_board(board, player)
+    coords = position.geo.coords
+    return [coords[sq] for sq in position.moves()]
+
+
+def search_play(board, player, i, j):
+    # Make, unmake and make again, so that unmake_move is checked too
+    position = SearchBoard.from_board(board, player)
+    sq = position.geo.square(i, j)
+    position.unmake_move(position.make_move(sq))
+    if position.to_board() != tuple(tuple(row) for row in board):
+        raise AssertionError("unmake_move does not restore the board")
+    position.make_move(sq)
+    return position.to_board()
+
+
+ENGINES = {
+    "shared": (othello_shared.get_possible_moves, othello_shared.play_move),
+    "lines": (lines_moves, lines_play),
+    "bitboard": (bitboard_moves, bitboard_play),
+    "search": (search_moves, search_play),
+}
+
+
+def load_engine(name):
+    """
+    (get_possible_moves, play_move) of a built-in engine or of the module
+    in the file name.
+    """
+    if name in ENGINES:
+        return ENGINES[name]
+    from othello_game import load_agent
+    module = load_agent(name)
+    return module.get_possible_moves, module.play_move
+
+
+############ PERFT #################################
+def perft_bitboard(own, opp, depth, geo):
+    """
+    perft on bitboards, for the player owning own.
+    """
+    moves = get_moves(own, opp, geo)
+    if not moves:
+        return 1
+    if depth == 1:
+        return popcount(moves)
+    count = 0
+    for sq in iter_squares(moves):
+        change = get_flips(own, opp, sq, geo) | (1 << sq)
+        count += perft_bitboard(opp & ~change, own | change, depth - 1, geo)
+    return count
+
+
+def perft(engine, board, player, depth):
+    """
+    Leaves of the game tree below the position, cut at depth, with the
+    moves of engine, a (get_possible_moves, play_move) pair.
+    """
+    if depth == 0:
+        return 1
+    if engine is ENGINES["bitboard"]:
+        dark, light = from_board(board)
+        geo = geometry(len(board))
+        if player == 1:
+            return perft_bitboard(dark, light, depth, geo)
+        return perft_bitboard(light, dark, depth, geo)
+    get_possible_moves, play_move = engine
+    moves = get_possible_moves(board, player)
+    if not moves:
+        return 1
+    if depth == 1:
+        return len(moves)
+    return sum(perft(engine, play_move(board, player, i, j), 3 - player, depth - 1)
+               for i, j in moves)
+
+
+def divide(engine, board, player, depth):
+    """
+    perft below each move of the position, as a list of (move, leaves).
+    """
+    get_possible_moves, play_move = engine
+    return [((i, j), perft(engine, play_move(board, player, i, j), 3 - player, depth - 1))
+            for i, j in sorted(get_possible_moves(board, player))]
+
+
+############ DIFFERENTIAL TESTING ##################
+def _board(board):
+    return tuple(tuple(row) for row in board)
+
+
+def _compare_game(reference, alternative, dim, rng):
+    """
+    Play one random game through both engines. Returns (positions, moves
+    compared, failure), where failure is None or a dict describing the
+    first difference.
+    """
+    ref_moves, ref_play = reference
+    alt_moves, alt_play = alternative
+    board = _board(OthelloGameManager(dim).board)
+    player = 1
+    played = []
+    positions = compared = 0
+
+    def failure(check, expected, found):
+        return {"dimension": dim, "moves": "".join(played), "player": player, "check": check,
+                "reference": expected, "alternative": found}
+
+    while True:
+        positions += 1
+        moves = None
+        for color in (player, 3 - player):
+            expected = sorted(ref_moves(board, color))
+            try:
+                found = sorted(alt_moves(board, color))
+            except Exception as e:
+                return positions, compared, failure("moves of player {}".format(color), expected, repr(e))
+            if found != expected:
+                return positions, compared, failure("moves of player {}".format(color), expected, found)
+            compared += len(expected)
+            if moves is None:
+                moves = expected
+        if not moves:
+            return positions, compared, None
+        i, j = rng.choice(moves)
+        expected = _board(ref_play(board, player, i, j))
+        try:
+            found = _board(alt_play(board, player, i, j))
+        except Exception as e:
+            return positions, compared, failure("play " + move_to_str(i, j), expected, repr(e))
+        if found != expected:
+            return positions, compared, failure("play " + move_to_str(i, j), expected, found)
+        played.append(move_to_str(i, j))
+        board = expected
+        player = 3 - player
+
+
+def _compare_games(task):
+    """
+    Play a chunk of games. The task is (seed, games, dimensions, reference,
+    alternative).
+    """
+    seed, games, dims, reference, alternative = task
+    rng = random.Random(seed)
+    reference = load_engine(reference)
+    alternative = load_engine(alternative)
+    result = {"games": 0, "positions": 0, "moves": 0, "failures": []}
+    for _ in range(games):
+        positions, compared, failure = _compare_game(reference, alternative, rng.choice(dims), rng)
+        result["games"] += 1
+        result["positions"] += positions
+        result["moves"] += compared
+        if failure is not None:
+            result["failures"].append(failure)
+    return result
+
+
+def compare_engines(reference, alternative, dims, games, jobs = None, seed = 0):
+    """
+    Play games random games on a pool of worker processes, on boards of
+    the given dimensions. Yields the result of each chunk of games as it
+    finishes.
+    """
+    tasks = []
+    for n, start in enumerate(range(0, games, CHUNK)):
+        tasks.append((seed * 1000003 + n, min(CHUNK, games - start), dims, reference, alternative))
+    with multiprocessing.Pool(jobs) as pool:
+        for result in pool.imap_unordered(_compare_games, tasks):
+            yield result
+
+
+def main(argv):
+
+    dims = []
+    depth = 0
+    moves = ""
+    board_text = None
+    player = 1
+    engine_name = "bitboard"
+    show_divide = False
+    games = 0
+    reference = "shared"
+    alternative = "lines"
+    jobs = None
+    seed = 0
+    max_failures = 10
+
+    try:
+        opts, args = getopt.getopt(argv, "hd:n:m:s:p:e:g:r:a:j:",
+                                   ["dimension=", "depth=", "moves=", "board=", "player=", "engine=",
+                                    "divide", "games=", "reference=", "alternative=", "jobs=", "seed=",
+                                    "max-failures="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            dims.append(int(arg))
+        elif opt in ("-n", "--depth"):
+            depth = int(arg)
+        elif opt in ("-m", "--moves"):
+            moves = arg
+        elif opt in ("-s", "--board"):
+            board_text = arg
+        elif opt in ("-p", "--player"):
+            player = int(arg)
+        elif opt in ("-e", "--engine"):
+            engine_name = arg
+        elif opt == "--divide":
+            show_divide = True
+        elif opt in ("-g", "--games"):
+            games = int(arg)
+        elif opt in ("-r", "--reference"):
+            reference = arg
+        elif opt in ("-a", "--alternative"):
+            alternative = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt == "--seed":
+            seed = int(arg)
+        elif opt == "--max-failures":
+            max_failures = int(arg)
+
+    if board_text is not None:
+        board = board_from_string(board_text)
+        dims = dims or [len(board)]
+    if (not dims or min(dims) < 4 or (depth <= 0 and games <= 0) or player not in (1, 2)
+            or (depth > 0 and len(dims) > 1)):
+        print(USAGE)
+        sys.exit(2)
+
+    failed = False
+    if depth > 0:
+        engine = load_engine(engine_name)
+        start_position = board_text is None and not moves
+        if board_text is None:
+            game = OthelloGameManager(dims[0])
+            for i, j in parse_moves(moves):
+                game.play(i, j)
+            board, player = _board(game.board), game.current_player
+        start = time.perf_counter()
+        if show_divide:
+            counts = divide(engine, board, player, depth)
+            for (i, j), count in counts:
+                print("{} {}".format(move_to_str(i, j), count))
+            leaves = sum(count for _, count in counts) if counts else 1
+        else:
+            leaves = perft(engine, board, player, depth)
+        seconds = time.perf_counter() - start
+        print("perft {}: {} leaves in {:.3f}s ({} leaves/s)".format(
+            depth, leaves, seconds, int(leaves / seconds) if seconds > 0 else "-"))
+        known = PERFT.get(dims[0], [])
+        if start_position and depth <= len(known) and leaves != known[depth - 1]:
+            print("WRONG: expected {}".format(known[depth - 1]))
+            failed = True
+
+    if games > 0:
+        start = time.perf_counter()
+        totals = {"games": 0, "positions": 0, "moves": 0}
+        failures = []
+        for n, result in enumerate(compare_engines(reference, alternative, dims, games, jobs, seed)):
+            for name in totals:
+                totals[name] += result[name]
+            failures.extend(result["failures"])
+            if (n + 1) % 100 == 0:
+                print("{} games in {:.1f}s".format(totals["games"], time.perf_counter() - start),
+                      file=sys.stderr)
+        for failure in failures[:max_failures]:
+            print("{}x{} after moves '{}', player {} to move: {} differ".format(
+                failure["dimension"], failure["dimension"], failure["moves"], failure["player"],
+                failure["check"]))
+            print("  {}: {}".format(reference, failure["reference"]))
+            print("  {}: {}".format(alternative, failure["alternative"]))
+        seconds = time.perf_counter() - start
+        print("{} vs {}: {} games, {} positions, {} moves in {:.1f}s ({} games/s), {} failures".format(
+            reference, alternative, totals["games"], totals["positions"], totals["moves"], seconds,
+            int(totals["games"] / seconds) if seconds > 0 else "-", len(failures)))
+        failed = failed or bool(failures)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
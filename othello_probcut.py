@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-ProbCut: selective search in the middle game for agent.py.
+
+The value v of a search to depth d and the value v' of a search of the
+same position to a shallower depth d' lie close to a line, v = a * v' + b,
+with errors of standard deviation sigma. So at a node to be searched to
+depth d with the window (alpha, beta), a null-window search to depth d'
+that shows
+
+  v' >= (beta + t * sigma - b) / a
+
+makes v >= beta likely enough that the node fails high right away, and
+likewise for v <= alpha. The threshold t trades speed for errors: the
+larger it is, the less is pruned.
+
+As in Buro's Multi-ProbCut, a depth can have several checks, shallowest
+first, and the regressions are fitted separately for each phase of the
+game, since evaluations grow more reliable as the board fills up. Depths
+without a check are searched in full. CHECKS lists the depth pairs, two
+apart or more and of the same parity: searches to odd and even depths
+disagree more.
+
+The regressions are fitted offline from logged search pairs: positions
+from game records (or from self-play, see othello_patterns.py) are
+searched to every depth up to the limit, with the evaluation the agent
+will use, the values are logged as JSONL, and a, b and sigma of every
+check are fitted by least squares and written to a JSON file:
+
+  {"dimension": 8, "evaluation": "heuristic", "phases": 4, "threshold": 1.5,
+   "checks": [[phase, depth, shallow depth, a, b, sigma], ...]}
+
+Example: log searches to depth 8 of positions from 200 self-play games,
+then fit
+  $python3 othello_probcut.py -d 8 -e heuristic -g 200 -l 8 -j 8 -r pairs.jsonl -o probcut.json
+"""
+import getopt
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+from othello_bitboard import popcount, get_moves, to_board
+from othello_patterns import phase_of
+
+PHASES = 4
+# Cut threshold, in standard deviations of the regression error
+THRESHOLD = 1.5
+# For each depth, the shallow depths of its checks. Shallower nodes have
+# little to save, and the errors cost more than the time saved.
+CHECKS = {5: (1, 3), 6: (2, 4), 7: (3, 5), 8: (2, 4), 9: (3, 5), 10: (4, 6), 11: (5, 7),
+          12: (4, 6)}
+# Positions with fewer empty squares than this are left out of the log:
+# the endgame solver takes over long before
+MIN_EMPTIES = 14
+
+USAGE = ("othello_probcut.py -d <dimension> [-e <evaluation> -w <pattern weights>] "
+         "[-g <games> -p <random plies> -i <games.jsonl> ... -l <depth-limit> -s <step> "
+         "-j <jobs> -r <pairs.jsonl>] [-f <pairs.jsonl> ... -t <threshold> -o <probcut.json>]")
+
+
+class ProbCut(object):
+    """
+    The Multi-ProbCut checks for one board dimension and evaluation. Use
+    ProbCut.load to read a parameter file written by fit.
+    """
+
+    def __init__(self, dim, evaluation, phases, checks, threshold = THRESHOLD):
+        self.dim = dim
+        self.evaluation = evaluation
+        self.phases = phases
+        self.threshold = threshold
+        self.fitted = list(checks) # (phase, depth, shallow, a, b, sigma)
+        size = dim * dim
+        self.phase = [phase_of(discs, size, phases) for discs in range(size + 1)]
+        # (phase, depth) -> ((shallow, a, b, t * sigma), ...) shallowest first
+        table = {}
+        for phase, depth, shallow, a, b, sigma in sorted(self.fitted):
+            if a > 0:
+                table.setdefault((phase, depth), []).append((shallow, a, b, threshold * sigma))
+        self.table = dict((k, tuple(v)) for k, v in table.items())
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            params = json.load(f)
+        return cls(params["dimension"], params["evaluation"], params["phases"],
+                   [tuple(c) for c in params["checks"]], params.get("threshold", THRESHOLD))
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"dimension": self.dim, "evaluation": self.evaluation,
+                       "phases": self.phases, "threshold": self.threshold,
+                       "checks": [list(c) for c in self.fitted]}, f)
+
+    def checks(self, depth, discs):
+        """
+        The checks of a node searched to depth with discs on the board, as
+        (shallow depth, a, b, margin) tuples.
+        """
+        return self.table.get((self.phase[discs], depth), ())
+
+
+############ LOGGING ###############################
+_context = None
+
+def _init_worker(evaluation, weights):
+    global _context
+    import agent
+    import othello_eval
+    from othello_patterns import PatternEvaluator
+    _context = agent.SearchContext()
+    if evaluation == "heuristic":
+        _context.set_evaluator(othello_eval)
+    elif evaluation == "patterns":
+        _context.set_evaluator(PatternEvaluator.load(weights))
+
+
+def _search_values(task):
+    """
+    Search a position to every depth up to the limit, stopping short of
+    the end of the game. Returns a log record.
+    """
+    import agent
+    dark, light, player, dim, limit = task
+    board = to_board(dark, light, dim)
+    own, opp, key, geo = agent._root(board, player)
+    _context.begin(own, opp, key, geo, 1, 1)
+    order = agent._order(own, opp, get_moves(own, opp, geo), geo)
+    max_depth = min(limit, geo.size - popcount(own | opp) - 1)
+    values = [value for _, _, value in agent._iterate(_context, own, opp, player, key, order, max_depth)]
+    return {"dark": dark, "light": light, "player": player, "values": values}
+
+
+def sample_positions(filenames, dim, step, rng):
+    """
+    Every step-th position, from a random start, of the games in the given
+    records (as written by othello_tournament.py or othello_patterns.py),
+    as (dark, light, player) with at least MIN_EMPTIES empty squares.
+    """
+    from othello_bitboard import from_board
+    from othello_game import OthelloGameManager
+    from othello_shared import get_possible_moves
+    from othello_tournament import parse_moves
+    positions = []
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                record = json.loads(line)
+                game = OthelloGameManager(dim)
+                skip = rng.randrange(step)
+                for n, (i, j) in enumerate(parse_moves(record["opening"]) + parse_moves(" ".join(record["moves"]))):
+                    empties = sum(row.count(0) for row in game.board)
+                    if (n % step == skip and empties >= MIN_EMPTIES
+                            and get_possible_moves(game.board, game.current_player)):
+                        dark, light = from_board(game.board)
+                        positions.append((dark, light, game.current_player))
+                    game.play(i, j)
+    return positions
+
+
+def log_values(positions, dim, limit, evaluation, weights = None, jobs = None):
+    """
+    Search the positions on a pool of worker processes. Yields the log
+    records as they finish.
+    """
+    tasks = [(dark, light, player, dim, limit) for dark, light, player in positions]
+    with multiprocessing.Pool(jobs, _init_worker, (evaluation, weights)) as pool:
+        for record in pool.imap_unordered(_search_values, tasks):
+            yield record
+
+
+############ FITTING ###############################
+def read_log(filenames):
+    records = []
+    for filename in filenames:
+        with open(filename) as f:
+            for line in f:
+                records.append(json.loads(line))
+    return records
+
+
+def fit(records, dim, evaluation, phases = PHASES, threshold = THRESHOLD):
+    """
+    Fit the regressions of CHECKS to logged searches. Returns a ProbCut.
+    """
+    size = dim * dim
+    # The heuristic scores finished games on a scale of their own; a search
+    # that finds one says nothing about how well evaluations predict
+    if evaluation == "heuristic":
+        import othello_eval
+        decided = othello_eval.FINAL_WEIGHT
+    else:
+        decided = math.inf
+    pairs = {}
+    for record in records:
+        phase = phase_of(popcount(record["dark"] | record["light"]), size, phases)
+        values = record["values"] # values[d - 1] is the value at depth d
+        for depth, shallows in CHECKS.items():
+            if depth <= len(values):
+                for shallow in shallows:
+                    x, y = values[shallow - 1], values[depth - 1]
+                    if abs(x) < decided and abs(y) < decided:
+                        pairs.setdefault((phase, depth, shallow), []).append((x, y))
+    checks = []
+    for (phase, depth, shallow), xy in sorted(pairs.items()):
+        n = len(xy)
+        if n < 10:
+            continue
+        mx = sum(x for x, _ in xy) / n
+        my = sum(y for _, y in xy) / n
+        sxx = sum((x - mx) ** 2 for x, _ in xy)
+        if sxx == 0:
+            continue
+        a = sum((x - mx) * (y - my) for x, y in xy) / sxx
+        b = my - a * mx
+        sigma = math.sqrt(sum((y - a * x - b) ** 2 for x, y in xy) / max(n - 2, 1))
+        checks.append((phase, depth, shallow, round(a, 4), round(b, 3), round(sigma, 3)))
+    return ProbCut(dim, evaluation, phases, checks, threshold)
+
+
+def main(argv):
+
+    size = 0
+    evaluation = "heuristic"
+    weights = None
+    games = 0
+    random_plies = 10
+    inputs = []
+    limit = 8
+    step = 5
+    jobs = None
+    log_file = None
+    logs = []
+    threshold = THRESHOLD
+    output = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hd:e:w:g:p:i:l:s:j:r:f:t:o:",
+                                   ["dimension=", "eval=", "weights=", "games=", "plies=", "input=",
+                                    "limit=", "step=", "jobs=", "record=", "fit=", "threshold=",
+                                    "output="])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-e", "--eval"):
+            evaluation = arg
+        elif opt in ("-w", "--weights"):
+            weights = arg
+        elif opt in ("-g", "--games"):
+            games = int(arg)
+        elif opt in ("-p", "--plies"):
+            random_plies = int(arg)
+        elif opt in ("-i", "--input"):
+            inputs.append(arg)
+        elif opt in ("-l", "--limit"):
+            limit = int(arg)
+        elif opt in ("-s", "--step"):
+            step = int(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-r", "--record"):
+            log_file = arg
+        elif opt in ("-f", "--fit"):
+            logs.append(arg)
+        elif opt in ("-t", "--threshold"):
+            threshold = float(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+
+    searching = games > 0 or inputs
+    if (size <= 0 or evaluation not in ("discs", "heuristic", "patterns")
+            or (evaluation == "patterns" and weights is None)
+            or (searching and log_file is None) or (not searching and output is None)):
+        print(USAGE)
+        sys.exit(2)
+
+    if searching:
+        start = time.time()
+        if games > 0:
+            from othello_patterns import play_games
+            games_file = log_file + ".games"
+            with open(games_file, "w") as f:
+                for record in play_games(size, games, 2, random_plies, jobs, weights):
+                    f.write(json.dumps(record) + "\n")
+            inputs.append(games_file)
+        positions = sample_positions(inputs, size, step, random.Random(0))
+        print("Searching {} positions".format(len(positions)), file=sys.stderr)
+        with open(log_file, "w") as f:
+            for n, record in enumerate(log_values(positions, size, limit, evaluation, weights, jobs)):
+                f.write(json.dumps(record) + "\n")
+                if (n + 1) % 50 == 0:
+                    print("{} positions in {:.1f}s".format(n + 1, time.time() - start), file=sys.stderr)
+        logs.append(log_file)
+
+    if output is not None:
+        probcut = fit(read_log(logs), size, evaluation, PHASES, threshold)
+        for phase, depth, shallow, a, b, sigma in probcut.fitted:
+            print("phase {} depth {} from {}: a={} b={} sigma={}".format(phase, depth, shallow, a, b, sigma),
+                  file=sys.stderr)
+        probcut.save(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
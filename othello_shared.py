@@ -6,6 +6,9 @@ building your AIs.
 Thanks to original author Daniel Bauer, Columbia University
 """
 
+from othello_bitboard import (geometry, from_board, to_board, get_moves,
+                              get_flips, iter_squares)
+
 def find_lines(board, i, j, player):
     """
     Find all the uninterupted lines of stones that would be captured if player
@@ -41,28 +44,29 @@ def get_possible_moves(board, player):
     Return a list of all possible (column,row) tuples that player can play on
     the current board. 
     """
-    result = []
-    for i in range(len(board)):
-        for j in range(len(board)):
-            if board[j][i] == 0:
-                lines = find_lines(board,i,j,player)
-                if lines: 
-                    result.append((i,j))
-    return result
+    geo = geometry(len(board))
+    dark, light = from_board(board)
+    if player == 1:
+        moves = get_moves(dark, light, geo)
+    else:
+        moves = get_moves(light, dark, geo)
+    coords = geo.coords
+    return [coords[sq] for sq in iter_squares(moves)]
 
 def play_move(board, player, i, j):
-    new_board = []
-    for row in board: 
-        new_board.append(list(row[:]))
-    lines = find_lines(board, i,j, player)
-    new_board[j][i] = player
-    for line in lines: 
-        for u,v in line: 
-           new_board[v][u] = player 
-    final = []
-    for row in new_board: 
-        final.append(tuple(row))
-    return tuple(final) 
+    dim = len(board)
+    geo = geometry(dim)
+    dark, light = from_board(board)
+    sq = geo.square(i, j)
+    if player == 1:
+        change = get_flips(dark, light, sq, geo) | (1 << sq)
+        dark |= change
+        light &= ~change
+    else:
+        change = get_flips(light, dark, sq, geo) | (1 << sq)
+        light |= change
+        dark &= ~change
+    return to_board(dark, light, dim)
 
 def get_score(board):
     p1_count = 0
@@ -74,3 +78,34 @@ def get_score(board):
             elif board[i][j] == 2:
                 p2_count += 1
     return p1_count, p2_count
+
+# Rows already decoded by board_from_string, keyed by their digit string
+_row_cache = {}
+
+def board_to_string(board):
+    """
+    Encode a board in the compact wire format: one digit (0, 1 or 2) per
+    square, row by row, with no separators.
+    """
+    return "".join(["".join(map(str, row)) for row in board])
+
+def board_from_string(text):
+    """
+    Decode a board sent by the game manager. Accepts the compact format of
+    board_to_string as well as the older str(board) format, which is parsed
+    by keeping only its digits (it is never passed to eval).
+    """
+    text = text.strip()
+    if not text.isdigit():
+        text = "".join(c for c in text if c.isdigit())
+    dim = int(round(len(text) ** 0.5))
+    if dim * dim != len(text):
+        raise ValueError("Not a square board: {!r}".format(text))
+    rows = []
+    for k in range(0, len(text), dim):
+        chunk = text[k:k + dim]
+        row = _row_cache.get(chunk)
+        if row is None:
+            row = _row_cache[chunk] = tuple(int(c) for c in chunk)
+        rows.append(row)
+    return tuple(rows)
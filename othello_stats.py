@@ -0,0 +1,123 @@
+"""
+Search statistics for agent.py, collected per move and written to stderr
+or, one JSON object per move, to a JSONL file.
+
+The search only counts while SearchContext.stats holds a SearchStats.
+With None, which is the default, each node pays for one attribute test.
+
+- nodes: positions the search visits, by ply from the root, including
+  the leaves scored in the loop of their parent; solver_nodes are those of
+  the endgame solver (othello_endgame.solve)
+- leaves: positions scored by the evaluator or by disc difference
+- probes, hits, tt_cutoffs, stores: transposition table lookups, lookups
+  that found the position, hits that settled the node without a search,
+  and entries written
+- cutoffs: beta cutoffs by the index of the move that caused them in the
+  move order. The better the ordering, the more of them the first move
+  causes (first_move_cutoff_rate).
+- probcuts: nodes that Multi-ProbCut cut without a full search
+- iterations: for each completed iteration of the search, its depth,
+  nodes, seconds, nodes per second and effective branching factor, the
+  ratio of its nodes to those of the iteration before
+
+agent.py adds the color, the number of empty squares and the move to each
+record, and ponder_hit: true if the move was that of the search pondering
+on the opponent's time, whose statistics the record then holds.
+"""
+import time
+
+
+class SearchStats(object):
+    """
+    The counters of one move. The search updates them directly.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Start counting for a new move.
+        """
+        self.start = time.perf_counter()
+        self.nodes = []
+        self.solver_nodes = 0
+        self.leaves = 0
+        self.probes = 0
+        self.hits = 0
+        self.tt_cutoffs = 0
+        self.stores = 0
+        self.cutoffs = []
+        self.probcuts = 0
+        self.iterations = []
+        self._mark = (self.start, 0) # time and nodes at the end of the last iteration
+
+    def node(self, ply):
+        nodes = self.nodes
+        while len(nodes) <= ply:
+            nodes.append(0)
+        nodes[ply] += 1
+
+    def cutoff(self, index):
+        cutoffs = self.cutoffs
+        while len(cutoffs) <= index:
+            cutoffs.append(0)
+        cutoffs[index] += 1
+
+    def total(self):
+        return sum(self.nodes) + self.solver_nodes
+
+    def iteration(self, depth):
+        """
+        Record the end of an iteration of the search to depth.
+        """
+        now = time.perf_counter()
+        total = self.total()
+        last_time, last_total = self._mark
+        nodes = total - last_total
+        seconds = now - last_time
+        ebf = None
+        if self.iterations and self.iterations[-1]["nodes"] > 0:
+            ebf = round(nodes / self.iterations[-1]["nodes"], 2)
+        self.iterations.append({"depth": depth, "nodes": nodes, "seconds": round(seconds, 4),
+                                "nps": int(nodes / seconds) if seconds > 0 else None, "ebf": ebf})
+        self._mark = (now, total)
+
+    def record(self):
+        """
+        The statistics of the move so far, as a dict ready for JSON.
+        """
+        seconds = time.perf_counter() - self.start
+        total = self.total()
+        cutoffs = sum(self.cutoffs)
+        return {"seconds": round(seconds, 4), "nodes": total,
+                "nps": int(total / seconds) if seconds > 0 else None,
+                "nodes_by_ply": list(self.nodes), "solver_nodes": self.solver_nodes,
+                "leaves": self.leaves, "probes": self.probes, "hits": self.hits,
+                "tt_cutoffs": self.tt_cutoffs, "stores": self.stores,
+                "cutoffs": list(self.cutoffs),
+                "first_move_cutoff_rate": round(self.cutoffs[0] / cutoffs, 4) if cutoffs else None,
+                "probcuts": self.probcuts, "iterations": list(self.iterations)}
+
+
+def summary(record):
+    """
+    The lines of text stderr shows for a record of SearchStats.
+    """
+    hit_rate = record["hits"] / record["probes"] if record["probes"] else 0
+    result = ["{} nodes in {:.3f}s ({} nodes/s), {} leaves, {} solver nodes".format(
+                  record["nodes"], record["seconds"], record["nps"], record["leaves"],
+                  record["solver_nodes"]),
+              "  nodes by ply: {}".format(" ".join(str(n) for n in record["nodes_by_ply"])),
+              "  cache: {} probes, {} hits ({:.1%}), {} cutoffs, {} stores".format(
+                  record["probes"], record["hits"], hit_rate, record["tt_cutoffs"], record["stores"])]
+    if record["cutoffs"]:
+        result.append("  beta cutoffs by move: {} (first move {:.1%})".format(
+            " ".join(str(n) for n in record["cutoffs"]), record["first_move_cutoff_rate"]))
+    if record["probcuts"]:
+        result.append("  ProbCut cuts: {}".format(record["probcuts"]))
+    for it in record["iterations"]:
+        result.append("  depth {}: {} nodes in {:.3f}s ({} nodes/s){}".format(
+            it["depth"], it["nodes"], it["seconds"], it["nps"],
+            "" if it["ebf"] is None else ", branching factor {}".format(it["ebf"])))
+    return result
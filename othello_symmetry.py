@@ -0,0 +1,168 @@
+"""
+The eight symmetries of the Othello board (rotations and reflections) and
+symmetry-canonical positions.
+
+A position and its mirror images are worth the same, and the best move in
+one is the mirror image of the best move in the other. Tables keyed on
+positions can therefore store each position once, in its canonical form:
+the image, under all eight transforms, with the smallest (dark, light)
+masks. Moves found in the canonical form are mapped back to the actual
+board with the inverse transform.
+
+Transform t maps square (i, j) to:
+
+  0 (i, j)                  4 (j, i)
+  1 (dim-1-i, j)            5 (j, dim-1-i)
+  2 (i, dim-1-j)            6 (dim-1-j, i)
+  3 (dim-1-i, dim-1-j)      7 (dim-1-j, dim-1-i)
+"""
+from othello_bitboard import geometry
+
+
+class Symmetries(object):
+    """
+    The eight transforms for one board dimension. Use symmetries(dim) to
+    get the shared instance.
+
+    Masks are transformed with delta swaps: mirroring the columns, the rows
+    or the main diagonal exchanges pairs of squares a fixed number of bits
+    apart, many pairs at a time. That takes a number of operations linear
+    in the dimension (logarithmic if it is a power of two), however many
+    discs there are. The other transforms are compositions of these three.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        n = dim - 1
+        geo = geometry(dim)
+        # (mask, delta): swap the squares in mask with those delta bits higher
+        if dim & n == 0:
+            # A power of two: mirror halves, then quarters and so on, and
+            # transpose blocks the same way. log2(dim) swaps each.
+            self.column_swaps = []
+            self.row_swaps = []
+            self.diagonal_swaps = []
+            s = dim // 2
+            while s:
+                columns = rows = blocks = 0
+                for sq, (i, j) in enumerate(geo.coords):
+                    if (i // s) % 2 == 0:
+                        columns |= 1 << sq
+                        if (j // s) % 2 == 1:
+                            blocks |= 1 << sq # (i, j) swaps with (i + s, j - s)
+                    if (j // s) % 2 == 0:
+                        rows |= 1 << sq
+                self.column_swaps.append((columns, s * dim))
+                self.row_swaps.append((rows, s))
+                self.diagonal_swaps.append((blocks, s * n))
+                s //= 2
+        else:
+            # Swap the columns, rows and diagonals pairwise
+            column = (1 << dim) - 1
+            self.column_swaps = [(column << (c * dim), (n - 2 * c) * dim) for c in range(dim // 2)]
+            self.row_swaps = [(geo.first_row << r, n - 2 * r) for r in range(dim // 2)]
+            self.diagonal_swaps = []
+            for k in range(1, dim):
+                mask = 0
+                for i in range(dim - k):
+                    mask |= 1 << (i * dim + i + k) # (i, i + k) swaps with (i + k, i)
+                self.diagonal_swaps.append((mask, k * n))
+
+        maps = [lambda i, j: (i, j), lambda i, j: (n - i, j),
+                lambda i, j: (i, n - j), lambda i, j: (n - i, n - j),
+                lambda i, j: (j, i), lambda i, j: (j, n - i),
+                lambda i, j: (n - j, i), lambda i, j: (n - j, n - i)]
+        self.squares = []
+        for f in maps:
+            perm = []
+            for sq in range(dim * dim):
+                i, j = f(sq // dim, sq % dim)
+                perm.append(i * dim + j)
+            self.squares.append(perm)
+        # inverse[t] undoes transform t
+        self.inverse = [self.squares.index([perm.index(sq) for sq in range(dim * dim)])
+                        for perm in self.squares]
+
+    @staticmethod
+    def _swap(x, swaps):
+        for mask, delta in swaps:
+            t = (x ^ (x >> delta)) & mask
+            x ^= t ^ (t << delta)
+        return x
+
+    def transform(self, mask, t):
+        """
+        Return the image of a mask of squares under transform t.
+        """
+        if t & 1:
+            mask = self._swap(mask, self.column_swaps)
+        if t & 2:
+            mask = self._swap(mask, self.row_swaps)
+        if t & 4:
+            mask = self._swap(mask, self.diagonal_swaps)
+        return mask
+
+    def images(self, mask):
+        """
+        Return the images of a mask under all eight transforms, in order.
+        """
+        swap = self._swap
+        a = mask
+        b = swap(a, self.column_swaps)
+        c = swap(a, self.row_swaps)
+        d = swap(b, self.row_swaps)
+        diagonal = self.diagonal_swaps
+        return [a, b, c, d, swap(a, diagonal), swap(b, diagonal), swap(c, diagonal),
+                swap(d, diagonal)]
+
+    def canonical(self, dark, light, transforms = None):
+        """
+        Return (dark, light, t): the canonical form of the position and the
+        transform that produces it. If transforms is given, only those
+        transforms (and the identity) are considered.
+        """
+        if transforms is None:
+            images = self.images(dark)
+            transforms = range(1, 8)
+        else:
+            images = [dark] * 8
+            for t in transforms:
+                images[t] = self.transform(dark, t)
+        best = (dark, light, 0)
+        for t in transforms:
+            d = images[t]
+            if d > best[0]:
+                continue
+            l = self.transform(light, t)
+            if (d, l) < best[:2]:
+                best = (d, l, t)
+        return best
+
+    def invariant(self, dark, light):
+        """
+        Return the transforms other than the identity that map the position
+        onto itself.
+        """
+        return tuple(t for t, d in enumerate(self.images(dark))
+                     if t and d == dark and self.transform(light, t) == light)
+
+    def square(self, sq, t):
+        """
+        Return the image of square sq under transform t.
+        """
+        return self.squares[t][sq]
+
+    def restore(self, sq, t):
+        """
+        Map a square of the canonical form produced by t back to the board.
+        """
+        return self.squares[self.inverse[t]][sq]
+
+
+_symmetries = {}
+
+def symmetries(dim):
+    s = _symmetries.get(dim)
+    if s is None:
+        s = _symmetries[dim] = Symmetries(dim)
+    return s
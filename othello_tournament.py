@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless tournament runner: plays many games between two AIs in parallel,
+without the GUI, and reports per-game results and overall statistics.
+
+Games are played with OthelloGameManager and play_game, one game per worker
+process. Colors alternate from game to game, and if an opening file is given
+every opening is played once with each AI as dark. Each finished game is
+written right away to a JSONL or CSV file.
+
+Opening files hold one opening per line as a sequence of moves in the usual
+notation, column letter then row number (for example "f5 d6 c3" or
+"f5d6c3"). Blank lines and lines starting with # are ignored.
+
+With --async the games are driven from one process by asyncio instead of a
+pool of workers (see othello_async.py), and -j is the number of games played
+at the same time. With --reuse the AI processes are not killed after a game
+but kept for the next one (see AiProcessPool in othello_game.py).
+
+Example:
+  $python3 othello_tournament.py -d 8 -a agent.py -b randy_ai.py -n 100 -j 8 -l 3 -c -o -r results.jsonl
+"""
+import contextlib
+import csv
+import getopt
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from othello_game import (OthelloGameManager, AiPlayerInterface, AiProcessPool, InProcessPlayer,
+                          AiTimeoutError, play_game)
+from othello_shared import get_score
+
+USAGE = ("othello_tournament.py -d <dimension> -a <agentA> -b <agentB> [-n <games> -j <jobs> "
+         "-l <depth-limit> -t <seconds> -c -o -m --a-args <options> --b-args <options> "
+         "--openings <file> -r <results.jsonl|results.csv> --in-process --async --reuse --compact -v]")
+
+
+def move_to_str(i, j):
+    return "{}{}".format(chr(ord("a") + i), j + 1)
+
+
+def parse_moves(text):
+    """
+    Parse a move sequence such as "f5d6c3" into a list of (column, row) tuples.
+    """
+    return [(ord(c) - ord("a"), int(r) - 1) for c, r in re.findall(r"([a-z])(\d+)", text.lower())]
+
+
+def read_openings(filename):
+    openings = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                openings.append(line)
+    return openings
+
+
+def parse_options(text):
+    """
+    Parse per-agent options such as "limit=5,caching=1,time=2" into a dict.
+    """
+    options = {}
+    for item in text.split(","):
+        if item.strip():
+            name, value = item.split("=", 1)
+            options[name.strip()] = value.strip()
+    return options
+
+
+class RecordingPlayer(object):
+    """
+    Wraps a player and records every move it makes, and how long it took,
+    in a move list shared with its opponent.
+    """
+
+    def __init__(self, player, record):
+        self.player = player
+        self.name = player.name
+        self.color = player.color
+        self.record = record
+        self.timed_out = False
+
+    def get_move(self, manager):
+        start = time.perf_counter()
+        try:
+            i, j = self.player.get_move(manager)
+        except AiTimeoutError:
+            self.timed_out = True
+            raise
+        self.record.append((self.color, i, j, time.perf_counter() - start))
+        return i, j
+
+    def kill(self, manager):
+        self.player.kill(manager)
+
+
+def player_arguments(options):
+    """
+    Split per-agent options into the (limit, minimax, caching, ordering,
+    time limit) arguments of AiPlayerInterface and the remaining options.
+    """
+    options = dict(options)
+    limit = int(options.pop("limit", -1))
+    minimax = options.pop("minimax", "0") == "1"
+    caching = options.pop("caching", "0") == "1"
+    ordering = options.pop("ordering", "0") == "1"
+    time_limit = float(options.pop("time", 0)) or None
+    return (limit, minimax, caching, ordering, time_limit), options
+
+
+def _make_player(filename, color, options, in_process = False, compact = False):
+    arguments, options = player_arguments(options)
+    if in_process:
+        return InProcessPlayer(filename, color, *arguments, compact, **options)
+    return AiPlayerInterface(filename, color, *arguments, compact, _pool, **options)
+
+
+# The warm AI processes of a worker, with --reuse
+_pool = None
+
+def _init_worker(verbose, reuse):
+    global _pool
+    if not verbose:
+        # Silence the debugging output the AIs write to stderr
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 2)
+    if reuse:
+        # The processes exit when the worker does, as their stdin closes
+        _pool = AiProcessPool()
+
+
+def play_one(task):
+    """
+    Play a single game and return its result record. The task is a tuple
+    (game number, dimension, opening, a_is_dark, agent A, options A,
+    agent B, options B, in_process, compact).
+    """
+    (number, dimension, opening, a_is_dark, agent_a, options_a, agent_b, options_b,
+     in_process, compact) = task
+    game = OthelloGameManager(dimension)
+    for i, j in parse_moves(opening):
+        game.play(i, j)
+
+    if a_is_dark:
+        dark = (agent_a, options_a)
+        light = (agent_b, options_b)
+    else:
+        dark = (agent_b, options_b)
+        light = (agent_a, options_a)
+
+    record = []
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        p1 = RecordingPlayer(_make_player(dark[0], 1, dark[1], in_process, compact), record)
+        p2 = RecordingPlayer(_make_player(light[0], 2, light[1], in_process, compact), record)
+        play_game(game, p1, p2)
+    timeout = 1 if p1.timed_out else 2 if p2.timed_out else None
+    return game_result(number, opening, a_is_dark, dark[0], light[0], game.board, record, timeout,
+                       time.time() - start)
+
+
+def game_result(number, opening, a_is_dark, dark, light, board, record, timeout, seconds):
+    """
+    The result record of a finished game. record lists the moves as
+    (color, i, j, seconds) and timeout is the color that timed out, if any.
+    """
+    dark_score, light_score = get_score(board)
+
+    if timeout == 1:
+        winner = 2
+    elif timeout == 2:
+        winner = 1
+    elif dark_score != light_score:
+        winner = 1 if dark_score > light_score else 2
+    else:
+        winner = 0
+    if winner == 0:
+        result = "draw"
+    elif (winner == 1) == a_is_dark:
+        result = "win"
+    else:
+        result = "loss"
+
+    return {
+        "game": number,
+        "opening": opening,
+        "dark": dark,
+        "light": light,
+        "a_color": "dark" if a_is_dark else "light",
+        "dark_score": dark_score,
+        "light_score": light_score,
+        "result": result, # from the point of view of agent A
+        "timeout": "dark" if timeout == 1 else "light" if timeout == 2 else None,
+        "moves": [move_to_str(i, j) for color, i, j, latency in record],
+        "latencies": [round(latency, 4) for color, i, j, latency in record],
+        "seconds": round(seconds, 3),
+    }
+
+
+def elo_difference(score):
+    """
+    Elo difference corresponding to an expected score between 0 and 1.
+    """
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(results, z = 1.96):
+    """
+    Aggregate statistics for agent A over a list of result records: win,
+    loss and draw counts, score, Elo difference and a confidence interval
+    (95% by default) for both.
+    """
+    n = len(results)
+    wins = sum(1 for r in results if r["result"] == "win")
+    losses = sum(1 for r in results if r["result"] == "loss")
+    draws = n - wins - losses
+    summary = {"games": n, "wins": wins, "losses": losses, "draws": draws}
+    if n == 0:
+        return summary
+    score = (wins + 0.5 * draws) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2
+                + losses * score ** 2) / n
+    margin = z * math.sqrt(variance / n)
+    low = max(score - margin, 0)
+    high = min(score + margin, 1)
+    summary.update({
+        "score": score,
+        "score_interval": (low, high),
+        "elo": elo_difference(score),
+        "elo_interval": (elo_difference(low), elo_difference(high)),
+    })
+    return summary
+
+
+def print_summary(summary, name_a, name_b):
+    print("{} vs {}: {} games, +{} -{} ={}".format(name_a, name_b, summary["games"],
+                                                  summary["wins"], summary["losses"],
+                                                  summary["draws"]))
+    if summary["games"]:
+        print("Score {:.1%} ({:.1%} to {:.1%})".format(summary["score"], *summary["score_interval"]))
+        print("Elo difference {:+.1f} ({:+.1f} to {:+.1f})".format(summary["elo"], *summary["elo_interval"]))
+
+
+class ResultWriter(object):
+    """
+    Streams result records to a .jsonl or .csv file as they arrive.
+    """
+
+    CSV_FIELDS = ["game", "opening", "dark", "light", "a_color", "dark_score", "light_score",
+                  "result", "timeout", "moves", "latencies", "seconds"]
+
+    def __init__(self, filename):
+        self.file = open(filename, "w", newline="")
+        self.csv = None
+        if filename.endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, self.CSV_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, result):
+        if self.csv is not None:
+            row = dict(result)
+            row["moves"] = " ".join(result["moves"])
+            row["latencies"] = " ".join(str(x) for x in result["latencies"])
+            self.csv.writerow(row)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def make_tasks(games, dimension, openings, agent_a, options_a, agent_b, options_b,
+               in_process = False, compact = False):
+    """
+    One task per game. Colors alternate, and each opening is played once
+    with either AI as dark before moving on to the next. With in_process
+    the AIs run inside the worker processes (see InProcessPlayer); with
+    compact boards are sent to AI subprocesses in the compact wire format.
+    """
+    if not openings:
+        openings = [""]
+    tasks = []
+    for number in range(games):
+        opening = openings[(number // 2) % len(openings)]
+        tasks.append((number, dimension, opening, number % 2 == 0,
+                      agent_a, options_a, agent_b, options_b, in_process, compact))
+    return tasks
+
+
+def run_tournament(tasks, jobs = None, writer = None, verbose = False, reuse = False):
+    """
+    Play the games in parallel and return their result records, in the order
+    they finished. With reuse, every worker keeps its AI processes running
+    from one game to the next (see AiProcessPool in othello_game.py).
+    """
+    results = []
+    with multiprocessing.Pool(jobs, _init_worker, (verbose, reuse)) as pool:
+        for result in pool.imap_unordered(play_one, tasks):
+            results.append(result)
+            if writer is not None:
+                writer.write(result)
+            if verbose:
+                print_result(result)
+    return results
+
+
+def print_result(result):
+    print("Game {}: {} {}:{} {} ({})".format(result["game"], result["dark"],
+                                             result["dark_score"], result["light_score"],
+                                             result["light"], result["result"]))
+
+
+def main(argv):
+
+    size = 0
+    games = 2
+    jobs = None
+    common = {}
+    options_a = {}
+    options_b = {}
+    agent_a = None
+    agent_b = None
+    openings = []
+    output = None
+    verbose = False
+    in_process = False
+    use_async = False
+    reuse = False
+    compact = False
+
+    try:
+        opts, args = getopt.getopt(argv, "hcmovl:d:a:b:t:n:j:r:",
+                                   ["limit=", "dimension=", "agentA=", "agentB=", "time=", "games=",
+                                    "jobs=", "results=", "a-args=", "b-args=", "openings=",
+                                    "in-process", "async", "reuse", "compact"])
+    except getopt.GetoptError:
+        print(USAGE)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == '-h':
+            print(USAGE)
+            sys.exit()
+        elif opt in ("-d", "--dimension"):
+            size = int(arg)
+        elif opt in ("-a", "--agentA"):
+            agent_a = arg
+        elif opt in ("-b", "--agentB"):
+            agent_b = arg
+        elif opt == "-c":
+            common["caching"] = "1"
+        elif opt == "-m":
+            common["minimax"] = "1"
+        elif opt == "-o":
+            common["ordering"] = "1"
+        elif opt in ("-l", "--limit"):
+            common["limit"] = arg
+        elif opt in ("-t", "--time"):
+            common["time"] = arg
+        elif opt in ("-n", "--games"):
+            games = int(arg)
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-r", "--results"):
+            output = arg
+        elif opt == "--a-args":
+            options_a = parse_options(arg)
+        elif opt == "--b-args":
+            options_b = parse_options(arg)
+        elif opt == "--openings":
+            openings = read_openings(arg)
+        elif opt == "--in-process":
+            in_process = True
+        elif opt == "--async":
+            use_async = True
+        elif opt == "--reuse":
+            reuse = True
+        elif opt == "--compact":
+            compact = True
+        elif opt == "-v":
+            verbose = True
+
+    if size <= 0 or agent_a is None or agent_b is None or (in_process and (use_async or reuse)):
+        print(USAGE)
+        sys.exit(2)
+
+    # Per-agent options override the common ones
+    options_a = dict(common, **options_a)
+    options_b = dict(common, **options_b)
+
+    writer = ResultWriter(output) if output else None
+    tasks = make_tasks(games, size, openings, agent_a, options_a, agent_b, options_b,
+                       in_process, compact)
+    try:
+        if use_async:
+            import othello_async
+            results = othello_async.run_tournament(tasks, jobs or os.cpu_count() or 1, writer, verbose,
+                                                   reuse)
+        else:
+            results = run_tournament(tasks, jobs, writer, verbose, reuse)
+    finally:
+        if writer is not None:
+            writer.close()
+    print_summary(summarize(results), agent_a, agent_b)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,212 @@
+"""
+Zobrist hashing and a bounded transposition table for the search in agent.py.
+
+Positions are hashed with one random 64 bit key per square and colour, plus
+a key for the player to move. The hash of a child position is derived from
+its parent's hash by toggling the keys of the placed and flipped discs, so it
+never has to be recomputed from scratch during the search.
+"""
+import ctypes
+import random
+
+from othello_bitboard import iter_squares
+
+# Bound types stored with each entry
+EXACT = 0
+LOWER = 1 # the true value is >= the stored value (the search failed high)
+UPPER = 2 # the true value is <= the stored value (the search failed low)
+
+# Rough memory cost of one table slot: the entry tuple, its 64 bit key and
+# the list pointer. Used to turn a megabyte budget into a number of buckets.
+ENTRY_BYTES = 160
+
+
+class Zobrist(object):
+    """
+    Zobrist keys for one board dimension. Use zobrist(dim) to get the shared
+    instance so that all hashes for a dimension are compatible.
+    """
+
+    def __init__(self, dim, seed = 0x07E110):
+        rng = random.Random(seed + dim)
+        size = dim * dim
+        self.dim = dim
+        self.dark = [rng.getrandbits(64) for _ in range(size)]
+        self.light = [rng.getrandbits(64) for _ in range(size)]
+        # A flipped disc changes colour, which toggles both of its keys
+        self.flip = [d ^ l for d, l in zip(self.dark, self.light)]
+        self.place = [None, self.dark, self.light]
+        self.side = rng.getrandbits(64) # present when light is to move
+
+    def hash(self, dark, light, player):
+        """
+        Compute the hash of a position from scratch.
+        """
+        key = 0
+        for sq in iter_squares(dark):
+            key ^= self.dark[sq]
+        for sq in iter_squares(light):
+            key ^= self.light[sq]
+        if player == 2:
+            key ^= self.side
+        return key
+
+    def update(self, key, player, sq, flips):
+        """
+        Return the hash of the position reached when player plays on sq,
+        capturing the discs in the flips mask.
+        """
+        key ^= self.side ^ self.place[player][sq]
+        flip = self.flip
+        while flips:
+            low = flips & -flips
+            key ^= flip[low.bit_length() - 1]
+            flips ^= low
+        return key
+
+
+_zobrists = {}
+
+def zobrist(dim):
+    z = _zobrists.get(dim)
+    if z is None:
+        z = _zobrists[dim] = Zobrist(dim)
+    return z
+
+
+class TranspositionTable(object):
+    """
+    A fixed size hash table of search results.
+
+    Every bucket has two slots. The first keeps the deepest result seen for
+    the bucket, the second is overwritten by every store that does not go
+    into the first. Entries are tuples (key, depth, bound, value, move,
+    discs), where discs is the number of discs in the stored position. Since
+    every move adds a disc, positions with fewer discs than the root of the
+    current search are unreachable, and their entries may always be replaced.
+    """
+
+    def __init__(self, megabytes = 64):
+        buckets = 1
+        while buckets * 2 * ENTRY_BYTES * 2 <= megabytes * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.table = [None] * (buckets * 2)
+        self.root_discs = 0
+
+    def __len__(self):
+        return len(self.table) - self.table.count(None)
+
+    def clear(self):
+        self.table = [None] * len(self.table)
+        self.root_discs = 0
+
+    def new_search(self, discs):
+        """
+        Start a search from a root with the given number of discs. Entries
+        for positions with fewer discs give way to new results.
+        """
+        self.root_discs = discs
+
+    def probe(self, key):
+        """
+        Return the entry stored for key, or None.
+        """
+        i = (key & self.mask) << 1
+        table = self.table
+        entry = table[i]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = table[i + 1]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, value, move, discs):
+        i = (key & self.mask) << 1
+        table = self.table
+        entry = (key, depth, bound, value, move, discs)
+        old = table[i]
+        if old is None or old[0] == key or depth >= old[1] or old[5] < self.root_discs:
+            if old is not None and old[0] != key:
+                table[i + 1] = old
+            table[i] = entry
+        else:
+            table[i + 1] = entry
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    A transposition table kept in shared memory, so that the worker
+    processes of a parallel search see each other's results.
+
+    Each slot is two 64 bit words: the entry packed into one integer, and
+    the key XORed with it. Processes write without locking; a slot torn by
+    two concurrent writes no longer matches its key and is simply missed.
+    Stored values must be integers.
+    """
+
+    KEY_MASK = (1 << 63) - 1
+    NO_MOVE = 0xFF
+
+    def __init__(self, array):
+        self.array = array
+        self.mask = len(array) // 4 - 1
+        self.root_discs = 0
+
+    @staticmethod
+    def allocate(megabytes = 64):
+        """
+        Create the shared array for a table of the given size. Pass it to
+        the worker processes and wrap it with SharedTranspositionTable there.
+        """
+        import multiprocessing
+        buckets = 1
+        while buckets * 2 * 32 <= megabytes * 1024 * 1024:
+            buckets *= 2
+        return multiprocessing.RawArray("q", buckets * 4)
+
+    def __len__(self):
+        return sum(1 for i in range(1, len(self.array), 2) if self.array[i])
+
+    def clear(self):
+        ctypes.memset(self.array, 0, ctypes.sizeof(self.array))
+        self.root_discs = 0
+
+    def _unpack(self, key, data):
+        move = (data >> 10) & 0xFF
+        return (key, data & 0xFF, (data >> 8) & 0x3,
+                ((data >> 26) & 0xFFFFFFFF) - (1 << 31),
+                None if move == self.NO_MOVE else move, (data >> 18) & 0xFF)
+
+    def probe(self, key):
+        k = key & self.KEY_MASK
+        i = (k & self.mask) << 2
+        array = self.array
+        data = array[i + 1]
+        if data and array[i] ^ data == k:
+            return self._unpack(key, data)
+        data = array[i + 3]
+        if data and array[i + 2] ^ data == k:
+            return self._unpack(key, data)
+        return None
+
+    def store(self, key, depth, bound, value, move, discs):
+        k = key & self.KEY_MASK
+        i = (k & self.mask) << 2
+        array = self.array
+        data = (min(depth, 0xFF) | (bound << 8)
+                | ((self.NO_MOVE if move is None else move) << 10)
+                | (min(discs, 0xFF) << 18) | ((int(value) + (1 << 31)) << 26))
+        old = array[i + 1]
+        old_key = array[i] ^ old
+        if (not old or old_key == k or depth >= (old & 0xFF)
+                or ((old >> 18) & 0xFF) < self.root_discs):
+            if old and old_key != k:
+                array[i + 2] = array[i]
+                array[i + 3] = old
+            array[i] = k ^ data
+            array[i + 1] = data
+        else:
+            array[i + 2] = k ^ data
+            array[i + 3] = data
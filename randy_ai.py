@@ -13,7 +13,7 @@ import sys
 import time
 
 # You can also use the functions in othello_shared to write your AI 
-from othello_shared import find_lines, get_possible_moves
+from othello_shared import find_lines, get_possible_moves, board_from_string
 
 def select_move(board, color):
     """
@@ -37,6 +37,8 @@ def run_ai():
     It first introduces itself and receives its color. 
     Then it repeatedly receives the current score and current board state
     until the game is over. 
+    A game manager that keeps its AIs between games sends NEWGAME after
+    FINAL; Randy then introduces itself again and plays the next game.
     """
     print("Randy") # First line is the name of this AI  
 
@@ -53,7 +55,14 @@ def run_ai():
         # Read in the current game status, for example:
         # "SCORE 2 2" or "FINAL 33 31" if the game is over.
         # The first number is the score for player 1 (dark), the second for player 2 (light)
-        next_input = input() 
+        try: 
+            next_input = input() 
+        except EOFError: # the game manager is done with Randy
+            return
+        if next_input.strip() == "NEWGAME": 
+            print("Randy")
+            color = int(input().split(",")[0])
+            continue
         status, dark_score_s, light_score_s = next_input.strip().split()
         dark_score = int(dark_score_s)
         light_score = int(light_score_s)
@@ -61,9 +70,10 @@ def run_ai():
         if status == "FINAL": # Game is over. 
             print 
         else: 
-            board = eval(input()) # Read in the input and turn it into a Python
-                                  # object. The format is a list of rows. The 
-                                  # squares in each row are represented by 
+            board = board_from_string(input()) # The board is a list of rows, sent
+                                  # either as str(board) or in the compact
+                                  # format of othello_shared.board_to_string.
+                                  # The squares in each row are represented by 
                                   # 0 : empty square
                                   # 1 : dark disk (player 1)
                                   # 2 : light disk (player 2)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of agent.py. Run with:
+  $python3 -m unittest test_agent
+"""
+import time
+import unittest
+
+import agent
+from othello_bitboard import to_board
+from othello_game import OthelloGameManager
+
+
+class PonderTest(unittest.TestCase):
+
+    def test_ponder_hit_keeps_move_without_time(self):
+        # A ponder hit whose search has no time left to complete a single
+        # iteration plays the move pondering found, not the first legal move
+        engine = agent.Engine(1, -1, 0, 1, 1, {"time": "0.3", "pvs": "1", "book": "none"})
+        try:
+            engine.select_move(OthelloGameManager(8).board)
+            ctx = engine.context
+            self.assertIsNotNone(ctx.expected_position)
+            own, opp = ctx.expected_position
+            # Ponder on the predicted position until it is a few plies deep
+            engine.ponder = 1
+            engine._start_pondering()
+            end = time.time() + 20
+            while engine.pondered[1] < 3 and time.time() < end:
+                time.sleep(0.05)
+            engine._stop_pondering()
+            key, depth, best = engine.pondered
+            self.assertGreaterEqual(depth, 3)
+
+            # The table's move for the position may be another one, for
+            # example one stored by an earlier, shallower search
+            other = next(sq for sq in agent.iter_squares(agent.get_moves(own, opp, ctx.geo)) if sq != best)
+            ctx.tt.store(key, depth, agent.EXACT, 0, other, agent.popcount(own | opp))
+
+            engine.ponder = 0
+            engine.time_limit = 1e-9
+            move = engine.select_move(to_board(own, opp, 8))
+            self.assertEqual(move, agent._move(best, ctx.geo))
+        finally:
+            engine.close()
+
+
+if __name__ == "__main__":
+    unittest.main()